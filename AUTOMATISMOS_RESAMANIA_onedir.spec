@@ -0,0 +1,61 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Perfil onedir de arranque rapido: el ejecutable no descomprime nada en un
+# temporal en cada inicio (como hace --onefile) y arranca por arranque.py,
+# que muestra la ventana de carga antes de importar pandas/numpy/PIL.
+# Construir con build_onedir.bat; se distribuye la carpeta
+# dist\AUTOMATISMOS_RESAMANIA completa.
+import os
+
+RAIZ = SPECPATH
+
+
+a = Analysis(
+    [os.path.join(RAIZ, 'arranque.py')],
+    pathex=[RAIZ],
+    binaries=[],
+    datas=[
+        (os.path.join(RAIZ, 'logodeveloper.png'), '.'),
+        (os.path.join(RAIZ, 'LogoFpark.png'), '.'),
+        (os.path.join(RAIZ, 'feliz_cumpleanos.png'), '.'),
+        (os.path.join(RAIZ, 'PAGADEUDA.png'), '.'),
+        (os.path.join(RAIZ, 'PAGOHECHO.png'), '.'),
+        (os.path.join(RAIZ, 'config.json'), '.'),
+    ],
+    hiddenimports=['main', 'win32com', 'win32com.client', 'pythoncom', 'pywintypes', 'psycopg', 'psycopg_binary', 'psycopg.types.json'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='AUTOMATISMOS_RESAMANIA',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    # Sin UPX: descomprimir las DLL en cada arranque es justo lo que se quiere evitar.
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+    icon=[os.path.join(RAIZ, 'favicon.ico')],
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='AUTOMATISMOS_RESAMANIA',
+)
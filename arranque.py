@@ -0,0 +1,103 @@
+"""
+Lanzador de arranque rapido (punto de entrada del ejecutable).
+
+Muestra al instante una ventana de carga que solo necesita tkinter e
+importa main (pandas, numpy, PIL, logic/*) en un hilo. Cuando termina,
+cierra la ventana y abre la aplicacion. psycopg y win32com ya se importan
+bajo demanda, al conectar con PostgreSQL o abrir Outlook.
+"""
+import time
+
+_INICIO = time.perf_counter()
+
+import os
+import sys
+import threading
+import tkinter as tk
+import traceback
+from datetime import datetime
+
+
+def _app_dir():
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def _recurso(nombre):
+    return os.path.join(getattr(sys, "_MEIPASS", _app_dir()), nombre)
+
+
+def _ventana_carga():
+    root = tk.Tk()
+    root.overrideredirect(True)
+    root.configure(bg="white", bd=1, relief="solid")
+    try:
+        logo = tk.PhotoImage(file=_recurso("logodeveloper.png"))
+        factor = max(1, logo.width() // 320, logo.height() // 200)
+        root.logo = logo.subsample(factor)
+        tk.Label(root, image=root.logo, bg="white").pack(padx=24, pady=(18, 6))
+    except tk.TclError:
+        pass
+    tk.Label(root, text="AUTOMATISMOS RESAMANIA", font=("Arial", 12, "bold"), bg="white").pack(padx=24)
+    root.estado = tk.Label(root, text="Cargando", font=("Arial", 9), fg="#666666", bg="white", width=16, anchor="w")
+    root.estado.pack(padx=24, pady=(4, 16))
+    root.update_idletasks()
+    w, h = root.winfo_reqwidth(), root.winfo_reqheight()
+    x = (root.winfo_screenwidth() - w) // 2
+    y = (root.winfo_screenheight() - h) // 2
+    root.geometry(f"{w}x{h}+{x}+{y}")
+    return root
+
+
+def _log_error_fatal(traza):
+    try:
+        with open(os.path.join(_app_dir(), "app.log"), "a", encoding="utf-8") as f:
+            f.write("\n=== FATAL ERROR ===\n")
+            f.write(datetime.now().isoformat())
+            f.write("\n")
+            f.write(traza)
+            f.write("\n")
+    except Exception:
+        pass
+
+
+def lanzar():
+    ventana = _ventana_carga()
+    ventana.update()
+    t_ventana = time.perf_counter() - _INICIO
+    estado = {}
+
+    def importar():
+        try:
+            import main
+
+            estado["main"] = main
+        except BaseException:
+            estado["traza"] = traceback.format_exc()
+
+    hilo = threading.Thread(target=importar, name="arranque-imports", daemon=True)
+    hilo.start()
+    puntos = [0]
+
+    def comprobar():
+        if hilo.is_alive():
+            puntos[0] = (puntos[0] + 1) % 4
+            ventana.estado.config(text="Cargando" + "." * puntos[0])
+            ventana.after(120, comprobar)
+        else:
+            ventana.quit()
+
+    ventana.after(50, comprobar)
+    ventana.mainloop()
+    ventana.destroy()
+
+    if "main" not in estado:
+        traza = estado.get("traza", "")
+        _log_error_fatal(traza)
+        raise SystemExit(traza)
+    estado["main"].ejecutar([("ventana_carga", t_ventana)], _INICIO)
+
+
+if __name__ == "__main__":
+    lanzar()
@@ -0,0 +1,26 @@
+@echo off
+echo ======================================
+echo  Compilando AUTOMATISMOS RESAMANIA (onedir, arranque rapido)
+echo ======================================
+
+REM Ir a la carpeta del proyecto
+cd /d "%~dp0"
+
+REM Crear venv si no existe y activarlo
+if not exist ".venv\Scripts\python.exe" (
+    echo Creando entorno virtual .venv...
+    py -3 -m venv .venv
+)
+call .venv\Scripts\activate.bat
+
+REM Asegurar dependencias basicas de build
+python -m pip install --upgrade pip >nul 2>&1
+pip install pyinstaller pandas pillow pywin32 "psycopg[binary]" >nul 2>&1
+
+REM Construir carpeta con el ejecutable (sin descompresion en cada arranque)
+pyinstaller --noconfirm "%~dp0AUTOMATISMOS_RESAMANIA_onedir.spec"
+
+echo.
+echo Listo. Copia la carpeta completa dist\AUTOMATISMOS_RESAMANIA
+echo (el ejecutable es dist\AUTOMATISMOS_RESAMANIA\AUTOMATISMOS_RESAMANIA.exe)
+pause
@@ -1,6 +1,9 @@
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
+from logic.clientes import norm_codigo
+
 def _find_column(df, keywords):
     """
     Busca la primera columna cuyo nombre (minúsculas, strip) contenga todos los keywords.
@@ -307,3 +310,51 @@ def procesar_morosos_accediendo(incidencias_df, accesos_df):
 
     return resultado.reset_index(drop=True)
 
+
+class IndiceAccesos:
+    """
+    Indice por cliente sobre ACCESOS: una permutacion que ordena el export por
+    cliente y fecha, y para cada cliente el rango contiguo [inicio, fin) que
+    ocupa en ella. Los accesos de un cliente salen con un corte O(k) sin
+    volver a recorrer (ni copiar) el DataFrame completo.
+    """
+
+    def __init__(self, accesos_df):
+        self.df = accesos_df
+        self.col_cliente = _find_column(accesos_df, ["número", "cliente"]) or _find_column(accesos_df, ["numero", "cliente"])
+        self.col_fecha = next(
+            (c for c in accesos_df.columns if "fecha" in c.lower() and "acceso" in c.lower() and "corta" not in c.lower()),
+            None,
+        ) or _find_column(accesos_df, ["fecha", "acceso"])
+        self.orden = np.arange(0)
+        self.rangos = {}
+        if self.col_cliente is None or accesos_df.empty:
+            return
+        col = accesos_df[self.col_cliente]
+        claves = col.map({v: norm_codigo(v) for v in pd.unique(col)}).fillna("")
+        ordenar = pd.DataFrame({"cliente": claves.to_numpy()})
+        columnas = ["cliente"]
+        if self.col_fecha:
+            ordenar["fecha"] = pd.to_datetime(accesos_df[self.col_fecha], errors="coerce", dayfirst=True).to_numpy()
+            columnas.append("fecha")
+        ordenar = ordenar.sort_values(columnas, kind="stable")
+        self.orden = ordenar.index.to_numpy()
+        ordenadas = ordenar["cliente"].to_numpy()
+        cortes = np.flatnonzero(ordenadas[1:] != ordenadas[:-1]) + 1
+        inicios = np.concatenate(([0], cortes))
+        fines = np.concatenate((cortes, [len(ordenadas)]))
+        self.rangos = {
+            ordenadas[a]: (int(a), int(b)) for a, b in zip(inicios, fines) if ordenadas[a]
+        }
+
+    def __contains__(self, codigo):
+        return norm_codigo(codigo) in self.rangos
+
+    def cuenta(self, codigo):
+        a, b = self.rangos.get(norm_codigo(codigo), (0, 0))
+        return b - a
+
+    def accesos(self, codigo):
+        """Accesos del cliente en orden cronologico (DataFrame, vacio si no tiene)."""
+        a, b = self.rangos.get(norm_codigo(codigo), (0, 0))
+        return self.df.iloc[self.orden[a:b]]
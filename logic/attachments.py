@@ -0,0 +1,206 @@
+import io
+import os
+import uuid
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+
+# Lado mayor de la imagen principal guardada y de la miniatura (pixeles).
+MAX_LADO = 1920
+MINIATURA_LADO = 256
+# La miniatura de un blob se guarda con el id del principal mas este sufijo.
+SUFIJO_MINIATURA = "_mini"
+# Marca en el LRU de un adjunto que no se encontro (no se vuelve a buscar en cada hover).
+_FALTA = object()
+
+
+def _abrir(origen):
+    """Imagen PIL desde ruta o bytes, girada segun EXIF y en RGB."""
+    if isinstance(origen, (bytes, bytearray)):
+        origen = io.BytesIO(origen)
+    with Image.open(origen) as src:
+        img = ImageOps.exif_transpose(src)
+        img.load()
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def codificar_jpeg(img, max_lado=None, calidad=80):
+    if max_lado and max(img.size) > max_lado:
+        img = img.copy()
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=calidad, optimize=True)
+    return buf.getvalue()
+
+
+def preparar_adjunto(origen, max_lado=MAX_LADO):
+    """(principal, miniatura) en JPEG: principal acotada a `max_lado` (None = sin limite)."""
+    img = _abrir(origen)
+    return codificar_jpeg(img, max_lado, 80), codificar_jpeg(img, MINIATURA_LADO, 70)
+
+
+class Adjuntos:
+    """
+    Adjuntos de imagen (reportes visuales): imagen principal acotada mas
+    miniatura, descarga perezosa del principal a una cache local y un LRU
+    de vistas previas ya decodificadas compartido por todos los visores.
+
+    `get_store()` devuelve el AppStateStore actual y `resolver_ruta(ref)` la
+    ruta local de un adjunto guardado como archivo. `resolver_indexado(ref)`
+    (opcional) resuelve solo con el indice en memoria, sin tocar disco: es
+    el que usan las miniaturas del hover. Los adjuntos no encontrados quedan
+    marcados en el LRU hasta que se guarda otro adjunto u olvidar_faltas().
+    """
+
+    def __init__(self, get_store, cache_dir, resolver_ruta, max_previews=48, resolver_indexado=None):
+        self.get_store = get_store
+        self.cache_dir = cache_dir
+        self.resolver_ruta = resolver_ruta
+        self.resolver_indexado = resolver_indexado or resolver_ruta
+        self.max_previews = max_previews
+        self._previews = OrderedDict()
+
+    @staticmethod
+    def es_blob(ref):
+        return isinstance(ref, str) and ref.startswith("blob:")
+
+    @staticmethod
+    def blob_id(ref):
+        return ref.split(":", 1)[1] if Adjuntos.es_blob(ref) else ""
+
+    def _store(self):
+        store = self.get_store()
+        return store if store and store.use_postgres else None
+
+    # -------------------------------------------------------------- guardar
+    def guardar_blob(self, ruta, max_lado=MAX_LADO, miniatura=True):
+        """Guarda la imagen en BD (principal + miniatura). Devuelve 'blob:<id>' o ''."""
+        store = self._store()
+        if not store:
+            return ""
+        if max_lado is None and not miniatura:
+            principal = codificar_jpeg(_abrir(ruta), None, 80)
+            mini = None
+        else:
+            principal, mini = preparar_adjunto(ruta, max_lado)
+        blob_id = store.put_blob(principal, content_type="image/jpeg")
+        if miniatura and mini:
+            store.put_blob(mini, content_type="image/jpeg", blob_id=blob_id + SUFIJO_MINIATURA)
+        self.olvidar_faltas()
+        return f"blob:{blob_id}"
+
+    def guardar_archivo(self, ruta, destino_dir, prefijo="reporte_"):
+        """Guarda en `destino_dir` la imagen principal acotada. Devuelve el nombre del archivo."""
+        os.makedirs(destino_dir, exist_ok=True)
+        principal, _mini = preparar_adjunto(ruta)
+        nombre = f"{prefijo}{uuid.uuid4().hex}.jpg"
+        with open(os.path.join(destino_dir, nombre), "wb") as f:
+            f.write(principal)
+        self.olvidar_faltas()
+        return nombre
+
+    def borrar_blob(self, ref):
+        store = self._store()
+        if not store or not self.es_blob(ref):
+            return
+        blob_id = self.blob_id(ref)
+        store.delete_blob(blob_id)
+        store.delete_blob(blob_id + SUFIJO_MINIATURA)
+        self._olvidar(ref)
+
+    # --------------------------------------------------------------- leer
+    def ruta_local(self, ref, solo_indice=False):
+        """
+        Ruta local de la imagen principal. Los blobs se descargan solo la
+        primera vez a la cache local. Devuelve '' si no se encuentra.
+        Con `solo_indice` los archivos se resuelven con resolver_indexado.
+        """
+        if not ref:
+            return ""
+        if not self.es_blob(ref):
+            resolver = self.resolver_indexado if solo_indice else self.resolver_ruta
+            return resolver(ref) or ""
+        blob_id = self.blob_id(ref)
+        destino = os.path.join(self.cache_dir, f"{blob_id}.jpg")
+        if os.path.exists(destino):
+            return destino
+        store = self._store()
+        if not store:
+            return ""
+        _ctype, data = store.get_blob(blob_id)
+        if not data:
+            return ""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = f"{destino}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, destino)
+        return destino
+
+    def miniatura(self, ref):
+        """
+        Miniatura PIL (LRU). En blobs antiguos sin miniatura se genera desde
+        el principal. Pensada para el hover: los archivos se buscan solo en
+        el indice y un fallo se recuerda (None sin volver a consultar).
+        """
+        key = (ref, "mini")
+        img = self._cache_get(key)
+        if img is not None:
+            return None if img is _FALTA else img
+        data = None
+        store = self._store()
+        if self.es_blob(ref) and store:
+            _ctype, data = store.get_blob(self.blob_id(ref) + SUFIJO_MINIATURA)
+        try:
+            if data:
+                img = _abrir(data)
+            else:
+                ruta = self.ruta_local(ref, solo_indice=True)
+                if not ruta:
+                    img = _FALTA
+                else:
+                    img = _abrir(ruta)
+                    img.thumbnail((MINIATURA_LADO, MINIATURA_LADO), Image.LANCZOS)
+        except Exception:
+            img = _FALTA
+        self._cache_put(key, img)
+        return None if img is _FALTA else img
+
+    def vista_previa(self, ref, max_ancho, max_alto):
+        """Imagen principal ajustada a (max_ancho, max_alto), decodificada una vez (LRU)."""
+        key = (ref, max_ancho, max_alto)
+        img = self._cache_get(key)
+        if img is not None:
+            return img
+        ruta = self.ruta_local(ref)
+        if not ruta:
+            return None
+        img = _abrir(ruta)
+        img.thumbnail((max_ancho, max_alto), Image.LANCZOS)
+        self._cache_put(key, img)
+        return img
+
+    # ------------------------------------------------------------- cache
+    def _cache_get(self, key):
+        img = self._previews.get(key)
+        if img is not None:
+            self._previews.move_to_end(key)
+        return img
+
+    def _cache_put(self, key, img):
+        self._previews[key] = img
+        self._previews.move_to_end(key)
+        while len(self._previews) > self.max_previews:
+            self._previews.popitem(last=False)
+
+    def _olvidar(self, ref):
+        for key in [k for k in self._previews if k[0] == ref]:
+            del self._previews[key]
+
+    def olvidar_faltas(self):
+        """Descarta los fallos recordados (p.ej. tras guardar o reindexar reportes)."""
+        for key in [k for k, img in self._previews.items() if img is _FALTA]:
+            del self._previews[key]
@@ -0,0 +1,276 @@
+import bisect
+import heapq
+import threading
+import unicodedata
+from collections import Counter
+
+
+CAMPOS = ("codigo", "nombre", "apellidos", "email", "movil")
+
+# Columnas de RESUMEN CLIENTE por campo, en orden de preferencia (nombres normalizados).
+COLUMNAS = {
+    "codigo": ("NUMERO DE CLIENTE", "NUMERO DE SOCIO", "NRO DE CLIENTE"),
+    "nombre": ("NOMBRE",),
+    "apellidos": ("APELLIDOS",),
+    "email": ("CORREO ELECTRONICO", "EMAIL", "CORREO"),
+    "movil": ("MOVIL", "TELEFONO MOVIL", "NUMERO DE TELEFONO", "TELEFONO"),
+}
+
+
+def _norm_texto(text):
+    t = unicodedata.normalize("NFD", str(text or "")).upper().strip()
+    return "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
+
+
+def _limpio(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor != valor:
+        return ""
+    texto = str(valor).strip()
+    return "" if texto.lower() == "nan" else texto
+
+
+def normalizar_movil(movil):
+    """Solo digitos, con el prefijo 34 aplicado una unica vez ('' si no hay numero)."""
+    if not movil:
+        return ""
+    mov = "".join(ch for ch in str(movil) if ch.isdigit())
+    # Quita prefijo 34 si viene duplicado y re-aplica una sola vez
+    if mov.startswith("34"):
+        mov = mov[2:]
+    mov = mov.lstrip("0")
+    if mov:
+        mov = "34" + mov
+    return mov
+
+
+def texto_busqueda(texto):
+    """Minusculas sin acentos y con cualquier separador (., @, -, ...) convertido en espacio."""
+    t = unicodedata.normalize("NFD", str(texto or "")).lower()
+    return "".join(
+        ch if ch.isalnum() else " " for ch in t if unicodedata.category(ch) != "Mn"
+    )
+
+
+def trigramas(texto):
+    """Trigramas de cada palabra con relleno ('  ju', ' jua', 'jua', ..., 'an ')."""
+    res = set()
+    for palabra in texto.split():
+        p = f"  {palabra} "
+        for i in range(len(p) - 2):
+            res.add(p[i:i + 3])
+    return res
+
+
+class IndiceTrigramas:
+    """
+    Indice invertido de trigramas para busqueda aproximada (erratas, acentos,
+    orden de palabras). Se construye una vez; buscar() solo recorre las
+    listas de los trigramas de la consulta.
+    """
+
+    # Fraccion minima de trigramas de la consulta que debe contener un candidato.
+    UMBRAL = 0.5
+
+    def __init__(self, docs):
+        """`docs`: iterable de (clave, texto ya pasado por texto_busqueda, movil normalizado)."""
+        self.claves = []
+        self.tamanos = []
+        self.moviles = []
+        self.postings = {}
+        for n, (clave, texto, movil) in enumerate(docs):
+            trig = trigramas(texto)
+            self.claves.append(clave)
+            self.tamanos.append(len(trig))
+            self.moviles.append(movil)
+            for t in trig:
+                self.postings.setdefault(t, []).append(n)
+
+    def buscar(self, consulta, limite=20):
+        """[(clave, puntuacion 0..1)] de mayor a menor parecido."""
+        qtrig = trigramas(consulta)
+        if not qtrig:
+            return []
+        cuenta = Counter()
+        for t in qtrig:
+            docs = self.postings.get(t)
+            if docs:
+                cuenta.update(docs)
+        total = len(qtrig)
+        minimo = max(1, int(total * self.UMBRAL))
+        mejores = heapq.nlargest(
+            limite,
+            ((comunes / total, -self.tamanos[n], n) for n, comunes in cuenta.items() if comunes >= minimo),
+        )
+        return [(self.claves[n], score) for score, _tam, n in mejores]
+
+    def buscar_movil(self, digitos, limite=20):
+        """Claves cuyo movil normalizado contiene los digitos (con o sin prefijo 34)."""
+        if len(digitos) < 6:
+            return []
+        normalizado = normalizar_movil(digitos)
+        res = []
+        for n, movil in enumerate(self.moviles):
+            if movil and (digitos in movil or normalizado in movil):
+                res.append(self.claves[n])
+                if len(res) >= limite:
+                    break
+        return res
+
+
+def norm_codigo(codigo):
+    """Numero de cliente normalizado para el indice ('00123 ' -> '00123', '123.0' -> '123')."""
+    texto = _limpio(codigo).upper()
+    if texto.endswith(".0") and texto[:-2].isdigit():
+        texto = texto[:-2]
+    return texto
+
+
+class DirectorioClientes:
+    """
+    Directorio de clientes compartido por todas las pestanas: indice hash por
+    numero de cliente sobre RESUMEN CLIENTE (se construye una vez por carga)
+    mas los clientes externos (clientes_ext), con busqueda por prefijo de
+    numero y busqueda aproximada por nombre, apellidos, email o movil
+    (IndiceTrigramas; no se consulta el DataFrame al buscar).
+
+    Los registros son dicts compactos con CAMPOS y `origen` ('resumen' o
+    'ext'); RESUMEN tiene prioridad sobre los externos.
+    """
+
+    def __init__(self):
+        self._resumen = {}
+        self._externos = {}
+        self._lista_ext = None
+        self.tiene_codigo = False
+        self._claves = []
+        self._idx_resumen = None
+        self._idx_ext = None
+        self._idx_lock = threading.Lock()
+
+    # --------------------------------------------------------------- carga
+    def cargar_resumen(self, df):
+        self._resumen = {}
+        self.tiene_codigo = False
+        if df is not None and not df.empty:
+            colmap = {_norm_texto(c): c for c in df.columns}
+            cols = {}
+            for campo, candidatas in COLUMNAS.items():
+                cols[campo] = next((colmap[c] for c in candidatas if c in colmap), None)
+            if cols["codigo"]:
+                self.tiene_codigo = True
+                columnas = {campo: df[col].tolist() for campo, col in cols.items() if col}
+                for n in range(len(df)):
+                    rec = {campo: _limpio(columnas[campo][n]) if campo in columnas else "" for campo in CAMPOS}
+                    clave = norm_codigo(rec["codigo"])
+                    if clave and clave not in self._resumen:
+                        rec["codigo"] = clave
+                        rec["origen"] = "resumen"
+                        self._resumen[clave] = rec
+        self._idx_resumen = None
+        self._reindexar()
+
+    def usar_externos(self, clientes_ext):
+        """Asocia la lista de clientes externos (se reindexa solo si cambio de objeto)."""
+        if clientes_ext is not self._lista_ext:
+            self._lista_ext = clientes_ext
+            self._externos = {}
+            for c in clientes_ext or ():
+                rec = {campo: _limpio(c.get(campo, "")) for campo in CAMPOS}
+                clave = norm_codigo(rec["codigo"])
+                if clave:
+                    rec["origen"] = "ext"
+                    self._externos[clave] = rec
+            self._idx_ext = None
+            self._reindexar()
+        return self
+
+    def _reindexar(self):
+        self._claves = sorted(set(self._resumen) | set(self._externos))
+
+    @staticmethod
+    def _docs(registros):
+        for clave, rec in registros.items():
+            texto = " ".join((rec["nombre"], rec["apellidos"], rec["email"]))
+            yield clave, texto_busqueda(texto), normalizar_movil(rec["movil"])
+
+    def preparar_busqueda(self):
+        """
+        Construye los indices de trigramas si faltan. Se puede llamar desde un
+        hilo tras cargar RESUMEN para que la primera busqueda no espere.
+        """
+        with self._idx_lock:
+            resumen, externos = self._resumen, self._externos
+            if self._idx_resumen is None:
+                idx = IndiceTrigramas(self._docs(resumen))
+                if resumen is self._resumen:
+                    self._idx_resumen = idx
+            if self._idx_ext is None:
+                idx = IndiceTrigramas(self._docs(externos))
+                if externos is self._externos:
+                    self._idx_ext = idx
+            return self._idx_resumen, self._idx_ext
+
+    # ------------------------------------------------------------ consultas
+    def get(self, codigo):
+        """Registro del cliente (copia) o None."""
+        clave = norm_codigo(codigo)
+        rec = self._resumen.get(clave) or self._externos.get(clave)
+        return dict(rec) if rec else None
+
+    def en_resumen(self, codigo):
+        return norm_codigo(codigo) in self._resumen
+
+    def por_prefijo(self, prefijo, limite=20):
+        prefijo = norm_codigo(prefijo)
+        if not prefijo:
+            return []
+        inicio = bisect.bisect_left(self._claves, prefijo)
+        res = []
+        for n in range(inicio, len(self._claves)):
+            clave = self._claves[n]
+            if not clave.startswith(prefijo) or len(res) >= limite:
+                break
+            res.append(self.get(clave))
+        return res
+
+    def buscar(self, texto, limite=20):
+        """
+        Clientes que encajan con `texto`, mejor primero: numero exacto, prefijo
+        de numero, movil (6+ digitos) y despues parecido por trigramas en
+        nombre, apellidos y email. Cada registro lleva `puntuacion`.
+        """
+        texto = str(texto or "").strip()
+        if not texto:
+            return []
+        idx_resumen, idx_ext = self.preparar_busqueda()
+        puntos = {}
+
+        def anotar(clave, score):
+            if score > puntos.get(clave, -1):
+                puntos[clave] = score
+
+        if self.get(texto):
+            anotar(norm_codigo(texto), 3.0)
+        for rec in self.por_prefijo(texto, limite):
+            anotar(norm_codigo(rec["codigo"]), 2.0)
+        digitos = "".join(ch for ch in texto if ch.isdigit())
+        consulta = texto_busqueda(texto)
+        for idx in (idx_resumen, idx_ext):
+            if digitos and len(digitos) == len(texto.replace(" ", "").lstrip("+")):
+                for clave in idx.buscar_movil(digitos, limite):
+                    anotar(clave, 1.5)
+            for clave, score in idx.buscar(consulta, limite):
+                anotar(clave, score)
+        mejores = heapq.nlargest(limite, puntos.items(), key=lambda kv: kv[1])
+        res = []
+        for clave, score in mejores:
+            rec = self.get(clave)
+            if rec:
+                rec["puntuacion"] = round(score, 3)
+                res.append(rec)
+        return res
+
+    def __len__(self):
+        return len(self._claves)
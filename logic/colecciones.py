@@ -0,0 +1,127 @@
+from datetime import datetime
+
+
+def norm_clave(valor):
+    """Forma normalizada de codigos y estados para los indices."""
+    return str(valor if valor is not None else "").strip().upper()
+
+
+class Coleccion:
+    """
+    Indices en memoria sobre una lista de registros de gestion (bajas,
+    suspensiones, prestamos...): por cliente (`codigo`), por `estado`, por
+    agrupaciones a medida y fechas ya parseadas, con el orden por fecha
+    calculado una sola vez.
+
+    La lista sigue siendo la fuente de verdad (es lo que se guarda). Los
+    indices se reconstruyen de forma perezosa tras invalidar(), que se llama
+    al guardar la coleccion, o si la lista cambia de objeto o de longitud.
+    """
+
+    def __init__(self, parse_fecha, campo_fecha, estado_defecto="PENDIENTE"):
+        self.parse_fecha = parse_fecha
+        self.campo_fecha = campo_fecha
+        self.estado_defecto = estado_defecto
+        self._lista = None
+        self._len = -1
+        self._fechas = {}
+        self._reset()
+
+    def _reset(self):
+        self._pos = {}
+        self._por_codigo = {}
+        self._por_estado = {}
+        self._grupos = {}
+        self._rangos = {}
+
+    def invalidar(self):
+        self._lista = None
+
+    def usar(self, lista):
+        """Asocia la lista actual y devuelve la coleccion (reindexa solo si cambio)."""
+        if lista is not self._lista or len(lista) != self._len:
+            self._reconstruir(lista)
+        return self
+
+    def _reconstruir(self, lista):
+        self._reset()
+        self._lista = lista
+        self._len = len(lista)
+        for n, item in enumerate(lista):
+            self._pos[id(item)] = n
+            self._por_codigo.setdefault(norm_clave(item.get("codigo")), []).append(item)
+            self._por_estado.setdefault(self.estado(item), []).append(item)
+
+    # ------------------------------------------------------------- campos
+    def estado(self, item):
+        return norm_clave(item.get("estado", self.estado_defecto))
+
+    def fecha(self, item, campo=None):
+        """Fecha parseada de `campo` (por defecto la fecha de orden); cada texto se parsea una vez."""
+        raw = item.get(campo or self.campo_fecha)
+        key = str(raw or "")
+        if key not in self._fechas:
+            self._fechas[key] = self.parse_fecha(raw)
+        return self._fechas[key]
+
+    # ------------------------------------------------------------ consultas
+    def por_codigo(self, codigo):
+        return list(self._por_codigo.get(norm_clave(codigo), ()))
+
+    def por_estado(self, estado):
+        return list(self._por_estado.get(norm_clave(estado), ()))
+
+    def conteo_estados(self):
+        return {estado: len(items) for estado, items in self._por_estado.items()}
+
+    def agrupar(self, nombre, clave):
+        """Indice secundario {clave(item): [items]} calculado una vez por version de la lista."""
+        grupos = self._grupos.get(nombre)
+        if grupos is None:
+            grupos = self._grupos[nombre] = {}
+            for item in self._lista or ():
+                grupos.setdefault(clave(item), []).append(item)
+        return grupos
+
+    def ordenados(self, reverse=True):
+        """Registros por fecha de orden (los mas recientes primero por defecto)."""
+        rangos = self._rango(reverse)
+        return sorted(self._lista or (), key=lambda i: rangos[id(i)])
+
+    def _rango(self, reverse):
+        rangos = self._rangos.get(reverse)
+        if rangos is None:
+            orden = sorted(
+                self._lista or (),
+                key=lambda i: self.fecha(i) or datetime.min,
+                reverse=reverse,
+            )
+            rangos = self._rangos[reverse] = {id(item): n for n, item in enumerate(orden)}
+        return rangos
+
+    def filtrar(self, codigo=None, estados=None, base=None, key=None, reverse=True):
+        """
+        Registros de un cliente y/o de unos estados, resueltos por indice y
+        devueltos en el mismo orden que ordenar toda la lista y filtrar
+        despues. Sin `key` se ordena por la fecha de orden; `base` parte de
+        un subconjunto ya calculado (p.ej. un grupo de agrupar()).
+        """
+        if base is not None:
+            items = list(base)
+        elif codigo:
+            items = self.por_codigo(codigo)
+        elif estados is not None:
+            items = [item for estado in estados for item in self._por_estado.get(estado, ())]
+            if len(estados) > 1:
+                items.sort(key=lambda i: self._pos[id(i)])
+        else:
+            items = list(self._lista or ())
+        if codigo and base is not None:
+            items = [i for i in items if norm_clave(i.get("codigo")) == norm_clave(codigo)]
+        if estados is not None and (codigo or base is not None):
+            items = [i for i in items if self.estado(i) in estados]
+        if key is not None:
+            items.sort(key=lambda i: self._pos[id(i)])
+            return sorted(items, key=key, reverse=reverse)
+        rangos = self._rango(reverse)
+        return sorted(items, key=lambda i: rangos[id(i)])
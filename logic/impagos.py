@@ -1,12 +1,12 @@
 import os
-import sqlite3
 from datetime import datetime
 import unicodedata
 
-try:
-    import psycopg
-except Exception:
-    psycopg = None
+import pandas as pd
+
+from logic.impagos_analytics import ImpagosAnalytics
+from logic.migrations import Migration, apply_migrations, sqlite_add_column
+from logic.storage import Storage
 
 
 def _norm(text: str) -> str:
@@ -22,10 +22,52 @@ def _find_col(df, keywords):
     return None
 
 
-def normalize_impagos_df(df, resumen_map=None):
+IMPAGOS_COLUMNS = ["numero_cliente", "nombre", "apellidos", "email", "movil"]
+
+
+def _text_series(df, col):
+    if not col:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[col].fillna("").astype(str).str.strip()
+
+
+def resumen_lookup_df(resumen_df, numeros=None):
+    """
+    Extrae de RESUMEN CLIENTE un DataFrame compacto (una fila por cliente)
+    con las columnas de IMPAGOS_COLUMNS, para completar datos en el join.
+    Si se pasa `numeros`, solo se procesan esos clientes.
     """
-    Devuelve una lista de dicts con columnas normalizadas:
+    if resumen_df is None or resumen_df.empty:
+        return None
+    cols = {_norm(c): c for c in resumen_df.columns}
+    col_codigo = cols.get("NUMERO DE CLIENTE") or cols.get("NUMERO DE SOCIO")
+    if not col_codigo:
+        return None
+    col_email = cols.get("CORREO ELECTRONICO") or cols.get("EMAIL") or cols.get("CORREO")
+    col_movil = cols.get("MOVIL") or cols.get("TELEFONO") or cols.get("TELEFONO MOVIL")
+    codigos = _text_series(resumen_df, col_codigo)
+    if numeros is not None:
+        mask = codigos.isin(numeros)
+        resumen_df = resumen_df[mask]
+        codigos = codigos[mask]
+    ref = pd.DataFrame(
+        {
+            "numero_cliente": codigos,
+            "nombre": _text_series(resumen_df, cols.get("NOMBRE")),
+            "apellidos": _text_series(resumen_df, cols.get("APELLIDOS")),
+            "email": _text_series(resumen_df, col_email),
+            "movil": _text_series(resumen_df, col_movil),
+        }
+    )
+    ref = ref[ref["numero_cliente"] != ""]
+    return ref.drop_duplicates("numero_cliente", keep="last")
+
+
+def normalize_impagos_df(df, resumen_df=None):
+    """
+    Devuelve un DataFrame con columnas normalizadas:
     numero_cliente, nombre, apellidos, email, movil, incidentes
+    Los campos vacios se completan con RESUMEN CLIENTE (left join por numero).
     """
     col_num = _find_col(df, ["NUMERO", "CLIENTE"])
     col_nombre = _find_col(df, ["NOMBRE"])  # puede coincidir con "Nombre de ventas", se filtra luego
@@ -41,72 +83,98 @@ def normalize_impagos_df(df, resumen_map=None):
                 col_nombre = c
                 break
 
-    rows = []
-    for _, row in df.iterrows():
-        numero = str(row.get(col_num, "")).strip() if col_num else ""
-        if not numero:
-            continue
-        nombre = str(row.get(col_nombre, "")).strip() if col_nombre else ""
-        apellidos = str(row.get(col_apellidos, "")).strip() if col_apellidos else ""
-        email = str(row.get(col_email, "")).strip() if col_email else ""
-        movil = str(row.get(col_movil, "")).strip() if col_movil else ""
-        if resumen_map and numero in resumen_map:
-            ref = resumen_map[numero]
-            if not nombre:
-                nombre = ref.get("nombre", "")
-            if not apellidos:
-                apellidos = ref.get("apellidos", "")
-            if not email:
-                email = ref.get("email", "")
-            if not movil:
-                movil = ref.get("movil", "")
-        try:
-            incidentes = int(row.get(col_inc, 1)) if col_inc else 1
-        except Exception:
-            incidentes = 1
-        rows.append({
-            "numero_cliente": numero,
-            "nombre": nombre,
-            "apellidos": apellidos,
-            "email": email,
-            "movil": movil,
-            "incidentes": incidentes,
-        })
-    return rows
+    out = pd.DataFrame(
+        {
+            "numero_cliente": _text_series(df, col_num),
+            "nombre": _text_series(df, col_nombre),
+            "apellidos": _text_series(df, col_apellidos),
+            "email": _text_series(df, col_email),
+            "movil": _text_series(df, col_movil),
+        }
+    )
+    if col_inc:
+        out["incidentes"] = pd.to_numeric(df[col_inc], errors="coerce").fillna(1).astype(int)
+    else:
+        out["incidentes"] = 1
+    out = out[out["numero_cliente"] != ""].reset_index(drop=True)
+
+    ref = None
+    if not out.empty:
+        ref = resumen_lookup_df(resumen_df, numeros=out["numero_cliente"].unique())
+    if ref is not None:
+        merged = out.merge(ref, on="numero_cliente", how="left", suffixes=("", "_ref"))
+        for field in IMPAGOS_COLUMNS[1:]:
+            fallback = merged[f"{field}_ref"].fillna("")
+            out[field] = merged[field].where(merged[field] != "", fallback)
+    return out
+
+
+_INDICES = [
+    "CREATE INDEX IF NOT EXISTS ix_impagos_eventos_fecha ON impagos_eventos(fecha_export, cliente_id)",
+    "CREATE INDEX IF NOT EXISTS ix_impagos_eventos_cliente_dia ON impagos_eventos(cliente_id, export_dia)",
+    "CREATE INDEX IF NOT EXISTS ix_impagos_gestion_cliente ON impagos_gestion(cliente_id, accion, fecha)",
+    "CREATE INDEX IF NOT EXISTS ix_impagos_gestion_dia ON impagos_gestion(accion, fecha_dia)",
+]
+
+# Pasos de esquema en orden; cada BD guarda los aplicados en schema_migrations.
+MIGRACIONES = [
+    Migration(
+        1,
+        "columnas de dia generadas",
+        sqlite=[
+            # SQLite guarda las fechas como TEXT ISO; export_dia es el dia juliano
+            # entero y fecha_dia la parte fecha de la gestion, ambas indexables.
+            sqlite_add_column(
+                "impagos_eventos",
+                "export_dia",
+                "INTEGER GENERATED ALWAYS AS (CAST(julianday(fecha_export) AS INTEGER)) VIRTUAL",
+            ),
+            sqlite_add_column(
+                "impagos_gestion",
+                "fecha_dia",
+                "TEXT GENERATED ALWAYS AS (substr(fecha, 1, 10)) VIRTUAL",
+            ),
+        ],
+        postgres=[
+            "ALTER TABLE impagos_eventos ADD COLUMN IF NOT EXISTS export_dia INTEGER "
+            "GENERATED ALWAYS AS (fecha_export - DATE '1970-01-01') STORED",
+            "ALTER TABLE impagos_gestion ADD COLUMN IF NOT EXISTS fecha_dia DATE "
+            "GENERATED ALWAYS AS (fecha::date) STORED",
+        ],
+    ),
+    Migration(2, "indices de consultas", sqlite=_INDICES, postgres=_INDICES),
+]
 
 
 class ImpagosDB:
     def __init__(self, db_path: str, db_config=None):
         self.db_path = db_path
         self.db_config = db_config or {}
-        self.use_postgres = bool(self.db_config.get("host"))
+        self.storage = Storage(db_path, self.db_config)
+        self.use_postgres = self.storage.use_postgres
         if not self.use_postgres:
             db_dir = os.path.dirname(db_path)
             if db_dir:
                 os.makedirs(db_dir, exist_ok=True)
+        self.analytics = ImpagosAnalytics(self)
+        # Numeros de cliente del ultimo export, compartidos por bajas/suspensiones.
+        self.deudores_version = 0
+        # Clave (fecha_export, last_sync) con la que se calcularon los deudores.
+        self._deudores_clave = None
+        self._deudores = frozenset()
         self.init_db()
 
+    def close(self):
+        self.storage.close()
+
     def _connect(self):
-        if not self.use_postgres:
-            return sqlite3.connect(self.db_path)
-        if psycopg is None:
-            raise RuntimeError("psycopg no esta instalado. Instala psycopg para usar PostgreSQL.")
-        return psycopg.connect(
-            host=self.db_config.get("host"),
-            port=self.db_config.get("port"),
-            dbname=self.db_config.get("name"),
-            user=self.db_config.get("user"),
-            password=self.db_config.get("password"),
-            connect_timeout=5,
-        )
+        return self.storage.connect()
 
     def _sql(self, sql: str) -> str:
-        if self.use_postgres:
-            return sql.replace("?", "%s")
-        return sql
+        return self.storage.sql(sql)
 
     def init_db(self):
-        with self._connect() as conn:
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
             if self.use_postgres:
                 cur.execute(
@@ -194,26 +262,37 @@ class ImpagosDB:
                 )
                 """
             )
+            apply_migrations(cur, "impagos", MIGRACIONES, self.use_postgres)
+            self.analytics.init_tables(cur)
+            if self.analytics.needs_rebuild(cur):
+                self.analytics._rebuild(cur)
             conn.commit()
 
     def set_last_export(self, fecha_export: str):
-        with self._connect() as conn:
+        self._set_meta("last_export", fecha_export)
+
+    def _set_meta(self, key, value):
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 self._sql(
                     "INSERT INTO impagos_meta(key, value) VALUES (?, ?) "
                     "ON CONFLICT(key) DO UPDATE SET value=excluded.value"
                 ),
-                ("last_export", fecha_export),
+                (key, value),
             )
             conn.commit()
 
-    def get_last_export(self):
+    def _get_meta(self, *keys):
+        """{key: value} de impagos_meta para `keys`, en una sola consulta."""
         with self._connect() as conn:
             cur = conn.cursor()
-            cur.execute("SELECT value FROM impagos_meta WHERE key='last_export'")
-            row = cur.fetchone()
-            return row[0] if row else None
+            marcas = ", ".join("?" for _ in keys)
+            cur.execute(self._sql(f"SELECT key, value FROM impagos_meta WHERE key IN ({marcas})"), keys)
+            return dict(cur.fetchall())
+
+    def get_last_export(self):
+        return self._get_meta("last_export").get("last_export")
 
     def get_prev_export(self, before_date):
         with self._connect() as conn:
@@ -228,8 +307,41 @@ class ImpagosDB:
             value = row[0]
             return value.isoformat() if hasattr(value, "isoformat") else value
 
+    def _set_deudores(self, clave, numeros):
+        self._deudores_clave = clave
+        self._deudores = frozenset(numeros)
+        self.deudores_version += 1
+
+    def deudores_actuales(self, fecha_export=None):
+        """
+        Devuelve (frozenset de numeros de cliente con impago en el export,
+        version). Se calcula una vez por export y se reutiliza hasta el
+        siguiente sync, de este equipo o de otro (marca last_sync en
+        impagos_meta); la version cambia cada vez que el conjunto se recalcula.
+        """
+        meta = self._get_meta("last_export", "last_sync")
+        fecha_export = fecha_export or meta.get("last_export")
+        if not fecha_export:
+            return frozenset(), self.deudores_version
+        clave = (fecha_export, meta.get("last_sync"))
+        if self._deudores_clave != clave:
+            with self._connect() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    self._sql(
+                        "SELECT DISTINCT c.numero_cliente "
+                        "FROM impagos_clientes c "
+                        "JOIN impagos_eventos e ON e.cliente_id = c.id "
+                        "WHERE e.fecha_export = ?"
+                    ),
+                    (fecha_export,),
+                )
+                numeros = {str(r[0]).strip() for r in cur.fetchall() if r and r[0]}
+            self._set_deudores(clave, numeros)
+        return self._deudores, self.deudores_version
+
     def upsert_cliente(self, numero_cliente, nombre, apellidos, email, movil):
-        with self._connect() as conn:
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 self._sql(
@@ -255,7 +367,7 @@ class ImpagosDB:
             return row[0] if row else None
 
     def add_evento(self, cliente_id, fecha_export, incidentes):
-        with self._connect() as conn:
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 self._sql(
@@ -271,7 +383,8 @@ class ImpagosDB:
             conn.commit()
 
     def add_gestion(self, cliente_id, accion, plantilla="", staff="", notas=""):
-        with self._connect() as conn:
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 self._sql(
@@ -280,19 +393,80 @@ class ImpagosDB:
                     VALUES (?, ?, ?, ?, ?, ?)
                     """
                 ),
-                (cliente_id, datetime.now().strftime("%Y-%m-%d %H:%M"), accion, plantilla, staff, notas),
+                (cliente_id, fecha, accion, plantilla, staff, notas),
+            )
+            self.analytics.record_gestion(cur, fecha, accion, plantilla)
+            conn.commit()
+
+    def _resolve_cliente_ids(self, cur, numeros):
+        if not numeros:
+            return {}
+        if self.use_postgres:
+            cur.execute(
+                "SELECT numero_cliente, id FROM impagos_clientes WHERE numero_cliente = ANY(%s)",
+                (numeros,),
             )
+        else:
+            placeholders = ",".join(["?"] * len(numeros))
+            cur.execute(
+                f"SELECT numero_cliente, id FROM impagos_clientes WHERE numero_cliente IN ({placeholders})",
+                numeros,
+            )
+        return {row[0]: row[1] for row in cur.fetchall()}
+
+    def add_gestion_bulk(self, codigos, accion, plantilla="", staff="", notas=""):
+        """
+        Registra la misma gestion para varios numeros de cliente en una sola
+        conexion y transaccion. Devuelve cuantas gestiones se insertaron.
+        """
+        numeros = list(dict.fromkeys(str(c).strip() for c in codigos if str(c).strip()))
+        if not numeros:
+            return 0
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self.storage.transaction(), self._connect() as conn:
+            cur = conn.cursor()
+            ids = self._resolve_cliente_ids(cur, numeros)
+            gestiones = [
+                (ids[numero], fecha, accion, plantilla, staff, notas)
+                for numero in numeros
+                if ids.get(numero)
+            ]
+            if gestiones:
+                cur.executemany(
+                    self._sql(
+                        """
+                        INSERT INTO impagos_gestion (cliente_id, fecha, accion, plantilla, staff, notas)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """
+                    ),
+                    gestiones,
+                )
+                self.analytics.record_gestion(cur, fecha, accion, plantilla, len(gestiones))
             conn.commit()
+        return len(gestiones)
 
-    def sync_from_df(self, df, resumen_map=None):
+    def sync_from_df(self, df, resumen_df=None):
         fecha_export = datetime.now().date().isoformat()
-        prev_export = self.get_prev_export(fecha_export)
-        rows = normalize_impagos_df(df, resumen_map=resumen_map)
-        if not rows:
-            self.set_last_export(fecha_export)
-            return fecha_export, 0
+        rows = normalize_impagos_df(df, resumen_df=resumen_df)
+        # Marca de este sync: invalida la cache de deudores en los demas equipos.
+        sync = datetime.now().isoformat(timespec="microseconds")
+        # Todo el export (clientes, eventos, meta, resueltos y rollups) en una transaccion.
+        with self.storage.transaction():
+            self._set_meta("last_sync", sync)
+            prev_export = self.get_prev_export(fecha_export)
+            if rows.empty:
+                self.set_last_export(fecha_export)
+                self._actualizar_rollups(prev_export, fecha_export)
+            else:
+                self._guardar_export(rows, fecha_export)
+                if prev_export and prev_export != fecha_export:
+                    self._marcar_resueltos(prev_export, fecha_export)
+                self._actualizar_rollups(prev_export, fecha_export)
+        self._set_deudores((fecha_export, sync), rows["numero_cliente"].tolist() if not rows.empty else ())
+        return fecha_export, len(rows)
 
-        with self._connect() as conn:
+    def _guardar_export(self, rows, fecha_export):
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
 
             # Upsert clientes en lote
@@ -308,40 +482,22 @@ class ImpagosDB:
                         movil=excluded.movil
                     """
                 ),
-                [
-                    (
-                        r["numero_cliente"],
-                        r["nombre"],
-                        r["apellidos"],
-                        r["email"],
-                        r["movil"],
-                    )
-                    for r in rows
-                ],
+                list(rows[IMPAGOS_COLUMNS].itertuples(index=False, name=None)),
             )
 
             # Resolver ids de clientes en una sola query
-            numeros = [r["numero_cliente"] for r in rows]
-            if self.use_postgres:
-                cur.execute(
-                    "SELECT numero_cliente, id FROM impagos_clientes WHERE numero_cliente = ANY(%s)",
-                    (numeros,),
-                )
-            else:
-                placeholders = ",".join(["?"] * len(numeros))
-                cur.execute(
-                    f"SELECT numero_cliente, id FROM impagos_clientes WHERE numero_cliente IN ({placeholders})",
-                    numeros,
-                )
-            ids = {row[0]: row[1] for row in cur.fetchall()}
+            ids = self._resolve_cliente_ids(cur, rows["numero_cliente"].drop_duplicates().tolist())
 
             # Upsert eventos en lote
-            eventos = []
-            for r in rows:
-                cliente_id = ids.get(r["numero_cliente"])
-                if not cliente_id:
-                    continue
-                eventos.append((cliente_id, fecha_export, r["incidentes"]))
+            cliente_ids = rows["numero_cliente"].map(ids)
+            valid = cliente_ids.notna()
+            eventos = list(
+                zip(
+                    cliente_ids[valid].astype(int).tolist(),
+                    [fecha_export] * int(valid.sum()),
+                    rows.loc[valid, "incidentes"].astype(int).tolist(),
+                )
+            )
             if eventos:
                 cur.executemany(
                     self._sql(
@@ -364,9 +520,12 @@ class ImpagosDB:
                 ("last_export", fecha_export),
             )
             conn.commit()
-        if prev_export and prev_export != fecha_export:
-            self._marcar_resueltos(prev_export, fecha_export)
-        return fecha_export, len(rows)
+
+    def _actualizar_rollups(self, prev_export, fecha_export):
+        with self.storage.transaction(), self._connect() as conn:
+            cur = conn.cursor()
+            self.analytics.rollup_export(cur, prev_export, fecha_export)
+            conn.commit()
 
     def _marcar_resueltos(self, prev_export, current_export):
         """
@@ -374,7 +533,7 @@ class ImpagosDB:
         estaban en el export anterior y ya no aparecen en el actual,
         solo si han recibido algún email alguna vez.
         """
-        with self._connect() as conn:
+        with self.storage.transaction(), self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 self._sql(
@@ -418,51 +577,20 @@ class ImpagosDB:
             conn.commit()
 
     def _base_current_query(self, fecha_export):
+        # Las comparaciones usan las columnas fecha_dia/export_dia (ver MIGRACIONES)
+        # para que los filtros por dia puedan usar indices en ambos motores.
         if self.use_postgres:
-            return (
-                "WITH email_hist AS ("
-                "  SELECT cliente_id, string_agg(substring(fecha::text from 1 for 10), ', ') AS email_hist "
-                "  FROM impagos_gestion WHERE accion='email' GROUP BY cliente_id"
-                "), cycle AS ("
-                "  SELECT cliente_id, MAX(fecha) AS cycle_start "
-                "  FROM impagos_gestion WHERE accion='resuelto_email' GROUP BY cliente_id"
-                "), last_email_cycle AS ("
-                "  SELECT g.cliente_id, g.fecha AS last_email, g.plantilla AS last_plantilla "
-                "  FROM impagos_gestion g "
-                "  LEFT JOIN cycle c ON c.cliente_id = g.cliente_id "
-                "  WHERE g.accion='email' "
-                "    AND (c.cycle_start IS NULL OR g.fecha > c.cycle_start) "
-                "    AND g.fecha = ("
-                "      SELECT MAX(g2.fecha) FROM impagos_gestion g2 "
-                "      WHERE g2.cliente_id = g.cliente_id AND g2.accion='email' "
-                "        AND (c.cycle_start IS NULL OR g2.fecha > c.cycle_start)"
-                "    )"
-                "), prev_app AS ("
-                "  SELECT cliente_id, MAX(fecha_export) AS prev_fecha "
-                "  FROM impagos_eventos WHERE fecha_export < ?::date GROUP BY cliente_id"
-                ") "
-                "SELECT c.numero_cliente, c.nombre, c.apellidos, c.email, c.movil, "
-                "e.incidentes, e.fecha_export, "
-                "CASE WHEN lec.last_email IS NOT NULL THEN 1 ELSE 0 END AS email_enviado, "
-                "lec.last_email AS fecha_envio, "
-                "eh.email_hist AS email_hist, "
-                "CASE WHEN cyc.cycle_start IS NOT NULL "
-                "AND e.fecha_export > cyc.cycle_start::date "
-                "THEN 1 ELSE 0 END AS reincidente "
-                "FROM impagos_eventos e "
-                "JOIN impagos_clientes c ON c.id = e.cliente_id "
-                "LEFT JOIN cycle cyc ON cyc.cliente_id = c.id "
-                "LEFT JOIN last_email_cycle lec ON lec.cliente_id = c.id "
-                "LEFT JOIN email_hist eh ON eh.cliente_id = c.id "
-                "LEFT JOIN prev_app pa ON pa.cliente_id = c.id "
-                "WHERE e.fecha_export = ?::date"
-            )
+            email_hist = "string_agg(fecha_dia::text, ', ')"
+            dcast = "::date"
+        else:
+            email_hist = "GROUP_CONCAT(fecha_dia, ', ')"
+            dcast = ""
         return (
             "WITH email_hist AS ("
-            "  SELECT cliente_id, GROUP_CONCAT(substr(fecha, 1, 10), ', ') AS email_hist "
+            f"  SELECT cliente_id, {email_hist} AS email_hist "
             "  FROM impagos_gestion WHERE accion='email' GROUP BY cliente_id"
             "), cycle AS ("
-            "  SELECT cliente_id, MAX(fecha) AS cycle_start "
+            "  SELECT cliente_id, MAX(fecha) AS cycle_start, MAX(fecha_dia) AS cycle_dia "
             "  FROM impagos_gestion WHERE accion='resuelto_email' GROUP BY cliente_id"
             "), last_email_cycle AS ("
             "  SELECT g.cliente_id, g.fecha AS last_email, g.plantilla AS last_plantilla "
@@ -476,16 +604,16 @@ class ImpagosDB:
             "        AND (c.cycle_start IS NULL OR g2.fecha > c.cycle_start)"
             "    )"
             "), prev_app AS ("
-            "  SELECT cliente_id, MAX(fecha_export) AS prev_fecha "
-            "  FROM impagos_eventos WHERE fecha_export < ? GROUP BY cliente_id"
+            "  SELECT cliente_id, MAX(export_dia) AS prev_dia "
+            f"  FROM impagos_eventos WHERE fecha_export < ?{dcast} GROUP BY cliente_id"
             ") "
             "SELECT c.numero_cliente, c.nombre, c.apellidos, c.email, c.movil, "
             "e.incidentes, e.fecha_export, "
             "CASE WHEN lec.last_email IS NOT NULL THEN 1 ELSE 0 END AS email_enviado, "
             "lec.last_email AS fecha_envio, "
             "eh.email_hist AS email_hist, "
-            "CASE WHEN cyc.cycle_start IS NOT NULL "
-            "AND date(e.fecha_export) > date(cyc.cycle_start) "
+            "CASE WHEN cyc.cycle_dia IS NOT NULL "
+            "AND e.fecha_export > cyc.cycle_dia "
             "THEN 1 ELSE 0 END AS reincidente "
             "FROM impagos_eventos e "
             "JOIN impagos_clientes c ON c.id = e.cliente_id "
@@ -493,136 +621,73 @@ class ImpagosDB:
             "LEFT JOIN last_email_cycle lec ON lec.cliente_id = c.id "
             "LEFT JOIN email_hist eh ON eh.cliente_id = c.id "
             "LEFT JOIN prev_app pa ON pa.cliente_id = c.id "
-            "WHERE e.fecha_export = ?"
+            f"WHERE e.fecha_export = ?{dcast}"
         )
 
+    def _resueltos_query(self):
+        if self.use_postgres:
+            email_hist = "string_agg(fecha_dia::text, ', ')"
+            dcast, tscast = "::date", "::timestamp"
+        else:
+            email_hist = "GROUP_CONCAT(fecha_dia, ', ')"
+            dcast, tscast = "", ""
+        return f"""
+            WITH email_hist AS (
+              SELECT cliente_id, {email_hist} AS email_hist
+              FROM impagos_gestion WHERE accion='email' GROUP BY cliente_id
+            ), resuelto_hoy AS (
+              SELECT cliente_id FROM impagos_gestion
+              WHERE accion='resuelto_auto' AND fecha = ?{tscast}
+            ), resuelto_email_hoy AS (
+              SELECT cliente_id FROM impagos_gestion
+              WHERE accion='resuelto_email' AND fecha_dia = ?{dcast}
+            )
+            SELECT c.numero_cliente, c.nombre, c.apellidos, c.email, c.movil,
+                   e.incidentes, e.fecha_export,
+                   0 AS email_enviado,
+                   '' AS fecha_envio,
+                   eh.email_hist AS email_hist,
+                   0 AS reincidente
+            FROM impagos_eventos e
+            JOIN impagos_clientes c ON c.id = e.cliente_id
+            LEFT JOIN email_hist eh ON eh.cliente_id = c.id
+            WHERE e.fecha_export = (
+                SELECT MAX(e2.fecha_export) FROM impagos_eventos e2 WHERE e2.cliente_id = c.id
+            )
+            AND c.id IN (SELECT cliente_id FROM resuelto_hoy)
+            AND c.id NOT IN (SELECT cliente_id FROM resuelto_email_hoy)
+            AND c.id NOT IN (SELECT cliente_id FROM impagos_eventos WHERE fecha_export = ?{dcast})
+            """
+
     def fetch_view(self, view, fecha_export):
         if not fecha_export:
             return []
+        base = self._sql(self._base_current_query(fecha_export))
+        params = (fecha_export, fecha_export)
         with self._connect() as conn:
             cur = conn.cursor()
             if view == "actuales":
-                cur.execute(self._sql(self._base_current_query(fecha_export)), (fecha_export, fecha_export))
+                cur.execute(base, params)
             elif view == "reincidentes":
-                if self.use_postgres:
-                    cur.execute(
-                        self._sql(self._base_current_query(fecha_export))
-                        + " AND pa.prev_fecha IS NOT NULL AND (e.fecha_export - pa.prev_fecha) >= 2",
-                        (fecha_export, fecha_export),
-                    )
-                else:
-                    cur.execute(
-                        self._sql(self._base_current_query(fecha_export))
-                        + " AND pa.prev_fecha IS NOT NULL AND (julianday(e.fecha_export) - julianday(pa.prev_fecha)) >= 2",
-                        (fecha_export, fecha_export),
-                    )
+                cur.execute(
+                    base + " AND pa.prev_dia IS NOT NULL AND (e.export_dia - pa.prev_dia) >= 2",
+                    params,
+                )
             elif view == "incidentes1":
                 cur.execute(
-                    self._sql(self._base_current_query(fecha_export))
-                    + " AND e.incidentes = 1 AND lec.last_email IS NULL",
-                    (fecha_export, fecha_export),
+                    base + " AND e.incidentes = 1 AND lec.last_email IS NULL",
+                    params,
                 )
             elif view == "incidentes2":
                 cur.execute(
-                    self._sql(self._base_current_query(fecha_export))
-                    + " AND e.incidentes >= 2 AND (lec.last_email IS NULL OR lec.last_plantilla != '2inc')",
-                    (fecha_export, fecha_export),
+                    base + " AND e.incidentes >= 2 AND (lec.last_email IS NULL OR lec.last_plantilla != '2inc')",
+                    params,
                 )
             elif view == "resueltos":
-                if self.use_postgres:
-                    cur.execute(
-                        self._sql(
-                            """
-                            WITH email_hist AS (
-                              SELECT cliente_id, string_agg(substring(fecha::text from 1 for 10), ', ') AS email_hist
-                              FROM impagos_gestion WHERE accion='email' GROUP BY cliente_id
-                            ), cycle AS (
-                              SELECT cliente_id, MAX(fecha) AS cycle_start
-                              FROM impagos_gestion WHERE accion='resuelto_auto' GROUP BY cliente_id
-                            ), last_email_cycle AS (
-                              SELECT g.cliente_id, g.fecha AS last_email, g.plantilla AS last_plantilla
-                              FROM impagos_gestion g
-                              LEFT JOIN cycle c ON c.cliente_id = g.cliente_id
-                              WHERE g.accion='email'
-                                AND (c.cycle_start IS NULL OR g.fecha > c.cycle_start)
-                                AND g.fecha = (
-                                  SELECT MAX(g2.fecha) FROM impagos_gestion g2
-                                  WHERE g2.cliente_id = g.cliente_id AND g2.accion='email'
-                                    AND (c.cycle_start IS NULL OR g2.fecha > c.cycle_start)
-                                )
-                            ), resuelto_hoy AS (
-                              SELECT cliente_id FROM impagos_gestion
-                              WHERE accion='resuelto_auto' AND fecha = ?::timestamp
-                            ), resuelto_email_hoy AS (
-                              SELECT cliente_id FROM impagos_gestion
-                              WHERE accion='resuelto_email' AND fecha::date = ?::date
-                            )
-                            SELECT c.numero_cliente, c.nombre, c.apellidos, c.email, c.movil,
-                                   e.incidentes, e.fecha_export,
-                                   0 AS email_enviado,
-                                   '' AS fecha_envio,
-                                   eh.email_hist AS email_hist,
-                                   0 AS reincidente
-                            FROM impagos_eventos e
-                            JOIN impagos_clientes c ON c.id = e.cliente_id
-                            LEFT JOIN email_hist eh ON eh.cliente_id = c.id
-                            WHERE e.fecha_export = (
-                                SELECT MAX(e2.fecha_export) FROM impagos_eventos e2 WHERE e2.cliente_id = c.id
-                            )
-                            AND c.id IN (SELECT cliente_id FROM resuelto_hoy)
-                            AND c.id NOT IN (SELECT cliente_id FROM resuelto_email_hoy)
-                            AND c.id NOT IN (SELECT cliente_id FROM impagos_eventos WHERE fecha_export = ?::date)
-                            """
-                        ),
-                        (f"{fecha_export} 00:00", fecha_export, fecha_export),
-                    )
-                else:
-                    cur.execute(
-                        self._sql(
-                            """
-                            WITH email_hist AS (
-                              SELECT cliente_id, GROUP_CONCAT(substr(fecha, 1, 10), ', ') AS email_hist
-                              FROM impagos_gestion WHERE accion='email' GROUP BY cliente_id
-                            ), cycle AS (
-                              SELECT cliente_id, MAX(fecha) AS cycle_start
-                              FROM impagos_gestion WHERE accion='resuelto_auto' GROUP BY cliente_id
-                            ), last_email_cycle AS (
-                              SELECT g.cliente_id, g.fecha AS last_email, g.plantilla AS last_plantilla
-                              FROM impagos_gestion g
-                              LEFT JOIN cycle c ON c.cliente_id = g.cliente_id
-                              WHERE g.accion='email'
-                                AND (c.cycle_start IS NULL OR g.fecha > c.cycle_start)
-                                AND g.fecha = (
-                                  SELECT MAX(g2.fecha) FROM impagos_gestion g2
-                                  WHERE g2.cliente_id = g.cliente_id AND g2.accion='email'
-                                    AND (c.cycle_start IS NULL OR g2.fecha > c.cycle_start)
-                                )
-                            ), resuelto_hoy AS (
-                              SELECT cliente_id FROM impagos_gestion
-                              WHERE accion='resuelto_auto' AND fecha = ? || ' 00:00'
-                            ), resuelto_email_hoy AS (
-                              SELECT cliente_id FROM impagos_gestion
-                              WHERE accion='resuelto_email' AND date(fecha) = ?
-                            )
-                            SELECT c.numero_cliente, c.nombre, c.apellidos, c.email, c.movil,
-                                   e.incidentes, e.fecha_export,
-                                   0 AS email_enviado,
-                                   '' AS fecha_envio,
-                                   eh.email_hist AS email_hist,
-                                   0 AS reincidente
-                            FROM impagos_eventos e
-                            JOIN impagos_clientes c ON c.id = e.cliente_id
-                            LEFT JOIN email_hist eh ON eh.cliente_id = c.id
-                            WHERE e.fecha_export = (
-                                SELECT MAX(e2.fecha_export) FROM impagos_eventos e2 WHERE e2.cliente_id = c.id
-                            )
-                            AND c.id IN (SELECT cliente_id FROM resuelto_hoy)
-                            AND c.id NOT IN (SELECT cliente_id FROM resuelto_email_hoy)
-                            AND c.id NOT IN (SELECT cliente_id FROM impagos_eventos WHERE fecha_export = ?)
-                            """
-                        ),
-                        (fecha_export, fecha_export, fecha_export),
-                    )
+                cur.execute(
+                    self._sql(self._resueltos_query()),
+                    (f"{fecha_export} 00:00", fecha_export, fecha_export),
+                )
             else:
-                cur.execute(self._sql(self._base_current_query(fecha_export)), (fecha_export, fecha_export))
+                cur.execute(base, params)
             return cur.fetchall()
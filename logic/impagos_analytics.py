@@ -0,0 +1,382 @@
+from collections import OrderedDict
+from datetime import date, datetime
+
+
+# Tramos (en dias) del histograma de tiempo hasta resolucion.
+TRAMOS_RESOLUCION = [
+    ("0-7", 0, 7),
+    ("8-14", 8, 14),
+    ("15-30", 15, 30),
+    ("31-60", 31, 60),
+    ("60+", 61, None),
+]
+
+
+def _as_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except Exception:
+        return None
+
+
+def _tramo(dias):
+    for label, desde, hasta in TRAMOS_RESOLUCION:
+        if dias >= desde and (hasta is None or dias <= hasta):
+            return label
+    return TRAMOS_RESOLUCION[0][0]
+
+
+class ImpagosAnalytics:
+    """
+    Agregados diarios de impagos mantenidos en cada sync/gestion.
+
+    - impagos_rollup_dia: foto de cada export (deudores, tramos de incidentes,
+      nuevos / continuan / reincidentes y resueltos con/sin email).
+    - impagos_rollup_envios: emails enviados por dia y plantilla.
+    - impagos_rollup_resueltos: resueltos por dia, plantilla del ultimo email
+      ('' si no hubo email) y tramo de dias hasta resolucion.
+
+    Las consultas por rango leen solo estas tablas (una fila por dia).
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    # ------------------------------------------------------------------ schema
+    def init_tables(self, cur):
+        fecha_type = "DATE" if self.db.use_postgres else "TEXT"
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS impagos_rollup_dia (
+                fecha {fecha_type} PRIMARY KEY,
+                deudores INTEGER,
+                inc1 INTEGER,
+                inc2 INTEGER,
+                inc3_mas INTEGER,
+                nuevos INTEGER,
+                continuan INTEGER,
+                reincidentes INTEGER,
+                resueltos_email INTEGER,
+                resueltos_sin_email INTEGER
+            )
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS impagos_rollup_envios (
+                fecha {fecha_type},
+                plantilla TEXT,
+                enviados INTEGER,
+                PRIMARY KEY(fecha, plantilla)
+            )
+            """
+        )
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS impagos_rollup_resueltos (
+                fecha {fecha_type},
+                plantilla TEXT,
+                tramo TEXT,
+                casos INTEGER,
+                PRIMARY KEY(fecha, plantilla, tramo)
+            )
+            """
+        )
+
+    def needs_rebuild(self, cur):
+        cur.execute("SELECT 1 FROM impagos_rollup_dia LIMIT 1")
+        if cur.fetchone():
+            return False
+        cur.execute("SELECT 1 FROM impagos_eventos LIMIT 1")
+        return cur.fetchone() is not None
+
+    # ------------------------------------------------------------ mantenimiento
+    def record_gestion(self, cur, fecha, accion, plantilla, cantidad=1):
+        """Suma `cantidad` emails enviados al dia/plantilla (misma transaccion)."""
+        if accion != "email" or cantidad <= 0:
+            return
+        cur.execute(
+            self.db._sql(
+                """
+                INSERT INTO impagos_rollup_envios (fecha, plantilla, enviados)
+                VALUES (?, ?, ?)
+                ON CONFLICT(fecha, plantilla) DO UPDATE SET
+                    enviados=impagos_rollup_envios.enviados + excluded.enviados
+                """
+            ),
+            (str(fecha)[:10], plantilla or "", cantidad),
+        )
+
+    def rollup_export(self, cur, prev_export, fecha_export):
+        """
+        Recalcula los agregados del dia `fecha_export` comparando con el export
+        anterior. Es idempotente: varios syncs el mismo dia reescriben la fila.
+        """
+        sql = self.db._sql
+        cur.execute(
+            sql(
+                """
+                SELECT e.cliente_id, e.incidentes,
+                       CASE WHEN EXISTS (
+                         SELECT 1 FROM impagos_eventos p
+                         WHERE p.cliente_id = e.cliente_id AND p.fecha_export < ?
+                       ) THEN 1 ELSE 0 END
+                FROM impagos_eventos e
+                WHERE e.fecha_export = ?
+                """
+            ),
+            (fecha_export, fecha_export),
+        )
+        actuales = cur.fetchall()
+        prev_ids = set()
+        if prev_export:
+            cur.execute(sql("SELECT cliente_id FROM impagos_eventos WHERE fecha_export = ?"), (prev_export,))
+            prev_ids = {row[0] for row in cur.fetchall()}
+
+        curr_ids = set()
+        inc1 = inc2 = inc3 = nuevos = continuan = reincidentes = 0
+        for cliente_id, incidentes, visto_antes in actuales:
+            curr_ids.add(cliente_id)
+            incidentes = int(incidentes or 1)
+            if incidentes <= 1:
+                inc1 += 1
+            elif incidentes == 2:
+                inc2 += 1
+            else:
+                inc3 += 1
+            if cliente_id in prev_ids:
+                continuan += 1
+            elif visto_antes:
+                reincidentes += 1
+            else:
+                nuevos += 1
+
+        resueltos = self._resueltos_detalle(cur, sorted(prev_ids - curr_ids), prev_export, fecha_export)
+        con_email = sum(1 for plantilla, _ in resueltos if plantilla)
+        cur.execute(
+            sql(
+                """
+                INSERT INTO impagos_rollup_dia (
+                    fecha, deudores, inc1, inc2, inc3_mas, nuevos, continuan, reincidentes,
+                    resueltos_email, resueltos_sin_email
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(fecha) DO UPDATE SET
+                    deudores=excluded.deudores,
+                    inc1=excluded.inc1,
+                    inc2=excluded.inc2,
+                    inc3_mas=excluded.inc3_mas,
+                    nuevos=excluded.nuevos,
+                    continuan=excluded.continuan,
+                    reincidentes=excluded.reincidentes,
+                    resueltos_email=excluded.resueltos_email,
+                    resueltos_sin_email=excluded.resueltos_sin_email
+                """
+            ),
+            (
+                fecha_export,
+                len(actuales),
+                inc1,
+                inc2,
+                inc3,
+                nuevos,
+                continuan,
+                reincidentes,
+                con_email,
+                len(resueltos) - con_email,
+            ),
+        )
+
+        conteo = {}
+        for key in resueltos:
+            conteo[key] = conteo.get(key, 0) + 1
+        cur.execute(sql("DELETE FROM impagos_rollup_resueltos WHERE fecha = ?"), (fecha_export,))
+        if conteo:
+            cur.executemany(
+                sql("INSERT INTO impagos_rollup_resueltos (fecha, plantilla, tramo, casos) VALUES (?, ?, ?, ?)"),
+                [(fecha_export, plantilla, tramo, casos) for (plantilla, tramo), casos in conteo.items()],
+            )
+
+    def _resueltos_detalle(self, cur, cliente_ids, prev_export, fecha_export):
+        """
+        Para cada cliente que sale del listado devuelve (plantilla, tramo):
+        plantilla del ultimo email de la racha de deuda ('' si no hubo) y tramo
+        de dias desde el primer email (o desde el inicio de la racha) hasta hoy.
+        """
+        if not cliente_ids:
+            return []
+        sql = self.db._sql
+        fecha_fin = _as_date(fecha_export)
+        cur.execute(
+            sql("SELECT DISTINCT fecha_export FROM impagos_eventos WHERE fecha_export <= ?"),
+            (prev_export,),
+        )
+        exports = sorted(d for d in (_as_date(row[0]) for row in cur.fetchall()) if d)
+
+        if self.db.use_postgres:
+            filtro, params = "cliente_id = ANY(%s)", [list(cliente_ids)]
+        else:
+            filtro, params = f"cliente_id IN ({','.join(['?'] * len(cliente_ids))})", list(cliente_ids)
+        cur.execute(
+            sql(f"SELECT cliente_id, fecha_export FROM impagos_eventos WHERE {filtro} AND fecha_export <= ?"),
+            params + [prev_export],
+        )
+        presencias = {}
+        for cliente_id, fecha in cur.fetchall():
+            presencias.setdefault(cliente_id, set()).add(_as_date(fecha))
+        cur.execute(
+            sql(
+                f"SELECT cliente_id, fecha, plantilla FROM impagos_gestion "
+                f"WHERE {filtro} AND accion='email' ORDER BY fecha ASC"
+            ),
+            params,
+        )
+        emails = {}
+        for cliente_id, fecha, plantilla in cur.fetchall():
+            emails.setdefault(cliente_id, []).append((_as_date(fecha), plantilla or ""))
+
+        detalle = []
+        for cliente_id in cliente_ids:
+            fechas = presencias.get(cliente_id, set())
+            inicio = None
+            for export in reversed(exports):
+                if export not in fechas:
+                    break
+                inicio = export
+            inicio = inicio or fecha_fin
+            racha = [(f, p) for f, p in emails.get(cliente_id, []) if f and inicio <= f <= fecha_fin]
+            if racha:
+                plantilla = racha[-1][1] or "email"
+                desde = racha[0][0]
+            else:
+                plantilla = ""
+                desde = inicio
+            detalle.append((plantilla, _tramo((fecha_fin - desde).days)))
+        return detalle
+
+    def rebuild(self):
+        """Regenera todos los agregados desde el historico (una vez, en BDs antiguas)."""
+        with self.db.storage.transaction(), self.db._connect() as conn:
+            cur = conn.cursor()
+            self._rebuild(cur)
+            conn.commit()
+
+    def _rebuild(self, cur):
+        cur.execute("DELETE FROM impagos_rollup_dia")
+        cur.execute("DELETE FROM impagos_rollup_envios")
+        cur.execute("DELETE FROM impagos_rollup_resueltos")
+        cur.execute("SELECT DISTINCT fecha_export FROM impagos_eventos ORDER BY fecha_export")
+        exports = [row[0] for row in cur.fetchall()]
+        prev = None
+        for export in exports:
+            self.rollup_export(cur, prev, export)
+            prev = export
+        cur.execute(
+            "SELECT fecha, plantilla FROM impagos_gestion WHERE accion='email'"
+        )
+        envios = {}
+        for fecha, plantilla in cur.fetchall():
+            key = (str(fecha)[:10], plantilla or "")
+            envios[key] = envios.get(key, 0) + 1
+        for (fecha, plantilla), cantidad in envios.items():
+            self.record_gestion(cur, fecha, "email", plantilla, cantidad)
+
+    # ---------------------------------------------------------------- consultas
+    def serie_diaria(self, desde, hasta):
+        """Filas de impagos_rollup_dia entre dos fechas (incluidas), como dicts."""
+        cols = [
+            "fecha", "deudores", "inc1", "inc2", "inc3_mas", "nuevos", "continuan",
+            "reincidentes", "resueltos_email", "resueltos_sin_email",
+        ]
+        with self.db._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                self.db._sql(
+                    f"SELECT {', '.join(cols)} FROM impagos_rollup_dia "
+                    "WHERE fecha >= ? AND fecha <= ? ORDER BY fecha"
+                ),
+                (desde, hasta),
+            )
+            rows = cur.fetchall()
+        return [dict(zip(cols, (_as_date(r[0]),) + tuple(r[1:]))) for r in rows]
+
+    def serie_semanal(self, desde, hasta):
+        """
+        Agrupa la serie diaria por semana ISO: deudores al cierre de la semana
+        y suma de nuevos/reincidentes/resueltos.
+        """
+        semanas = OrderedDict()
+        for dia in self.serie_diaria(desde, hasta):
+            anio, semana, _ = dia["fecha"].isocalendar()
+            item = semanas.setdefault(
+                (anio, semana),
+                {
+                    "semana": f"{anio}-W{semana:02d}",
+                    "deudores": 0,
+                    "max_deudores": 0,
+                    "nuevos": 0,
+                    "reincidentes": 0,
+                    "resueltos_email": 0,
+                    "resueltos_sin_email": 0,
+                },
+            )
+            item["deudores"] = dia["deudores"]
+            item["max_deudores"] = max(item["max_deudores"], dia["deudores"] or 0)
+            for key in ("nuevos", "reincidentes", "resueltos_email", "resueltos_sin_email"):
+                item[key] += dia[key] or 0
+        return list(semanas.values())
+
+    def histograma_resolucion(self, desde, hasta, plantilla=None):
+        """Casos resueltos por tramo de dias. plantilla='' filtra los resueltos sin email."""
+        sql = "SELECT tramo, SUM(casos) FROM impagos_rollup_resueltos WHERE fecha >= ? AND fecha <= ?"
+        params = [desde, hasta]
+        if plantilla is not None:
+            sql += " AND plantilla = ?"
+            params.append(plantilla)
+        sql += " GROUP BY tramo"
+        with self.db._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(self.db._sql(sql), params)
+            totales = {row[0]: int(row[1] or 0) for row in cur.fetchall()}
+        return OrderedDict((label, totales.get(label, 0)) for label, _, _ in TRAMOS_RESOLUCION)
+
+    def recuperacion_por_plantilla(self, desde, hasta):
+        """
+        Por plantilla: emails enviados, clientes resueltos cuyo ultimo email fue
+        esa plantilla y tasa de recuperacion (resueltos / enviados).
+        """
+        with self.db._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                self.db._sql(
+                    "SELECT plantilla, SUM(enviados) FROM impagos_rollup_envios "
+                    "WHERE fecha >= ? AND fecha <= ? GROUP BY plantilla"
+                ),
+                (desde, hasta),
+            )
+            enviados = {row[0]: int(row[1] or 0) for row in cur.fetchall()}
+            cur.execute(
+                self.db._sql(
+                    "SELECT plantilla, SUM(casos) FROM impagos_rollup_resueltos "
+                    "WHERE fecha >= ? AND fecha <= ? AND plantilla <> '' GROUP BY plantilla"
+                ),
+                (desde, hasta),
+            )
+            resueltos = {row[0]: int(row[1] or 0) for row in cur.fetchall()}
+        resultado = []
+        for plantilla in sorted(set(enviados) | set(resueltos)):
+            env = enviados.get(plantilla, 0)
+            res = resueltos.get(plantilla, 0)
+            resultado.append({
+                "plantilla": plantilla,
+                "enviados": env,
+                "resueltos": res,
+                "tasa": (res / env) if env else None,
+            })
+        return resultado
@@ -1,39 +1,227 @@
 import os
-import sqlite3
 import time
+from contextlib import contextmanager
 from datetime import datetime
 
-try:
-    import psycopg
-except Exception:
-    psycopg = None
+from logic.migrations import Migration, apply_migrations, sqlite_add_column
+from logic.storage import Storage
+
+
+_COLUMNAS_LEGACY = [
+    "reporte_path",
+    "creador_nombre",
+    "creador_apellido1",
+    "creador_apellido2",
+    "creador_movil",
+    "creador_email",
+]
+
+# Pasos de esquema en orden; cada BD guarda los aplicados en schema_migrations.
+MIGRACIONES = [
+    Migration(
+        1,
+        "columnas de creador y reporte",
+        sqlite=[sqlite_add_column("inc_incidencias", col, "TEXT") for col in _COLUMNAS_LEGACY],
+        postgres=[f"ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS {col} TEXT" for col in _COLUMNAS_LEGACY],
+    ),
+    Migration(
+        2,
+        "fecha_dia generada e indice por mapa",
+        sqlite=[
+            sqlite_add_column(
+                "inc_incidencias",
+                "fecha_dia",
+                "TEXT GENERATED ALWAYS AS (substr(fecha, 1, 10)) VIRTUAL",
+            ),
+            "CREATE INDEX IF NOT EXISTS ix_inc_incidencias_mapa_fecha ON inc_incidencias(mapa_id, fecha)",
+        ],
+        postgres=[
+            "ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS fecha_dia DATE "
+            "GENERATED ALWAYS AS (fecha::date) STORED",
+            "CREATE INDEX IF NOT EXISTS ix_inc_incidencias_mapa_fecha ON inc_incidencias(mapa_id, fecha)",
+        ],
+    ),
+]
+
+
+# Claves ajenas con borrado en cascada: (tabla, columna, tabla_padre).
+_CLAVES_AJENAS = [
+    ("inc_areas", "mapa_id", "inc_mapas"),
+    ("inc_maquinas", "area_id", "inc_areas"),
+    ("inc_incidencias", "mapa_id", "inc_mapas"),
+    ("inc_incidencias", "area_id", "inc_areas"),
+    ("inc_incidencias", "maquina_id", "inc_maquinas"),
+]
+
+# Referencias huerfanas a NULL antes de exigir las claves ajenas.
+_LIMPIAR_HUERFANOS = [
+    f"UPDATE {tabla} SET {col} = NULL WHERE {col} IS NOT NULL AND {col} NOT IN (SELECT id FROM {padre})"
+    for tabla, col, padre in _CLAVES_AJENAS
+]
+
+_INDICES_FK = [
+    "CREATE INDEX IF NOT EXISTS ix_inc_areas_mapa ON inc_areas(mapa_id)",
+    "CREATE INDEX IF NOT EXISTS ix_inc_maquinas_area ON inc_maquinas(area_id)",
+    "CREATE INDEX IF NOT EXISTS ix_inc_incidencias_area ON inc_incidencias(area_id)",
+    "CREATE INDEX IF NOT EXISTS ix_inc_incidencias_maquina ON inc_incidencias(maquina_id)",
+]
+
+
+# Cubre el GROUP BY de resumen_incidencias sin leer la tabla.
+_INDICE_RESUMEN = (
+    "CREATE INDEX IF NOT EXISTS ix_inc_incidencias_resumen "
+    "ON inc_incidencias(mapa_id, area_id, maquina_id, estado, fecha)"
+)
+
+
+def _sqlite_rehacer_con_cascada(cur):
+    """
+    SQLite no permite cambiar una FOREIGN KEY: se rehace cada tabla hija con
+    ON DELETE CASCADE (crear _new, copiar, borrar, renombrar). Requiere
+    PRAGMA foreign_keys=OFF, que IncidenciasDB garantiza durante init_db.
+    """
+    for tabla in ("inc_areas", "inc_maquinas", "inc_incidencias"):
+        cur.execute(f"PRAGMA foreign_key_list({tabla})")
+        fks = cur.fetchall()
+        if fks and all(str(fk[6]).upper() == "CASCADE" for fk in fks):
+            continue
+        cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (tabla,))
+        ddl = cur.fetchone()[0]
+        cur.execute(f"PRAGMA table_xinfo({tabla})")
+        # hidden 2/3 = columna generada: no se copia, se recalcula.
+        columnas = ", ".join(row[1] for row in cur.fetchall() if row[6] == 0)
+        nuevo = ddl.replace(f"CREATE TABLE {tabla}", f"CREATE TABLE {tabla}_new", 1)
+        for _t, col, padre in _CLAVES_AJENAS:
+            if _t == tabla:
+                nuevo = nuevo.replace(
+                    f"REFERENCES {padre}(id)", f"REFERENCES {padre}(id) ON DELETE CASCADE"
+                ).replace("ON DELETE CASCADE ON DELETE CASCADE", "ON DELETE CASCADE")
+        cur.execute(f"DROP TABLE IF EXISTS {tabla}_new")
+        cur.execute(nuevo)
+        cur.execute(f"INSERT INTO {tabla}_new ({columnas}) SELECT {columnas} FROM {tabla}")
+        cur.execute(f"DROP TABLE {tabla}")
+        cur.execute(f"ALTER TABLE {tabla}_new RENAME TO {tabla}")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_inc_incidencias_mapa_fecha ON inc_incidencias(mapa_id, fecha)")
+
+
+def _postgres_fk_cascada():
+    pasos = []
+    for tabla, col, padre in _CLAVES_AJENAS:
+        nombre = f"{tabla}_{col}_fkey"
+        pasos.append(
+            f"ALTER TABLE {tabla} DROP CONSTRAINT IF EXISTS {nombre}, "
+            f"ADD CONSTRAINT {nombre} FOREIGN KEY ({col}) REFERENCES {padre}(id) ON DELETE CASCADE"
+        )
+    return pasos
+
+
+class ReportesIndex:
+    """
+    Indice en memoria de la carpeta de reportes visuales (un solo os.scandir).
+
+    Sustituye a las comprobaciones os.path.exists por fila sobre una carpeta
+    sincronizada con OneDrive: se resuelve por nombre de archivo.
+    """
+
+    def __init__(self, reports_dir):
+        self.reports_dir = os.path.normpath(reports_dir)
+        self.nombres = set()
+        self.refresh()
+
+    def refresh(self):
+        nombres = set()
+        try:
+            with os.scandir(self.reports_dir) as it:
+                for entry in it:
+                    if entry.is_file():
+                        nombres.add(entry.name)
+        except OSError:
+            pass
+        self.nombres = nombres
+
+    def add(self, nombre):
+        self.nombres.add(os.path.basename(nombre))
+
+    def resolve(self, ruta):
+        """Ruta absoluta del reporte si esta en la carpeta indexada, o "" si no."""
+        if not ruta or str(ruta).startswith("blob:"):
+            return ""
+        base = os.path.basename(os.path.normpath(str(ruta)))
+        if base in self.nombres:
+            return os.path.join(self.reports_dir, base)
+        return ""
+
+    def stored_form(self, ruta):
+        """Forma a guardar en BD: solo el nombre si el reporte esta en la carpeta."""
+        if not ruta or str(ruta).startswith("blob:"):
+            return ruta
+        return os.path.basename(os.path.normpath(str(ruta))) if self.resolve(ruta) else ruta
+
+
+def migracion_reportes(reports_dir, use_postgres, version=3):
+    """Paso unico: reporte_path con ruta completa -> solo nombre si esta en la carpeta de reportes."""
+
+    def _step(cur):
+        index = ReportesIndex(reports_dir)
+        placeholder = "%s" if use_postgres else "?"
+        cur.execute("SELECT id, reporte_path FROM inc_incidencias WHERE reporte_path IS NOT NULL AND reporte_path <> ''")
+        cambios = []
+        for inc_id, ruta in cur.fetchall():
+            nuevo = index.stored_form(ruta)
+            if nuevo != ruta:
+                cambios.append((nuevo, inc_id))
+        if cambios:
+            cur.executemany(
+                f"UPDATE inc_incidencias SET reporte_path={placeholder} WHERE id={placeholder}",
+                cambios,
+            )
+
+    return Migration(version, "reporte_path normalizado", sqlite=[_step], postgres=[_step])
+
+
+MIGRACIONES_FK = [
+    Migration(
+        4,
+        "claves ajenas en cascada e indices",
+        sqlite=_LIMPIAR_HUERFANOS + [_sqlite_rehacer_con_cascada] + _INDICES_FK,
+        postgres=_LIMPIAR_HUERFANOS + _postgres_fk_cascada() + _INDICES_FK,
+    ),
+    Migration(
+        5,
+        "indice de resumen por area/maquina/estado",
+        sqlite=[_INDICE_RESUMEN],
+        postgres=[_INDICE_RESUMEN],
+    ),
+]
+
+
+# Ambitos de escritura: cada uno tiene un contador de version para que las
+# caches en memoria (ver logic.incidencias_model) sepan cuando recargar.
+LAYOUT = ("layout",)
+INCIDENCIAS = ("incidencias",)
+TODO = LAYOUT + INCIDENCIAS
 
 
 class IncidenciasDB:
-    def __init__(self, db_path: str, db_config=None):
+    def __init__(self, db_path: str, db_config=None, reports_dir=None, lock_file=False):
         self.db_path = db_path
         self.db_config = db_config or {}
-        self.use_postgres = bool(self.db_config.get("host"))
+        self.reports_dir = reports_dir or os.path.join(os.path.dirname(db_path), "incidencias_reportes")
+        self.storage = Storage(db_path, self.db_config)
+        self.use_postgres = self.storage.use_postgres
+        # Fallback opcional: el lock por archivo solo se usa si se pide expresamente.
+        self.lock_file = bool(lock_file or self.db_config.get("lock_file"))
+        self.versions = {scope: 0 for scope in TODO}
         self.init_db()
 
+    def close(self):
+        self.storage.close()
+
     def _connect(self):
-        if not self.use_postgres:
-            return sqlite3.connect(self.db_path)
-        if psycopg is None:
-            raise RuntimeError("psycopg no esta instalado. Instala psycopg para usar PostgreSQL.")
-        return psycopg.connect(
-            host=self.db_config.get("host"),
-            port=self.db_config.get("port"),
-            dbname=self.db_config.get("name"),
-            user=self.db_config.get("user"),
-            password=self.db_config.get("password"),
-            connect_timeout=5,
-        )
+        return self.storage.connect()
 
     def _sql(self, sql: str) -> str:
-        if self.use_postgres:
-            return sql.replace("?", "%s")
-        return sql
+        return self.storage.sql(sql)
 
     def _lock_path(self):
         return f"{self.db_path}.lock"
@@ -66,15 +254,25 @@ class IncidenciasDB:
         except Exception:
             pass
 
-    def _run_write(self, fn):
-        if self.use_postgres:
-            return fn()
-        if not self._acquire_lock():
+    def _run_write(self, fn, scopes=()):
+        with self.transaction():
+            result = fn()
+        for scope in scopes:
+            self.versions[scope] += 1
+        return result
+
+    @contextmanager
+    def transaction(self):
+        """Agrupa varias escrituras en una sola transaccion (ver Storage.transaction)."""
+        usar_lock = self.lock_file and not self.use_postgres and not self.storage.in_transaction
+        if usar_lock and not self._acquire_lock():
             raise RuntimeError("Base de datos ocupada. Intentalo de nuevo en unos segundos.")
         try:
-            return fn()
+            with self.storage.transaction():
+                yield
         finally:
-            self._release_lock()
+            if usar_lock:
+                self._release_lock()
 
     def init_db(self):
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
@@ -102,7 +300,7 @@ class IncidenciasDB:
                             nombre TEXT,
                             x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
                             color TEXT,
-                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id)
+                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id) ON DELETE CASCADE
                         )
                         """
                     )
@@ -116,7 +314,7 @@ class IncidenciasDB:
                             numero_asignado TEXT,
                             x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
                             color TEXT,
-                            FOREIGN KEY(area_id) REFERENCES inc_areas(id)
+                            FOREIGN KEY(area_id) REFERENCES inc_areas(id) ON DELETE CASCADE
                         )
                         """
                     )
@@ -137,18 +335,12 @@ class IncidenciasDB:
                             descripcion TEXT,
                             estado TEXT,
                             reporte_path TEXT,
-                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id),
-                            FOREIGN KEY(area_id) REFERENCES inc_areas(id),
-                            FOREIGN KEY(maquina_id) REFERENCES inc_maquinas(id)
+                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id) ON DELETE CASCADE,
+                            FOREIGN KEY(area_id) REFERENCES inc_areas(id) ON DELETE CASCADE,
+                            FOREIGN KEY(maquina_id) REFERENCES inc_maquinas(id) ON DELETE CASCADE
                         )
                         """
                     )
-                    cur.execute("ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS reporte_path TEXT")
-                    cur.execute("ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS creador_nombre TEXT")
-                    cur.execute("ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS creador_apellido1 TEXT")
-                    cur.execute("ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS creador_apellido2 TEXT")
-                    cur.execute("ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS creador_movil TEXT")
-                    cur.execute("ALTER TABLE inc_incidencias ADD COLUMN IF NOT EXISTS creador_email TEXT")
                 else:
                     cur.execute(
                         """
@@ -170,7 +362,7 @@ class IncidenciasDB:
                             nombre TEXT,
                             x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
                             color TEXT,
-                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id)
+                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id) ON DELETE CASCADE
                         )
                         """
                     )
@@ -184,7 +376,7 @@ class IncidenciasDB:
                             numero_asignado TEXT,
                             x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
                             color TEXT,
-                            FOREIGN KEY(area_id) REFERENCES inc_areas(id)
+                            FOREIGN KEY(area_id) REFERENCES inc_areas(id) ON DELETE CASCADE
                         )
                         """
                     )
@@ -205,28 +397,20 @@ class IncidenciasDB:
                             descripcion TEXT,
                             estado TEXT,
                             reporte_path TEXT,
-                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id),
-                            FOREIGN KEY(area_id) REFERENCES inc_areas(id),
-                            FOREIGN KEY(maquina_id) REFERENCES inc_maquinas(id)
+                            FOREIGN KEY(mapa_id) REFERENCES inc_mapas(id) ON DELETE CASCADE,
+                            FOREIGN KEY(area_id) REFERENCES inc_areas(id) ON DELETE CASCADE,
+                            FOREIGN KEY(maquina_id) REFERENCES inc_maquinas(id) ON DELETE CASCADE
                         )
                         """
                     )
-                    cur.execute("PRAGMA table_info(inc_incidencias)")
-                    cols = [row[1] for row in cur.fetchall()]
-                    if "reporte_path" not in cols:
-                        cur.execute("ALTER TABLE inc_incidencias ADD COLUMN reporte_path TEXT")
-                    if "creador_nombre" not in cols:
-                        cur.execute("ALTER TABLE inc_incidencias ADD COLUMN creador_nombre TEXT")
-                    if "creador_apellido1" not in cols:
-                        cur.execute("ALTER TABLE inc_incidencias ADD COLUMN creador_apellido1 TEXT")
-                    if "creador_apellido2" not in cols:
-                        cur.execute("ALTER TABLE inc_incidencias ADD COLUMN creador_apellido2 TEXT")
-                    if "creador_movil" not in cols:
-                        cur.execute("ALTER TABLE inc_incidencias ADD COLUMN creador_movil TEXT")
-                    if "creador_email" not in cols:
-                        cur.execute("ALTER TABLE inc_incidencias ADD COLUMN creador_email TEXT")
+                migraciones = MIGRACIONES + [migracion_reportes(self.reports_dir, self.use_postgres)] + MIGRACIONES_FK
+                apply_migrations(cur, "incidencias", migraciones, self.use_postgres)
                 conn.commit()
+        # Las migraciones rehacen tablas con las claves ajenas desactivadas;
+        # despues se activan para que los borrados se propaguen en cascada.
+        self.storage.set_foreign_keys(False)
         self._run_write(_op)
+        self.storage.set_foreign_keys(True)
 
     def add_map(self, nombre, ruta, ancho, alto):
         def _op():
@@ -239,7 +423,7 @@ class IncidenciasDB:
                     (nombre, ruta, orden, ancho, alto),
                 )
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, LAYOUT)
 
     def list_maps(self):
         with self._connect() as conn:
@@ -251,18 +435,10 @@ class IncidenciasDB:
         def _op():
             with self._connect() as conn:
                 cur = conn.cursor()
-                # borrar incidencias
-                cur.execute(self._sql("DELETE FROM inc_incidencias WHERE mapa_id=?"), (mapa_id,))
-                # borrar maquinas y areas
-                cur.execute(
-                    self._sql("DELETE FROM inc_maquinas WHERE area_id IN (SELECT id FROM inc_areas WHERE mapa_id=?)"),
-                    (mapa_id,),
-                )
-                cur.execute(self._sql("DELETE FROM inc_areas WHERE mapa_id=?"), (mapa_id,))
-                # borrar mapa
+                # areas, maquinas e incidencias se borran en cascada
                 cur.execute(self._sql("DELETE FROM inc_mapas WHERE id=?"), (mapa_id,))
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, TODO)
 
     def update_map_path(self, mapa_id, ruta):
         def _op():
@@ -270,7 +446,7 @@ class IncidenciasDB:
                 cur = conn.cursor()
                 cur.execute(self._sql("UPDATE inc_mapas SET ruta=? WHERE id=?"), (ruta, mapa_id))
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, LAYOUT)
 
     def add_area(self, mapa_id, nombre, x1, y1, x2, y2, color):
         def _op():
@@ -281,7 +457,7 @@ class IncidenciasDB:
                     (mapa_id, nombre, x1, y1, x2, y2, color),
                 )
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, LAYOUT)
 
     def list_areas(self, mapa_id):
         with self._connect() as conn:
@@ -292,17 +468,6 @@ class IncidenciasDB:
             )
             return cur.fetchall()
 
-    def update_area(self, area_id, nombre, x1, y1, x2, y2):
-        def _op():
-            with self._connect() as conn:
-                cur = conn.cursor()
-                cur.execute(
-                    self._sql("UPDATE inc_areas SET nombre=?, x1=?, y1=?, x2=?, y2=? WHERE id=?"),
-                    (nombre, x1, y1, x2, y2, area_id),
-                )
-                conn.commit()
-        self._run_write(_op)
-
     def add_machine(self, area_id, nombre, serie, numero_asignado, x1, y1, x2, y2, color):
         def _op():
             with self._connect() as conn:
@@ -317,7 +482,7 @@ class IncidenciasDB:
                     (area_id, nombre, serie, numero_asignado, x1, y1, x2, y2, color),
                 )
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, LAYOUT)
 
     def list_machines(self, mapa_id):
         with self._connect() as conn:
@@ -336,31 +501,67 @@ class IncidenciasDB:
             )
             return cur.fetchall()
 
-    def update_machine(self, machine_id, nombre, serie, numero_asignado, x1, y1, x2, y2):
+    def delete_machine(self, machine_id):
         def _op():
             with self._connect() as conn:
                 cur = conn.cursor()
-                cur.execute(
-                    self._sql(
-                        """
-                        UPDATE inc_maquinas
-                        SET nombre=?, serie=?, numero_asignado=?, x1=?, y1=?, x2=?, y2=?
-                        WHERE id=?
-                        """
-                    ),
-                    (nombre, serie, numero_asignado, x1, y1, x2, y2, machine_id),
-                )
+                # sus incidencias se borran en cascada
+                cur.execute(self._sql("DELETE FROM inc_maquinas WHERE id=?"), (machine_id,))
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, TODO)
 
-    def delete_machine(self, machine_id):
+    def apply_layout(self, mapa_id, areas=(), machines=()):
+        """
+        Guarda un layout editado en una sola transaccion.
+
+        `areas`: filas (id, nombre, x1, y1, x2, y2, color); `machines`: filas
+        (id, area_id, nombre, serie, numero_asignado, x1, y1, x2, y2, color).
+        Con id se actualiza y con id None se inserta; lo que no aparece no se toca.
+        """
         def _op():
             with self._connect() as conn:
                 cur = conn.cursor()
-                cur.execute(self._sql("DELETE FROM inc_incidencias WHERE maquina_id=?"), (machine_id,))
-                cur.execute(self._sql("DELETE FROM inc_maquinas WHERE id=?"), (machine_id,))
+                nuevas_areas = [(mapa_id, *a[1:7]) for a in areas if a[0] is None]
+                if nuevas_areas:
+                    cur.executemany(
+                        self._sql(
+                            "INSERT INTO inc_areas (mapa_id, nombre, x1, y1, x2, y2, color) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                        ),
+                        nuevas_areas,
+                    )
+                cambios_areas = [(*a[1:7], a[0], mapa_id) for a in areas if a[0] is not None]
+                if cambios_areas:
+                    cur.executemany(
+                        self._sql(
+                            "UPDATE inc_areas SET nombre=?, x1=?, y1=?, x2=?, y2=?, color=? WHERE id=? AND mapa_id=?"
+                        ),
+                        cambios_areas,
+                    )
+                nuevas_maquinas = [tuple(m[1:10]) for m in machines if m[0] is None]
+                if nuevas_maquinas:
+                    cur.executemany(
+                        self._sql(
+                            """
+                            INSERT INTO inc_maquinas (area_id, nombre, serie, numero_asignado, x1, y1, x2, y2, color)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """
+                        ),
+                        nuevas_maquinas,
+                    )
+                cambios_maquinas = [(*m[1:10], m[0]) for m in machines if m[0] is not None]
+                if cambios_maquinas:
+                    cur.executemany(
+                        self._sql(
+                            """
+                            UPDATE inc_maquinas
+                            SET area_id=?, nombre=?, serie=?, numero_asignado=?, x1=?, y1=?, x2=?, y2=?, color=?
+                            WHERE id=?
+                            """
+                        ),
+                        cambios_maquinas,
+                    )
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, TODO)
 
     def add_incident(
         self,
@@ -408,7 +609,7 @@ class IncidenciasDB:
                     ),
                 )
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, INCIDENCIAS)
 
     def list_incidencias(self, mapa_id):
         with self._connect() as conn:
@@ -430,13 +631,31 @@ class IncidenciasDB:
             )
             return cur.fetchall()
 
+    def resumen_incidencias(self, mapa_id):
+        """Filas (area_id, maquina_id, estado, mes 'YYYY-MM', total) del mapa, en una consulta agrupada."""
+        mes = "to_char(fecha, 'YYYY-MM')" if self.use_postgres else "substr(fecha, 1, 7)"
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                self._sql(
+                    f"""
+                    SELECT area_id, maquina_id, estado, {mes} AS mes, COUNT(*)
+                    FROM inc_incidencias
+                    WHERE mapa_id=?
+                    GROUP BY area_id, maquina_id, estado, {mes}
+                    """
+                ),
+                (mapa_id,),
+            )
+            return cur.fetchall()
+
     def update_incidencia_estado(self, inc_id, estado):
         def _op():
             with self._connect() as conn:
                 cur = conn.cursor()
                 cur.execute(self._sql("UPDATE inc_incidencias SET estado=? WHERE id=?"), (estado, inc_id))
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, INCIDENCIAS)
 
 
     def update_incidencia_reporte(self, inc_id, reporte_path):
@@ -445,7 +664,7 @@ class IncidenciasDB:
                 cur = conn.cursor()
                 cur.execute(self._sql("UPDATE inc_incidencias SET reporte_path=? WHERE id=?"), (reporte_path, inc_id))
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, INCIDENCIAS)
 
     def update_incidencia(self, inc_id, elemento, descripcion, estado):
         def _op():
@@ -456,7 +675,7 @@ class IncidenciasDB:
                     (elemento, descripcion, estado, inc_id),
                 )
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, INCIDENCIAS)
 
     def delete_incidencia(self, inc_id):
         def _op():
@@ -464,4 +683,4 @@ class IncidenciasDB:
                 cur = conn.cursor()
                 cur.execute(self._sql("DELETE FROM inc_incidencias WHERE id=?"), (inc_id,))
                 conn.commit()
-        self._run_write(_op)
+        self._run_write(_op, INCIDENCIAS)
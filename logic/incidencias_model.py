@@ -0,0 +1,291 @@
+import queue
+import threading
+from collections import OrderedDict
+
+
+class GridIndex:
+    """
+    Indice espacial por rejilla para rectangulos del mapa.
+
+    Cada rectangulo se registra en las celdas que cubre; una consulta de punto
+    solo revisa los rectangulos de su celda y devuelve los que lo contienen,
+    del mas pequeno (mas interior) al mas grande.
+    """
+
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self._cells = {}
+        self._rects = {}
+
+    def _cell_range(self, x1, y1, x2, y2):
+        size = self.cell_size
+        for cx in range(int(x1) // size, int(x2) // size + 1):
+            for cy in range(int(y1) // size, int(y2) // size + 1):
+                yield cx, cy
+
+    def insert(self, key, x1, y1, x2, y2):
+        if key in self._rects:
+            self.remove(key)
+        x1, x2 = sorted((x1, x2))
+        y1, y2 = sorted((y1, y2))
+        self._rects[key] = (x1, y1, x2, y2, (x2 - x1) * (y2 - y1))
+        for cell in self._cell_range(x1, y1, x2, y2):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key):
+        rect = self._rects.pop(key, None)
+        if not rect:
+            return
+        for cell in self._cell_range(*rect[:4]):
+            bucket = self._cells.get(cell)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
+
+    def query(self, x, y):
+        size = self.cell_size
+        bucket = self._cells.get((int(x) // size, int(y) // size), ())
+        hits = []
+        for key in bucket:
+            x1, y1, x2, y2, area = self._rects[key]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                hits.append((area, key))
+        hits.sort(key=lambda h: h[0])
+        return [key for _area, key in hits]
+
+
+class MapaModel:
+    """
+    Cache en memoria de un mapa de Incidencias Club: areas, maquinas e
+    incidencias indexadas por id y por nombre.
+
+    Se carga una vez al mostrar el mapa y se recarga (por partes) cuando
+    IncidenciasDB registra escrituras en el ambito correspondiente, de modo que
+    hover, seleccion y cabeceras no consultan la BD. Lo escrito desde otro
+    equipo se recoge con refresh(), al abrir el mapa y los paneles.
+    """
+
+    def __init__(self, db, mapa_id):
+        self.db = db
+        self.mapa_id = mapa_id
+        self._versions = {}
+        self.areas = {}
+        self.area_ids_by_name = {}
+        self.machines = {}
+        self.machine_ids_by_name = {}
+        self.incidencias = []
+        self._resumen = None
+        self.index = GridIndex()
+        self._load_layout()
+        self._load_incidencias()
+
+    def _load_layout(self):
+        self._versions["layout"] = self.db.versions["layout"]
+        self.areas = {}
+        self.area_ids_by_name = {}
+        self.index = GridIndex()
+        for row in self.db.list_areas(self.mapa_id):
+            self.areas[row[0]] = row
+            self.area_ids_by_name.setdefault(row[1], row[0])
+            self.index.insert(("area", row[0]), *row[2:6])
+        self.machines = {}
+        self.machine_ids_by_name = {}
+        for row in self.db.list_machines(self.mapa_id):
+            self.machines[row[0]] = row
+            self.machine_ids_by_name.setdefault(row[2], row[0])
+            self.index.insert(("machine", row[0]), *row[5:9])
+
+    def _load_incidencias(self):
+        self._versions["incidencias"] = self.db.versions["incidencias"]
+        self.incidencias = self.db.list_incidencias(self.mapa_id)
+        self._resumen = None
+
+    def _layout(self):
+        if self._versions.get("layout") != self.db.versions["layout"]:
+            self._load_layout()
+        return self
+
+    def refresh(self):
+        """
+        Recarga todo desde la BD (cambios hechos desde otro equipo). Devuelve
+        los ambitos que han cambiado: {"layout", "incidencias"} o parte.
+        """
+        areas, machines, incidencias = self.areas, self.machines, self.incidencias
+        self._load_layout()
+        self._load_incidencias()
+        cambios = set()
+        if self.areas != areas or self.machines != machines:
+            cambios.add("layout")
+        if self.incidencias != incidencias:
+            cambios.add("incidencias")
+        return cambios
+
+    # ------------------------------------------------------------------ areas
+    def list_areas(self):
+        """Filas (id, nombre, x1, y1, x2, y2, color) como IncidenciasDB.list_areas."""
+        return list(self._layout().areas.values())
+
+    def area(self, area_id):
+        return self._layout().areas.get(area_id)
+
+    def area_name(self, area_id):
+        row = self.area(area_id)
+        return row[1] if row else None
+
+    def area_id_by_name(self, nombre):
+        return self._layout().area_ids_by_name.get(nombre)
+
+    # --------------------------------------------------------------- maquinas
+    def list_machines(self):
+        """Filas como IncidenciasDB.list_machines (id, area_id, nombre, ..., area_nombre)."""
+        return list(self._layout().machines.values())
+
+    def machine(self, machine_id):
+        try:
+            return self._layout().machines.get(int(machine_id))
+        except (TypeError, ValueError):
+            return None
+
+    def machine_area_id(self, machine_id):
+        row = self.machine(machine_id)
+        return row[1] if row else None
+
+    def machine_id_by_name(self, nombre):
+        return self._layout().machine_ids_by_name.get(nombre)
+
+    # ------------------------------------------------------------- hit-test
+    def hit_test(self, x, y, kind=None, area_filter=None):
+        """
+        Devuelve ("machine", id) o ("area", id) del elemento mas interior que
+        contiene el punto: primero maquinas y despues areas. `kind` limita el
+        tipo buscado y `area_filter` reproduce la vista filtrada por area (solo
+        maquinas de esa area, areas ocultas).
+        """
+        hits = self._layout().index.query(x, y)
+        machines = [key for key in hits if key[0] == "machine"]
+        areas = [key for key in hits if key[0] == "area"]
+        if area_filter:
+            machines = [key for key in machines if self.machine_area_id(key[1]) == area_filter]
+            areas = []
+        if kind == "machine":
+            candidates = machines
+        elif kind == "area":
+            candidates = areas
+        else:
+            candidates = machines + areas
+        return candidates[0] if candidates else None
+
+    # ------------------------------------------------------------ incidencias
+    def list_incidencias(self):
+        if self._versions.get("incidencias") != self.db.versions["incidencias"]:
+            self._load_incidencias()
+        return list(self.incidencias)
+
+
+    def resumen(self):
+        """Conteos agrupados (area_id, maquina_id, estado, mes, total); ver IncidenciasDB.resumen_incidencias."""
+        if self._versions.get("incidencias") != self.db.versions["incidencias"]:
+            self._load_incidencias()
+        if self._resumen is None:
+            self._resumen = self.db.resumen_incidencias(self.mapa_id)
+        return self._resumen
+
+    def conteos(self, estados=None, mes=None):
+        """
+        Totales por area y por maquina ({id: n}, {id: n}) filtrando por
+        `estados` (None = todos) y opcionalmente por `mes` ('YYYY-MM').
+        """
+        por_area = {}
+        por_maquina = {}
+        for area_id, maquina_id, estado, mes_fila, total in self.resumen():
+            if estados is not None and estado not in estados:
+                continue
+            if mes is not None and mes_fila != mes:
+                continue
+            if area_id is not None:
+                por_area[area_id] = por_area.get(area_id, 0) + total
+            if maquina_id is not None:
+                por_maquina[maquina_id] = por_maquina.get(maquina_id, 0) + total
+        return por_area, por_maquina
+
+
+class MapaPrefetcher:
+    """
+    Precarga en segundo plano de mapas vecinos en una cache acotada (LRU).
+
+    `cargar(mapa_row)` se ejecuta en un hilo y devuelve lo que la interfaz
+    necesita para mostrar el mapa sin esperar (piramide de teselas, modelo...).
+    No debe tocar widgets de Tk.
+    """
+
+    def __init__(self, cargar, max_items=4):
+        self.cargar = cargar
+        self.max_items = max_items
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pendientes = queue.Queue()
+        self._en_cola = set()
+        self._generacion = 0
+        self._hilo = None
+
+    def get(self, mapa_row):
+        """Devuelve la entrada precargada del mapa, o None si no esta (o cambio la fila)."""
+        with self._lock:
+            item = self._cache.get(mapa_row[0])
+            if item is None or item[0] != tuple(mapa_row):
+                return None
+            self._cache.move_to_end(mapa_row[0])
+            return item[1]
+
+    def put(self, mapa_row, entrada):
+        with self._lock:
+            self._cache[mapa_row[0]] = (tuple(mapa_row), entrada)
+            self._cache.move_to_end(mapa_row[0])
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """Vacia la cache y descarta lo pendiente (p.ej. al recargar el listado de mapas)."""
+        with self._lock:
+            self._cache.clear()
+            self._en_cola.clear()
+            self._generacion += 1
+
+    def prefetch(self, mapa_rows):
+        with self._lock:
+            for row in mapa_rows:
+                mapa_id = row[0]
+                if mapa_id in self._cache or mapa_id in self._en_cola:
+                    continue
+                self._en_cola.add(mapa_id)
+                self._pendientes.put((self._generacion, tuple(row)))
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._trabajar, name="mapa-prefetch", daemon=True)
+                self._hilo.start()
+
+    def _trabajar(self):
+        while True:
+            try:
+                generacion, row = self._pendientes.get(timeout=5)
+            except queue.Empty:
+                with self._lock:
+                    if self._pendientes.empty():
+                        self._hilo = None
+                        return
+                continue
+            with self._lock:
+                vigente = generacion == self._generacion
+                self._en_cola.discard(row[0])
+            if not vigente:
+                continue
+            try:
+                entrada = self.cargar(row)
+            except Exception:
+                continue
+            if entrada is None:
+                continue
+            with self._lock:
+                if generacion != self._generacion:
+                    continue
+            self.put(row, entrada)
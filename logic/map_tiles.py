@@ -0,0 +1,161 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+
+TILE_SIZE = 256
+META_FILE = "meta.json"
+
+# Un lock por carpeta de piramide: si el precargador y la interfaz piden el
+# mismo mapa a la vez, el segundo espera y reutiliza lo generado.
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def _build_lock(root):
+    with _build_locks_guard:
+        return _build_locks.setdefault(root, threading.Lock())
+
+
+def cache_key(*parts):
+    """Clave estable (hash corto) para la carpeta de teselas de un mapa."""
+    raw = "|".join(str(p) for p in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+class TilePyramid:
+    """
+    Piramide de teselas de un mapa: el nivel 0 es la resolucion original y cada
+    nivel siguiente reduce a la mitad, hasta que el mapa cabe en una tesela.
+
+    Las teselas se guardan en disco (cache_dir/<key>/<nivel>/<tx>_<ty>.<ext>)
+    una sola vez; despues solo se decodifican las visibles, con un LRU acotado
+    de imagenes ya decodificadas.
+    """
+
+    def __init__(self, root, meta, max_decoded=128):
+        self.root = root
+        self.width = int(meta["width"])
+        self.height = int(meta["height"])
+        self.tile_size = int(meta.get("tile_size", TILE_SIZE))
+        self.levels = int(meta["levels"])
+        self.ext = meta.get("ext", "png")
+        self.sizes = [tuple(size) for size in meta["sizes"]]
+        self.max_decoded = max_decoded
+        self._decoded = OrderedDict()
+
+    @classmethod
+    def load_or_build(cls, cache_dir, key, loader, tile_size=TILE_SIZE, max_decoded=128):
+        """
+        Abre la piramide `key` si ya existe; si no, llama a `loader()` (que
+        devuelve una imagen PIL) y la genera. Las excepciones de `loader` se
+        propagan para que quien llama muestre el error.
+        """
+        root = os.path.join(cache_dir, key)
+        meta = cls._read_meta(root)
+        if meta is None:
+            with _build_lock(root):
+                meta = cls._read_meta(root)
+                if meta is None:
+                    meta = cls._build(root, loader(), tile_size)
+        return cls(root, meta, max_decoded=max_decoded)
+
+    @classmethod
+    def exists(cls, cache_dir, key):
+        return cls._read_meta(os.path.join(cache_dir, key)) is not None
+
+    @staticmethod
+    def _read_meta(root):
+        try:
+            with open(os.path.join(root, META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _build(root, img, tile_size):
+        if os.path.isdir(root):
+            shutil.rmtree(root, ignore_errors=True)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+        ext = "png" if has_alpha else "jpg"
+        level = 0
+        current = img
+        sizes = []
+        while True:
+            sizes.append([current.width, current.height])
+            level_dir = os.path.join(root, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            for ty in range(math.ceil(current.height / tile_size)):
+                for tx in range(math.ceil(current.width / tile_size)):
+                    box = (
+                        tx * tile_size,
+                        ty * tile_size,
+                        min((tx + 1) * tile_size, current.width),
+                        min((ty + 1) * tile_size, current.height),
+                    )
+                    tile = current.crop(box)
+                    path = os.path.join(level_dir, f"{tx}_{ty}.{ext}")
+                    if ext == "jpg":
+                        tile.save(path, format="JPEG", quality=90)
+                    else:
+                        tile.save(path, format="PNG")
+            if max(current.width, current.height) <= tile_size or min(current.width, current.height) < 2:
+                break
+            current = current.reduce(2)
+            level += 1
+        meta = {
+            "width": img.width,
+            "height": img.height,
+            "tile_size": tile_size,
+            "levels": level + 1,
+            "sizes": sizes,
+            "ext": ext,
+        }
+        # meta.json se escribe al final: si falta, la piramide se regenera.
+        with open(os.path.join(root, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return meta
+
+    def level_for_zoom(self, zoom):
+        """Nivel cuya resolucion es la menor que no queda por debajo del zoom pedido."""
+        if zoom >= 1:
+            return 0
+        level = int(math.floor(math.log2(1.0 / zoom)))
+        return max(0, min(self.levels - 1, level))
+
+    def level_size(self, level):
+        return self.sizes[level]
+
+    def visible_tiles(self, level, x1, y1, x2, y2):
+        """Teselas (tx, ty) del nivel que cortan el rectangulo dado en pixeles del nivel."""
+        w, h = self.level_size(level)
+        size = self.tile_size
+        tx1 = max(0, int(x1) // size)
+        ty1 = max(0, int(y1) // size)
+        tx2 = min(math.ceil(w / size) - 1, int(x2) // size)
+        ty2 = min(math.ceil(h / size) - 1, int(y2) // size)
+        return [(tx, ty) for ty in range(ty1, ty2 + 1) for tx in range(tx1, tx2 + 1)]
+
+    def get_tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        tile = self._decoded.get(key)
+        if tile is not None:
+            self._decoded.move_to_end(key)
+            return tile
+        path = os.path.join(self.root, str(level), f"{tx}_{ty}.{self.ext}")
+        try:
+            with Image.open(path) as src:
+                tile = src.copy()
+        except Exception:
+            return None
+        self._decoded[key] = tile
+        while len(self._decoded) > self.max_decoded:
+            self._decoded.popitem(last=False)
+        return tile
@@ -0,0 +1,70 @@
+from collections import namedtuple
+from datetime import datetime
+
+
+# Paso de migracion: `sqlite` y `postgres` son listas de sentencias SQL o
+# funciones fn(cur) que se ejecutan en orden. None = no aplica a ese motor.
+Migration = namedtuple("Migration", ["version", "nombre", "sqlite", "postgres"])
+
+
+def _init_table(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            componente TEXT,
+            version INTEGER,
+            nombre TEXT,
+            aplicada TEXT,
+            PRIMARY KEY(componente, version)
+        )
+        """
+    )
+
+
+def applied_versions(cur, componente, use_postgres):
+    _init_table(cur)
+    placeholder = "%s" if use_postgres else "?"
+    cur.execute(f"SELECT version FROM schema_migrations WHERE componente = {placeholder}", (componente,))
+    return {int(row[0]) for row in cur.fetchall()}
+
+
+def apply_migrations(cur, componente, migraciones, use_postgres):
+    """
+    Aplica en orden los pasos pendientes de `componente` y los registra en
+    schema_migrations. El commit lo hace quien llama. Devuelve las versiones aplicadas.
+    """
+    hechas = applied_versions(cur, componente, use_postgres)
+    placeholder = "%s" if use_postgres else "?"
+    aplicadas = []
+    for mig in sorted(migraciones, key=lambda m: m.version):
+        if mig.version in hechas:
+            continue
+        pasos = mig.postgres if use_postgres else mig.sqlite
+        for paso in pasos or []:
+            if callable(paso):
+                paso(cur)
+            else:
+                cur.execute(paso)
+        cur.execute(
+            "INSERT INTO schema_migrations (componente, version, nombre, aplicada) "
+            f"VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})",
+            (componente, mig.version, mig.nombre, datetime.now().strftime("%Y-%m-%d %H:%M")),
+        )
+        aplicadas.append(mig.version)
+    return aplicadas
+
+
+def sqlite_columns(cur, table):
+    """Columnas de una tabla SQLite, incluidas las generadas."""
+    cur.execute(f"PRAGMA table_xinfo({table})")
+    return {row[1] for row in cur.fetchall()}
+
+
+def sqlite_add_column(table, column, ddl):
+    """Paso idempotente: ALTER TABLE ADD COLUMN solo si la columna no existe."""
+
+    def _step(cur):
+        if column not in sqlite_columns(cur, table):
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+    return _step
@@ -1,34 +1,24 @@
 import json
 import uuid
 
-try:
-    import psycopg
-    from psycopg.types.json import Json
-except Exception:
-    psycopg = None
-    Json = None
+from logic.storage import Storage, cargar_psycopg
 
 
 class AppStateStore:
     def __init__(self, db_config):
         self.db_config = db_config or {}
-        self.use_postgres = bool(self.db_config.get("host"))
+        self.storage = Storage(db_config=self.db_config)
+        self.use_postgres = self.storage.use_postgres
         if self.use_postgres:
             self._init_db()
 
+    def close(self):
+        self.storage.close()
+
     def _connect(self):
         if not self.use_postgres:
             return None
-        if psycopg is None:
-            raise RuntimeError("psycopg no esta instalado. Instala psycopg para usar PostgreSQL.")
-        return psycopg.connect(
-            host=self.db_config.get("host"),
-            port=self.db_config.get("port"),
-            dbname=self.db_config.get("name"),
-            user=self.db_config.get("user"),
-            password=self.db_config.get("password"),
-            connect_timeout=5,
-        )
+        return self.storage.connect()
 
     def _init_db(self):
         with self._connect() as conn:
@@ -68,7 +58,12 @@ class AppStateStore:
     def set(self, key, value):
         if not self.use_postgres:
             return
-        payload = Json(value) if Json is not None else json.dumps(value)
+        if cargar_psycopg() is not None:
+            from psycopg.types.json import Json
+
+            payload = Json(value)
+        else:
+            payload = json.dumps(value)
         with self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
@@ -91,10 +86,10 @@ class AppStateStore:
             cur.execute("DELETE FROM app_state WHERE key=%s", (key,))
             conn.commit()
 
-    def put_blob(self, data, content_type="application/octet-stream"):
+    def put_blob(self, data, content_type="application/octet-stream", blob_id=None):
         if not self.use_postgres:
             return ""
-        blob_id = uuid.uuid4().hex
+        blob_id = blob_id or uuid.uuid4().hex
         with self._connect() as conn:
             cur = conn.cursor()
             cur.execute(
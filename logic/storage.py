@@ -0,0 +1,222 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+_psycopg = None
+
+
+def cargar_psycopg():
+    """psycopg importado bajo demanda (None si no esta instalado): solo lo necesita PostgreSQL."""
+    global _psycopg
+    if _psycopg is None:
+        try:
+            import psycopg
+        except Exception:
+            return None
+        _psycopg = psycopg
+    return _psycopg
+
+
+# Espera maxima (segundos) de SQLite cuando otro proceso tiene la escritura.
+BUSY_TIMEOUT = 10
+
+
+class Dialect:
+    """Diferencias de SQL entre motores; el SQL compilado se guarda en cache."""
+
+    def __init__(self, name, placeholder):
+        self.name = name
+        self.placeholder = placeholder
+        self._compiled = {}
+
+    @property
+    def is_postgres(self):
+        return self.name == "postgres"
+
+    def compile(self, sql):
+        """SQL escrito con `?` -> SQL del motor (una sola vez por sentencia)."""
+        compiled = self._compiled.get(sql)
+        if compiled is None:
+            compiled = sql if self.placeholder == "?" else sql.replace("?", self.placeholder)
+            self._compiled[sql] = compiled
+        return compiled
+
+
+SQLITE = Dialect("sqlite", "?")
+POSTGRES = Dialect("postgres", "%s")
+
+
+class _Sesion:
+    """
+    Lo que devuelve Storage.connect() para `with ... as conn`: usa la conexion
+    compartida y la serializa entre hilos. Fuera de Storage.transaction() el
+    bloque es su propia transaccion (BEGIN en SQLite, que si no confirmaria
+    cada sentencia por separado) y se confirma o deshace al salir; dentro,
+    deja commit/rollback a la transaccion exterior. Las escrituras deben ir
+    dentro de transaction() (BEGIN IMMEDIATE: espera al otro escritor en
+    vez de fallar al pasar de lectura a escritura).
+    """
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._conn = None
+
+    def __enter__(self):
+        self._storage._lock.acquire()
+        try:
+            self._conn = self._storage._conexion()
+            if self._storage._depth == 0:
+                self._storage._begin(self._conn)
+        except BaseException:
+            self._storage._lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self._storage._depth == 0:
+                if exc_type is None:
+                    self._storage._commit(self._conn)
+                else:
+                    self._storage._rollback(self._conn)
+        finally:
+            self._storage._lock.release()
+        return False
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def commit(self):
+        if self._storage._depth == 0:
+            self._storage._commit(self._conn)
+            self._storage._begin(self._conn)
+
+    def rollback(self):
+        if self._storage._depth == 0:
+            self._storage._rollback(self._conn)
+
+
+class Storage:
+    """
+    Capa comun de acceso a BD para ImpagosDB, IncidenciasDB y AppStateStore:
+    una conexion reutilizada por instancia (SQLite en WAL o PostgreSQL),
+    SQL compilado por dialecto y transacciones explicitas con transaction().
+    """
+
+    def __init__(self, db_path=None, db_config=None):
+        self.db_path = db_path
+        self.db_config = db_config or {}
+        self.use_postgres = bool(self.db_config.get("host"))
+        self.dialect = POSTGRES if self.use_postgres else SQLITE
+        self._conn = None
+        self._lock = threading.RLock()
+        self._depth = 0
+        self.foreign_keys = False
+
+    def sql(self, sql):
+        return self.dialect.compile(sql)
+
+    @property
+    def in_transaction(self):
+        return self._depth > 0
+
+    def _open(self):
+        if not self.use_postgres:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=BUSY_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+            if self.foreign_keys:
+                conn.execute("PRAGMA foreign_keys=ON")
+            return conn
+        psycopg = cargar_psycopg()
+        if psycopg is None:
+            raise RuntimeError("psycopg no esta instalado. Instala psycopg para usar PostgreSQL.")
+        return psycopg.connect(
+            host=self.db_config.get("host"),
+            port=self.db_config.get("port"),
+            dbname=self.db_config.get("name"),
+            user=self.db_config.get("user"),
+            password=self.db_config.get("password"),
+            connect_timeout=5,
+        )
+
+    def _conexion(self):
+        conn = self._conn
+        if conn is not None and self.use_postgres and (conn.closed or conn.broken):
+            self._conn = conn = None
+        if conn is None:
+            self._conn = conn = self._open()
+        return conn
+
+    def _begin(self, conn, inmediata=False):
+        """Abre la transaccion en SQLite (psycopg ya abre una implicita)."""
+        if self.use_postgres or conn.in_transaction:
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE" if inmediata else "BEGIN")
+        except sqlite3.OperationalError as e:
+            raise RuntimeError("Base de datos ocupada. Intentalo de nuevo en unos segundos.") from e
+
+    def _commit(self, conn):
+        if self.use_postgres or conn.in_transaction:
+            conn.commit()
+
+    def _rollback(self, conn):
+        try:
+            if self.use_postgres or conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            # Conexion rota: se descarta y la siguiente sesion abre otra.
+            self.close()
+
+    def connect(self):
+        return _Sesion(self)
+
+    def set_foreign_keys(self, activas):
+        """Activa/desactiva las claves ajenas de SQLite (fuera de transacciones)."""
+        with self._lock:
+            self.foreign_keys = bool(activas)
+            if self._conn is not None and not self.use_postgres:
+                self._conn.execute(f"PRAGMA foreign_keys={'ON' if activas else 'OFF'}")
+
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa todo lo que se ejecute dentro en una unica transaccion
+        (BEGIN IMMEDIATE en SQLite). Se puede anidar: solo la exterior confirma.
+        """
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            conn = self._conexion()
+            self._begin(conn, inmediata=True)
+            self._depth = 1
+            try:
+                yield
+            except BaseException:
+                self._rollback(conn)
+                raise
+            else:
+                self._commit(conn)
+            finally:
+                self._depth = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
@@ -1,12 +1,18 @@
+import time
+
+# Inicio del arranque (perfil en startup.log).
+_ARRANQUE = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 from PIL import Image, ImageTk
 import os
 import sys
 import json
+import numpy as np
 import pandas as pd
 import unicodedata
-import time
+import threading
 import uuid
 import tempfile
 import io
@@ -18,13 +24,24 @@ import shutil
 import random
 import traceback
 from logic.wizville import procesar_wizville
-from logic.accesos import procesar_salidas_pmr_no_autorizadas, procesar_accesos_dobles_ayer
+from logic.accesos import IndiceAccesos, procesar_salidas_pmr_no_autorizadas, procesar_accesos_dobles_ayer
 from logic.avanza_fit import obtener_avanza_fit
+from logic.clientes import DirectorioClientes, normalizar_movil
+from logic.colecciones import Coleccion, norm_clave
+from utils.exportar import exportar as exportar_hojas
 from utils.file_loader import load_data_file
+from utils.keyed_tree import KeyedTreeView
+from utils.sorting import OrdenCache, registrar_filas
+from utils.virtual_table import VirtualTable
 from logic.impagos import ImpagosDB
-from logic.incidencias import IncidenciasDB
+from logic.incidencias import IncidenciasDB, ReportesIndex
+from logic.incidencias_model import MapaModel, MapaPrefetcher
+from logic.map_tiles import TilePyramid, cache_key
+from logic.attachments import Adjuntos, MAX_LADO
 from logic.state_store import AppStateStore
 
+_DURACION_IMPORTS = time.perf_counter() - _ARRANQUE
+
 
 def get_app_dir():
     if getattr(sys, "frozen", False):
@@ -59,6 +76,17 @@ def _log_timing(label, elapsed):
         pass
 
 
+def _log_arranque(fases):
+    """Perfil de arranque [(fase, segundos)] en startup.log, junto a timings.log."""
+    try:
+        log_path = os.path.join(get_app_dir(), "startup.log")
+        detalle = " | ".join(f"{fase} {seg:.3f}s" for fase, seg in fases)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(f"{datetime.now().isoformat()} | {detalle}\n")
+    except Exception:
+        pass
+
+
 def get_default_folder():
     data = _read_config()
     path = data.get("carpeta_datos", "")
@@ -81,6 +109,14 @@ def get_data_dir():
     return os.path.normpath(path)
 
 
+def get_local_cache_dir(name):
+    """Carpeta de cache local del equipo (fuera de OneDrive)."""
+    base = os.environ.get("LOCALAPPDATA") or tempfile.gettempdir()
+    path = os.path.join(base, "AutomatismosResamania", name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
 def set_data_dir(path):
     data = _read_config()
     data["data_dir"] = os.path.normpath(path)
@@ -147,8 +183,13 @@ def get_security_code() -> str:
 
 
 class ResamaniaApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, arranque=(), inicio=None):
+        """
+        `arranque`: fases [(fase, segundos)] ya medidas por el lanzador
+        (arranque.py) e `inicio` su perf_counter inicial, para startup.log.
+        """
         super().__init__()
+        self._inicio = inicio if inicio is not None else _ARRANQUE
         self.title("AUTOMATISMOS RESAMANIA - JDM Developer - VERSIÓN 1.0 - SOFTWARE DE GESTIÓN ELABORADO POR JESÚS DÍAZ MARTÍN")
         self.state('zoomed')  # Pantalla completa al arrancar
         self.folder_path = get_default_folder()
@@ -165,6 +206,8 @@ class ResamaniaApp(tk.Tk):
                 self._invalid_default_folder = False
         self.dataframes = {}
         self.raw_accesos = None
+        self.accesos_indice = None
+        self._accesos_indice_hilo = None
         self.resumen_df = None
         self.data_dir = ""
         self.state_store = None
@@ -174,6 +217,7 @@ class ResamaniaApp(tk.Tk):
         self.prestamos = []
         self.clientes_ext_file = ""
         self.clientes_ext = []
+        self.directorio_clientes = DirectorioClientes()
         self.prestamos_filtro_activo = False
         self.incidencias_socios_file = ""
         self.incidencias_socios = []
@@ -198,6 +242,15 @@ class ResamaniaApp(tk.Tk):
         self.suspensiones_view = "ACTIVAS"
         self.suspensiones_cliente_filter = ""
         self.suspensiones_impagos_set = set()
+        # Indices en memoria de las listas de gestion; se invalidan al guardarlas (_state_set).
+        self.colecciones = {
+            "prestamos": Coleccion(self._parse_fecha_prestamo, "fecha"),
+            "incidencias_socios": Coleccion(self._socios_parse_dt, "fecha"),
+            "paypymes": Coleccion(self._socios_parse_dt, "fecha"),
+            "objetos_taquillas": Coleccion(self._taquillas_parse_dt, "fecha_extraccion"),
+            "bajas": Coleccion(self._bajas_parse_dt, "fecha_registro"),
+            "suspensiones": Coleccion(self._suspensiones_parse_dt, "fecha_registro"),
+        }
 
         # Felicitaciones (persistencia anual)
         self.felicitaciones_file = ""
@@ -212,6 +265,8 @@ class ResamaniaApp(tk.Tk):
         self.staff_write_areas = {"prestamos", "objetos_taquillas"}
         self._last_allowed_tab = None
         self._suppress_tab_guard = False
+        # Pestanas de gestion aun sin construir: {nombre: create_*_tab} (ver _construir_pestana).
+        self._pestanas_pendientes = {}
         # Alias por compatibilidad: algunos botones usan el nombre antiguo.
         self.nuevo_prestamo = self._prestamos_nuevo_prestamo
         self.prestamos_last_event = None
@@ -232,9 +287,24 @@ class ResamaniaApp(tk.Tk):
         self.incidencias_db = None
         self.incidencias_mapas = []
         self.incidencias_map_index = 0
-        self.incidencias_img = None
+        self.incidencias_tiles = None
+        self.incidencias_tile_items = {}
+        self.incidencias_tile_job = None
+        self.incidencias_zoom = 1.0
+        self.incidencias_canvas_size = (1200, 800)
+        self.incidencias_calor = False
+        self.incidencias_btn_calor = None
+        self.incidencias_prefetch = MapaPrefetcher(self._incidencias_precargar_mapa)
+        self.incidencias_reportes_idx = None
+        self.adjuntos = Adjuntos(
+            lambda: getattr(self, "state_store", None),
+            get_local_cache_dir("adjuntos"),
+            self._incidencias_resolve_reporte_path,
+            resolver_indexado=self._incidencias_resolve_reporte_indexado,
+        )
         self.incidencias_canvas = None
         self.incidencias_current_map = None
+        self.incidencias_model = None
         self.incidencias_area_items = {}
         self.incidencias_machine_items = {}
         self.incidencias_machine_area = {}
@@ -254,6 +324,9 @@ class ResamaniaApp(tk.Tk):
         self.incidencias_hover_blink_original = None
         self.incidencias_creador = None
         self.incidencias_pan_active = False
+        self.incidencias_hover_event = None
+        self.incidencias_hover_job = None
+        self.incidencias_hover_hit = None
 
         # Salidas PMR autorizados/advertidos
         self.pmr_autorizados_file = ""
@@ -275,7 +348,24 @@ class ResamaniaApp(tk.Tk):
         self._prompted_exports = False
         self.auto_refresh_enabled = self._state_get("auto_refresh_enabled", False, None)
 
+        t_widgets = time.perf_counter()
         self.create_widgets()
+        self._arranque = list(arranque) + [
+            ("imports", _DURACION_IMPORTS),
+            ("widgets", time.perf_counter() - t_widgets),
+        ]
+        self._arranque_t = time.perf_counter()
+        # Los datos se cargan cuando la ventana ya esta pintada y responde.
+        self.after_idle(self._carga_inicial)
+        self.after(500, self.update_blink_states)
+        if self.auto_refresh_enabled:
+            self._schedule_auto_refresh()
+
+    def _carga_inicial(self):
+        """Carga de datos del arranque (tras el primer pintado); cierra el perfil en startup.log."""
+        self.update_idletasks()
+        self._arranque.append(("primer_pintado", time.perf_counter() - self._arranque_t))
+        t_datos = time.perf_counter()
         if self._invalid_default_folder:
             messagebox.showwarning(
                 "Carpeta no encontrada",
@@ -299,9 +389,9 @@ class ResamaniaApp(tk.Tk):
                         self._set_last_refresh()
                 else:
                     self.after(200, self._prompt_exports_folder)
-        self.after(500, self.update_blink_states)
-        if self.auto_refresh_enabled:
-            self._schedule_auto_refresh()
+        self._arranque.append(("datos", time.perf_counter() - t_datos))
+        self._arranque.append(("total", time.perf_counter() - self._inicio))
+        _log_arranque(self._arranque)
 
     def _role_label(self, area):
         labels = {
@@ -416,6 +506,9 @@ class ResamaniaApp(tk.Tk):
             return default
 
     def _state_set(self, key, value, file_path=None):
+        coleccion = getattr(self, "colecciones", {}).get(key)
+        if coleccion is not None:
+            coleccion.invalidar()
         store = getattr(self, "state_store", None)
         if store and store.use_postgres:
             store.set(key, value)
@@ -435,7 +528,8 @@ class ResamaniaApp(tk.Tk):
     def _blob_id_from_ref(self, value):
         return value.split(":", 1)[1] if self._is_blob_ref(value) else ""
 
-    def _store_image_blob(self, ruta, allow_png=False):
+    def _store_image_blob(self, ruta, allow_png=False, max_lado=MAX_LADO, miniatura=True):
+        """Guarda una imagen en BD como adjunto (principal acotada + miniatura)."""
         store = getattr(self, "state_store", None)
         if not store or not store.use_postgres:
             return ""
@@ -443,13 +537,7 @@ class ResamaniaApp(tk.Tk):
         if ext not in (".jpg", ".jpeg") and not (allow_png and ext == ".png"):
             return ""
         try:
-            img = Image.open(ruta)
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            buf = io.BytesIO()
-            img.save(buf, format="JPEG", quality=80, optimize=True)
-            blob_id = store.put_blob(buf.getvalue(), content_type="image/jpeg")
-            return self._blob_ref(blob_id)
+            return self.adjuntos.guardar_blob(ruta, max_lado=max_lado, miniatura=miniatura)
         except Exception:
             return ""
 
@@ -521,6 +609,7 @@ class ResamaniaApp(tk.Tk):
         self.btn_auto_refresh.pack(side=tk.LEFT, padx=6)
         self._update_auto_refresh_button()
         tk.Button(botones_frame, text="Exportar a Excel", command=self.exportar_excel).pack(side=tk.LEFT, padx=10)
+        tk.Button(botones_frame, text="Exportar todo", command=self.exportar_todo).pack(side=tk.LEFT, padx=4)
         tk.Button(botones_frame, text="INCIDENCIAS CLUB", command=self.ir_a_incidencias_club, bg="#424242", fg="white").pack(side=tk.LEFT, padx=10)
         tk.Button(botones_frame, text="GESTION CLIENTES", command=self.mostrar_gestion_clientes, bg="#c5e1a5", fg="black").pack(side=tk.LEFT, padx=10)
         tk.Button(botones_frame, text="PRESTAMOS", command=self.ir_a_prestamos, bg="#ffcc80", fg="black").pack(side=tk.LEFT, padx=10)
@@ -618,6 +707,17 @@ class ResamaniaApp(tk.Tk):
         self.tab_icons = {}
 
         self.tabs = {}
+        constructores = {
+            "Prestamos": self.create_prestamos_tab,
+            "Incidencias Socios": self.create_incidencias_socios_tab,
+            "PayPymes": self.create_paypymes_tab,
+            "Objetos Taquillas": self.create_objetos_taquillas_tab,
+            "Gestion Bajas": self.create_bajas_tab,
+            "Gestion Suspensiones": self.create_suspensiones_tab,
+            "Staff": self.create_staff_tab,
+            "Impagos": self.create_impagos_tab,
+            "Incidencias Club": self.create_incidencias_tab,
+        }
         ocultar_tabs = {
             "Salidas PMR No Autorizadas",
             "Accesos Dobles Ayer",
@@ -643,24 +743,9 @@ class ResamaniaApp(tk.Tk):
                 self.create_accesos_tab(tab)
             # elif tab_name == "Servicios":
             #     self.create_servicios_tab(tab)
-            elif tab_name == "Prestamos":
-                self.create_prestamos_tab(tab)
-            elif tab_name == "Incidencias Socios":
-                self.create_incidencias_socios_tab(tab)
-            elif tab_name == "PayPymes":
-                self.create_paypymes_tab(tab)
-            elif tab_name == "Objetos Taquillas":
-                self.create_objetos_taquillas_tab(tab)
-            elif tab_name == "Gestion Bajas":
-                self.create_bajas_tab(tab)
-            elif tab_name == "Gestion Suspensiones":
-                self.create_suspensiones_tab(tab)
-            elif tab_name == "Staff":
-                self.create_staff_tab(tab)
-            elif tab_name == "Impagos":
-                self.create_impagos_tab(tab)
-            elif tab_name == "Incidencias Club":
-                self.create_incidencias_tab(tab)
+            elif tab_name in constructores:
+                # Las pestanas de gestion se construyen al abrirlas por primera vez.
+                self._pestanas_pendientes[tab_name] = constructores[tab_name]
             else:
                 self.create_table(tab)
             if tab_name in ocultar_tabs:
@@ -669,6 +754,34 @@ class ResamaniaApp(tk.Tk):
                 self.notebook.hide(tab)
         self._apply_role_ui()
 
+    def _construir_pestana(self, tab_name):
+        """
+        Construye una pestana de gestion la primera vez que se abre y pinta
+        sus datos (las listas ya estan cargadas; los refrescar_* no hacen
+        nada mientras no existe el arbol). Devuelve el frame de la pestana.
+        """
+        constructor = self._pestanas_pendientes.pop(tab_name, None)
+        tab = self.tabs.get(tab_name)
+        if constructor is None or tab is None:
+            return tab
+        t0 = time.perf_counter()
+        constructor(tab)
+        if tab_name == "Prestamos":
+            self.refrescar_prestamos_tree()
+        elif tab_name == "Impagos" and self.impagos_db:
+            self.refresh_impagos_view()
+            self._update_impagos_blinks()
+        self._apply_role_ui()
+        _log_timing(f"build_tab {tab_name}", time.perf_counter() - t0)
+        return tab
+
+    def _abrir_pestana(self, tab_name):
+        """Construye (si hace falta) y selecciona una pestana; devuelve su frame o None."""
+        tab = self._construir_pestana(tab_name)
+        if tab:
+            self.notebook.select(tab)
+        return tab
+
     def create_table(self, tab, parent=None):
         container_parent = parent or tab
         container = tk.Frame(container_parent)
@@ -687,22 +800,15 @@ class ResamaniaApp(tk.Tk):
         hscrollbar.grid(row=1, column=0, sticky="ew")
         tree.configure(xscrollcommand=hscrollbar.set)
 
-        def sort_column(col, reverse):
-            datos = [(tree.set(k, col), k) for k in tree.get_children('')]
-            try:
-                datos.sort(key=lambda t: float(t[0].replace(",", ".")), reverse=reverse)
-            except ValueError:
-                datos.sort(key=lambda t: t[0], reverse=reverse)
-            for index, (_, k) in enumerate(datos):
-                tree.move(k, '', index)
-            tree.heading(col, command=lambda: sort_column(col, not reverse))
-
         tree.bind("<Control-c>", lambda e: self.copiar_celda(e, tree))
         menu = tk.Menu(tree, tearoff=0)
         menu.add_command(label="Copiar", command=lambda: self.copiar_celda(tree.event_context, tree))
         tree.bind("<Button-3>", lambda e: self.mostrar_menu(e, menu, tree))
 
         tab.tree = tree
+        # Las tablas de resultados se pintan en modo virtual (ver mostrar_en_tabla).
+        tab.virtual = VirtualTable(tree, scrollbar)
+        tree.virtual = tab.virtual
 
     def copiar_celda(self, event, tree):
         seleccion = tree.selection()
@@ -1089,9 +1195,7 @@ class ResamaniaApp(tk.Tk):
         if self.accesos_grupo_actual != "Salidas PMR No Autorizadas":
             messagebox.showwarning("PMR", "Selecciona primero 'Salidas PMR No Autorizadas'.")
             return
-        tree = self.tabs["Accesos"].tree
-        rows = [tree.item(i)["values"] for i in tree.get_children()]
-        columns = list(tree["columns"])
+        columns, rows = self._tabla_filas("Accesos")
         idx_email = self._pmr_get_col_index(columns, "Correo electronico")
         idx_codigo = self._pmr_get_col_index(columns, "Numero de cliente")
         idx_nombre = self._pmr_get_col_index(columns, "Nombre")
@@ -1220,17 +1324,13 @@ class ResamaniaApp(tk.Tk):
                         row["Apellidos"] = rec.get(colmap.get("APELLIDOS", ""), "")
                         row["Correo electronico"] = rec.get(colmap.get("CORREO ELECTRONICO", ""), "")
                         row["Movil"] = rec.get(colmap.get("MOVIL", ""), "")
-            if self.resumen_df is not None and self.resumen_df is not None:
-                colmap2 = {self._pmr_norm(c): c for c in self.resumen_df.columns}
-                col_codigo2 = colmap2.get("NUMERO DE CLIENTE") or colmap2.get("NRO DE CLIENTE")
-                if col_codigo2 and not row["Nombre"]:
-                    match2 = self.resumen_df[self.resumen_df[col_codigo2].astype(str).str.strip() == codigo]
-                    if not match2.empty:
-                        rec2 = match2.iloc[0]
-                        row["Nombre"] = rec2.get(colmap2.get("NOMBRE", ""), row["Nombre"])
-                        row["Apellidos"] = rec2.get(colmap2.get("APELLIDOS", ""), row["Apellidos"])
-                        row["Correo electronico"] = rec2.get(colmap2.get("CORREO ELECTRONICO", ""), row["Correo electronico"])
-                        row["Movil"] = rec2.get(colmap2.get("MOVIL", ""), row["Movil"])
+            if not row["Nombre"]:
+                rec2 = self._directorio().get(codigo)
+                if rec2:
+                    row["Nombre"] = rec2["nombre"]
+                    row["Apellidos"] = rec2["apellidos"]
+                    row["Correo electronico"] = rec2["email"]
+                    row["Movil"] = rec2["movil"]
             data.append(row)
         df = pd.DataFrame(data)
         self.accesos_grupo_actual = "Salidas PMR Autorizados"
@@ -1310,17 +1410,13 @@ class ResamaniaApp(tk.Tk):
                         row["Apellidos"] = rec.get(colmap.get("APELLIDOS", ""), "")
                         row["Correo electronico"] = rec.get(colmap.get("CORREO ELECTRONICO", ""), "")
                         row["Movil"] = rec.get(colmap.get("MOVIL", ""), "")
-            if self.resumen_df is not None:
-                colmap2 = {self._pmr_norm(c): c for c in self.resumen_df.columns}
-                col_codigo2 = colmap2.get("NUMERO DE CLIENTE") or colmap2.get("NRO DE CLIENTE")
-                if col_codigo2 and not row["Nombre"]:
-                    match2 = self.resumen_df[self.resumen_df[col_codigo2].astype(str).str.strip() == codigo]
-                    if not match2.empty:
-                        rec2 = match2.iloc[0]
-                        row["Nombre"] = rec2.get(colmap2.get("NOMBRE", ""), row["Nombre"])
-                        row["Apellidos"] = rec2.get(colmap2.get("APELLIDOS", ""), row["Apellidos"])
-                        row["Correo electronico"] = rec2.get(colmap2.get("CORREO ELECTRONICO", ""), row["Correo electronico"])
-                        row["Movil"] = rec2.get(colmap2.get("MOVIL", ""), row["Movil"])
+            if not row["Nombre"]:
+                rec2 = self._directorio().get(codigo)
+                if rec2:
+                    row["Nombre"] = rec2["nombre"]
+                    row["Apellidos"] = rec2["apellidos"]
+                    row["Correo electronico"] = rec2["email"]
+                    row["Movil"] = rec2["movil"]
             data.append(row)
         df = pd.DataFrame(data)
         self.accesos_grupo_actual = "Accesos Dobles Autorizados"
@@ -1475,9 +1571,8 @@ class ResamaniaApp(tk.Tk):
 
     def ir_a_incidencias_club(self):
         self.ocultar_gestion_clientes()
-        tab = self.tabs.get("Incidencias Club")
+        tab = self._abrir_pestana("Incidencias Club")
         if tab:
-            self.notebook.select(tab)
             # Vista por defecto: pendientes y vistas.
             self.incidencias_filtro_estado = "VISTO_PENDIENTE"
             if hasattr(self, "incidencias_canvas") and self.incidencias_canvas:
@@ -1486,14 +1581,12 @@ class ResamaniaApp(tk.Tk):
 
     def ir_a_prestamos(self):
         self.ocultar_gestion_clientes()
-        tab = self.tabs.get("Prestamos")
-        if tab:
-            self.notebook.select(tab)
+        self._abrir_pestana("Prestamos")
 
     def ir_a_incidencias_socios(self):
         if not self._require_manager_access("Incidencias socios"):
             return
-        tab = self.tabs.get("Incidencias Socios")
+        tab = self._construir_pestana("Incidencias Socios")
         if tab:
             self.incidencias_socios_filtro = "VISTO_PENDIENTE"
             self.incidencias_socios_filtro_codigo = None
@@ -1505,27 +1598,21 @@ class ResamaniaApp(tk.Tk):
             return
         if not self._require_manager_access("Gestion bajas"):
             return
-        tab = self.tabs.get("Gestion Bajas")
-        if tab:
-            self.notebook.select(tab)
+        self._abrir_pestana("Gestion Bajas")
 
     def ir_a_gestion_suspensiones(self):
         if not self._security_pin_ok():
             return
         if not self._require_manager_access("Gestion suspensiones"):
             return
-        tab = self.tabs.get("Gestion Suspensiones")
-        if tab:
-            self.notebook.select(tab)
+        self._abrir_pestana("Gestion Suspensiones")
 
     def ir_a_paypymes(self):
         if not self._security_pin_ok():
             return
         if not self._require_manager_access("PayPymes"):
             return
-        tab = self.tabs.get("PayPymes")
-        if tab:
-            self.notebook.select(tab)
+        self._abrir_pestana("PayPymes")
 
     def select_folder(self):
         if not self._require_manager_access("Seleccionar carpeta"):
@@ -1561,17 +1648,30 @@ class ResamaniaApp(tk.Tk):
         self.suspensiones_file = os.path.join(self.data_dir, "suspensiones.json")
         self.felicitaciones_file = os.path.join(self.data_dir, "felicitaciones.json")
         self.avanza_fit_envios_file = os.path.join(self.data_dir, "avanza_fit_envios.json")
-        db_config = get_db_config()
-        self.impagos_db = ImpagosDB(os.path.join(self.data_dir, "impagos.db"), db_config=db_config)
+        self._abrir_bases(get_db_config())
         self.staff_file = os.path.join(self.data_dir, "staff.json")
-        self.incidencias_db = IncidenciasDB(os.path.join(self.data_dir, "incidencias.db"), db_config=db_config)
-        self.state_store = AppStateStore(db_config)
         self.pmr_autorizados_file = os.path.join(self.data_dir, "pmr_autorizados.json")
         self.pmr_advertencias_file = os.path.join(self.data_dir, "pmr_advertencias.json")
         self.dobles_autorizados_file = os.path.join(self.data_dir, "dobles_autorizados.json")
         if hasattr(self, "incidencias_canvas") and self.incidencias_canvas:
             self.incidencias_cargar_listado_mapas()
 
+    def _abrir_bases(self, db_config):
+        """
+        Crea ImpagosDB, IncidenciasDB y AppStateStore para la carpeta de datos
+        y la config de BD actuales, cerrando antes las conexiones de los anteriores.
+        """
+        for nombre in ("impagos_db", "incidencias_db", "state_store"):
+            anterior = getattr(self, nombre, None)
+            if anterior is not None:
+                try:
+                    anterior.close()
+                except Exception:
+                    pass
+        self.impagos_db = ImpagosDB(os.path.join(self.data_dir, "impagos.db"), db_config=db_config)
+        self.incidencias_db = IncidenciasDB(os.path.join(self.data_dir, "incidencias.db"), db_config=db_config)
+        self.state_store = AppStateStore(db_config)
+
     def _cleanup_local_data_dir(self):
         local_dir = os.path.normpath(os.path.join(get_app_dir(), "data"))
         target_dir = os.path.normpath(self.data_dir or "")
@@ -1713,10 +1813,9 @@ class ResamaniaApp(tk.Tk):
             try:
                 set_db_config(host, port, name, user, password)
                 if self.data_dir:
-                    db_cfg = get_db_config()
-                    self.impagos_db = ImpagosDB(os.path.join(self.data_dir, "impagos.db"), db_config=db_cfg)
-                    self.incidencias_db = IncidenciasDB(os.path.join(self.data_dir, "incidencias.db"), db_config=db_cfg)
-                    self.state_store = AppStateStore(db_cfg)
+                    self._abrir_bases(get_db_config())
+                    if getattr(self, "incidencias_canvas", None):
+                        self.incidencias_cargar_listado_mapas()
                 messagebox.showinfo("Config BD", "Configuracion guardada.", parent=win)
                 win.destroy()
             except Exception as e:
@@ -1793,10 +1892,14 @@ class ResamaniaApp(tk.Tk):
             resumen = load_data_file(self.folder_path, "RESUMEN CLIENTE")
             _log_timing("load_csv_resumen", time.perf_counter() - t_resumen_start)
             self.resumen_df = resumen.copy()
+            self.directorio_clientes.cargar_resumen(self.resumen_df)
+            self.directorio_clientes.usar_externos(self.clientes_ext)
+            threading.Thread(target=self.directorio_clientes.preparar_busqueda, daemon=True).start()
             t_accesos_start = time.perf_counter()
             accesos = load_data_file(self.folder_path, "ACCESOS")
             _log_timing("load_csv_accesos", time.perf_counter() - t_accesos_start)
             self.raw_accesos = accesos.copy()
+            self._preparar_indice_accesos()
             t_impagos_start = time.perf_counter()
             incidencias = load_data_file(self.folder_path, "IMPAGOS")
             _log_timing("load_csv_impagos", time.perf_counter() - t_impagos_start)
@@ -2171,8 +2274,9 @@ class ResamaniaApp(tk.Tk):
         self._schedule_auto_refresh()
 
     def mostrar_en_tabla(self, tab_name, df, color=None):
-        # Guarda el ultimo dataframe mostrado para poder reutilizarlo (ej. enviar emails)
-        self.dataframes[tab_name] = df.copy()
+        # Guarda el ultimo dataframe mostrado para poder reutilizarlo (ej. enviar emails).
+        # No se copia: la tabla virtual lo usa como almacen y solo pinta las filas visibles.
+        self.dataframes[tab_name] = df
         tab = self.tabs[tab_name]
         tree = tab.tree
 
@@ -2188,30 +2292,95 @@ class ResamaniaApp(tk.Tk):
         tree.tag_configure("rojo", background="#f8d7da")
         tree.tag_configure("pmr_reincidente", background="#ffe0b2")
 
-        for _, row in df.iterrows():
-            valores = list(row)
-            tag = ""
-            if "D?as desde alta" in df.columns:
-                if row["D?as desde alta"] == 16:
-                    tag = "amarillo"
-                elif row["D?as desde alta"] == 180:
-                    tag = "rojo"
-            if "Reincidente" in df.columns:
-                try:
-                    if bool(row["Reincidente"]):
-                        tag = "pmr_reincidente"
-                except Exception:
-                    pass
-            tree.insert("", "end", values=valores, tags=(tag,))
+        tab.virtual.set_data(df, self._tabla_tags(df))
+
+    @staticmethod
+    def _tabla_tags(df):
+        """Etiqueta de color por fila, calculada por columnas (sin recorrer filas)."""
+        tags = np.full(len(df), "", dtype=object)
+        if "D?as desde alta" in df.columns:
+            dias = df["D?as desde alta"]
+            tags[(dias == 16).to_numpy()] = "amarillo"
+            tags[(dias == 180).to_numpy()] = "rojo"
+        if "Reincidente" in df.columns:
+            try:
+                tags[df["Reincidente"].to_numpy().astype(bool)] = "pmr_reincidente"
+            except Exception:
+                pass
+        return tags
+
+    def _tabla_filas(self, tab_name):
+        """
+        (columnas, filas) de una pestana en el orden mostrado: del DataFrame si
+        es virtual, si no de las filas registradas (registrar_filas) con sus
+        valores originales. Solo lo no registrado se lee de las celdas.
+        """
+        tab = self.tabs[tab_name]
+        virtual = getattr(tab, "virtual", None)
+        if virtual is not None and len(virtual):
+            return list(virtual.df.columns), virtual.view_values()
+        tree = getattr(tab, "tree", None)
+        if tree is None:
+            # Pestana de gestion aun sin construir.
+            return [], []
+        registradas = dict(getattr(tree, "filas", None) or ())
+        filas = []
+        for iid in tree.get_children():
+            values = registradas.get(iid)
+            filas.append(list(values) if values is not None else tree.item(iid)["values"])
+        return list(tree["columns"]), filas
+
+    def _tabla_df(self, tab_name):
+        """
+        DataFrame de una pestana en el orden mostrado, sacado de los datos de
+        respaldo (conserva tipos y ceros a la izquierda): el DataFrame de la
+        tabla virtual o las filas registradas de las pestanas de gestion.
+        """
+        tab = self.tabs[tab_name]
+        virtual = getattr(tab, "virtual", None)
+        if virtual is not None and len(virtual):
+            return virtual.view_df()
+        columnas, filas = self._tabla_filas(tab_name)
+        return pd.DataFrame(filas, columns=columnas)
+
+    def _coleccion(self, nombre):
+        """Coleccion indexada de la lista de gestion `nombre` (self.<nombre>)."""
+        return self.colecciones[nombre].usar(getattr(self, nombre))
+
+    def _vista_keyed(self, tree):
+        """KeyedTreeView asociado a un Treeview de gestion (se crea la primera vez)."""
+        vista = getattr(tree, "keyed", None)
+        if vista is None:
+            vista = tree.keyed = KeyedTreeView(tree)
+        return vista
 
     def sort_column(self, tree, col, reverse):
-        datos = [(tree.set(k, col), k) for k in tree.get_children('')]
-        try:
-            datos.sort(key=lambda t: float(t[0].replace(",", ".")), reverse=reverse)
-        except ValueError:
-            datos.sort(key=lambda t: t[0], reverse=reverse)
-        for index, (_, k) in enumerate(datos):
-            tree.move(k, '', index)
+        """
+        Ordena por columna sobre los datos de respaldo (DataFrame de la tabla
+        virtual o filas registradas) con claves por tipo: numeros, fechas
+        dd/mm/yyyy y texto sin acentos. Solo cambia el orden de la vista.
+        """
+        virtual = getattr(tree, "virtual", None)
+        if virtual is not None and len(virtual):
+            virtual.ordenar(col, reverse)
+            tree.heading(col, command=lambda: self.sort_column(tree, col, not reverse))
+            return
+        hijos = tree.get_children("")
+        idx = list(tree["columns"]).index(col)
+        filas = getattr(tree, "filas", None)
+        if filas is not None:
+            iids = [iid for iid, _values in filas]
+            perm = tree.ordenes.orden(col, lambda: [values[idx] for _iid, values in filas], reverse)
+        else:
+            iids = list(hijos)
+            perm = OrdenCache().orden(col, lambda: [tree.item(k, "values")[idx] for k in iids], reverse)
+        presentes = set(hijos)
+        orden = [iids[i] for i in perm if iids[i] in presentes]
+        if len(orden) != len(presentes):
+            vistos = set(orden)
+            orden += [k for k in hijos if k not in vistos]
+        # Una sola llamada a Tk reordena todas las filas.
+        tree.set_children("", *orden)
         tree.heading(col, command=lambda: self.sort_column(tree, col, not reverse))
 
     # -----------------------------
@@ -2223,8 +2392,8 @@ class ResamaniaApp(tk.Tk):
 
         top = tk.Frame(frm)
         top.pack(fill="x", pady=4)
-        tk.Label(top, text="Numero de cliente:").pack(side="left")
-        self.prestamo_codigo = tk.Entry(top, width=14)
+        tk.Label(top, text="Cliente (numero, nombre, email o movil):").pack(side="left")
+        self.prestamo_codigo = tk.Entry(top, width=22)
         self.prestamo_codigo.pack(side="left", padx=5)
         tk.Button(top, text="Buscar", command=self.buscar_cliente_prestamo).pack(side="left", padx=5)
         tk.Button(top, text="Editar cliente externo", command=self.editar_cliente_manual).pack(side="left", padx=5)
@@ -2352,17 +2521,85 @@ class ResamaniaApp(tk.Tk):
         except Exception:
             pass
 
+    def _directorio(self):
+        """Directorio de clientes (RESUMEN CLIENTE + clientes_ext) compartido por las pestanas."""
+        return self.directorio_clientes.usar_externos(self.clientes_ext)
+
+    def _cliente_por_codigo(self, codigo):
+        """Cliente {codigo, nombre, apellidos, email, movil normalizado} o None."""
+        rec = self._directorio().get(codigo)
+        if not rec:
+            return None
+        cliente = {campo: rec[campo] for campo in ("nombre", "apellidos", "email")}
+        cliente["codigo"] = str(codigo).strip()
+        cliente["movil"] = self._normalizar_movil(rec["movil"])
+        return cliente
+
+    def _cliente_info(self, codigo):
+        """Datos de contacto tal cual (sin normalizar el movil) o {} si no existe."""
+        rec = self._directorio().get(codigo) if str(codigo or "").strip() else None
+        if not rec:
+            return {}
+        return {campo: rec[campo] for campo in ("nombre", "apellidos", "email", "movil")}
+
     def _normalizar_movil(self, movil):
-        if not movil:
-            return ""
-        mov = "".join(ch for ch in str(movil) if ch.isdigit())
-        # Quita prefijo 34 si viene duplicado y re-aplica una sola vez
-        if mov.startswith("34"):
-            mov = mov[2:]
-        mov = mov.lstrip("0")
-        if mov:
-            mov = "34" + mov
-        return mov
+        return normalizar_movil(movil)
+
+    def _resolver_cliente(self, texto, titulo, entry=None):
+        """
+        Numero de cliente a partir de lo escrito en un buscador: un numero se
+        devuelve tal cual (exista o no); un nombre, email o movil se busca en
+        el directorio y, si hay varias coincidencias, se elige en una lista.
+        El numero elegido se escribe en `entry`. None si se cancela.
+        """
+        texto = str(texto or "").strip()
+        directorio = self._directorio()
+        if not texto or directorio.get(texto) or texto.isdigit() and len(texto) < 9:
+            return texto
+        resultados = directorio.buscar(texto)
+        if not resultados:
+            if texto.isdigit():
+                return texto
+            messagebox.showinfo(titulo, f"No se encontraron clientes para '{texto}'.", parent=self)
+            return None
+        if len(resultados) == 1 or resultados[0]["puntuacion"] >= 1.5 > resultados[1]["puntuacion"]:
+            codigo = resultados[0]["codigo"]
+        else:
+            codigo = self._elegir_cliente(titulo, texto, resultados)
+        if codigo and entry is not None:
+            entry.delete(0, tk.END)
+            entry.insert(0, codigo)
+        return codigo
+
+    def _elegir_cliente(self, titulo, texto, resultados):
+        win = tk.Toplevel(self)
+        win.title(titulo)
+        win.transient(self)
+        tk.Label(win, text=f"Clientes que coinciden con '{texto}':").pack(padx=10, pady=(10, 4), anchor="w")
+        lista = tk.Listbox(win, width=90, height=min(12, len(resultados)), activestyle="dotbox")
+        lista.pack(padx=10, pady=4, fill="both", expand=True)
+        for rec in resultados:
+            nombre = f"{rec.get('nombre', '')} {rec.get('apellidos', '')}".strip()
+            lista.insert(tk.END, f"{rec['codigo']}  |  {nombre}  |  {rec.get('email', '')}  |  {rec.get('movil', '')}")
+        lista.selection_set(0)
+        lista.activate(0)
+        lista.focus_set()
+        res = {"codigo": None}
+
+        def aceptar(_e=None):
+            sel = lista.curselection()
+            if sel:
+                res["codigo"] = resultados[sel[0]]["codigo"]
+            win.destroy()
+
+        tk.Button(win, text="Aceptar", command=aceptar).pack(pady=6)
+        lista.bind("<Double-Button-1>", aceptar)
+        win.bind("<Return>", aceptar)
+        win.bind("<Escape>", lambda _e: win.destroy())
+        self._incidencias_center_window(win)
+        win.grab_set()
+        win.wait_window()
+        return res["codigo"]
 
     def _pedir_campo(self, titulo, prompt, obligatorio=True, validar_nombre=False):
         self._bring_to_front()
@@ -2397,16 +2634,12 @@ class ResamaniaApp(tk.Tk):
                 return None
             codigo = str(codigo).strip()
 
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            if col_codigo:
-                if any(str(val).strip() == codigo for val in self.resumen_df[col_codigo].fillna("")):
-                    messagebox.showwarning(
-                        "No permitido",
-                        "Este cliente ya existe en RESUMEN CLIENTE y no se puede agregar manualmente."
-                    )
-                    return None
+        if self._directorio().en_resumen(codigo):
+            messagebox.showwarning(
+                "No permitido",
+                "Este cliente ya existe en RESUMEN CLIENTE y no se puede agregar manualmente."
+            )
+            return None
 
         nombre = self._incidencias_prompt_text("Cliente manual", "Nombre:")
         if nombre is None or not nombre.strip():
@@ -2447,16 +2680,12 @@ class ResamaniaApp(tk.Tk):
                 return
             codigo = str(codigo).strip()
 
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            if col_codigo:
-                if any(str(val).strip() == codigo for val in self.resumen_df[col_codigo].fillna("")):
-                    messagebox.showwarning(
-                        "No permitido",
-                        "Este cliente existe en RESUMEN CLIENTE y no se puede editar manualmente."
-                    )
-                    return
+        if self._directorio().en_resumen(codigo):
+            messagebox.showwarning(
+                "No permitido",
+                "Este cliente existe en RESUMEN CLIENTE y no se puede editar manualmente."
+            )
+            return
 
         cliente_actual = next((c for c in self.clientes_ext if c.get("codigo") == codigo), None)
         if not cliente_actual:
@@ -2495,61 +2724,38 @@ class ResamaniaApp(tk.Tk):
         if not codigo:
             messagebox.showwarning("Sin numero", "Introduce el numero de cliente.")
             return
+        codigo = self._resolver_cliente(codigo, "Prestamos", self.prestamo_codigo)
+        if not codigo:
+            return
 
-        cliente = None
-        fila = None
-
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            col_nom = colmap.get("NOMBRE")
-            col_ape = colmap.get("APELLIDOS")
-            col_mail = colmap.get("CORREO ELECTRONICO") or colmap.get("EMAIL") or colmap.get("CORREO")
-            col_movil = colmap.get("MOVIL") or colmap.get("TELEFONO MOVIL") or colmap.get("NUMERO DE TELEFONO")
-
-            if col_codigo:
-                fila = self.resumen_df[self.resumen_df[col_codigo].astype(str).str.strip() == codigo]
-                if not fila.empty:
-                    row = fila.iloc[0]
-                    cliente = {
-                        "codigo": codigo,
-                        "nombre": row.get(col_nom, ""),
-                        "apellidos": row.get(col_ape, ""),
-                        "email": row.get(col_mail, ""),
-                        "movil": self._normalizar_movil(row.get(col_movil, ""))
-                    }
-            else:
-                messagebox.showwarning("Columna faltante", "No se encontro la columna de numero de cliente.")
+        if self.resumen_df is not None and not self._directorio().tiene_codigo:
+            messagebox.showwarning("Columna faltante", "No se encontro la columna de numero de cliente.")
+        cliente = self._cliente_por_codigo(codigo)
 
-        # Si no se encontró en resumen, buscar/crear manual
+        # Si no se encontró en resumen ni en externos, crear manual
         if not cliente:
-            ext = [c for c in self.clientes_ext if c.get("codigo") == codigo]
-            if ext:
-                cliente = ext[0].copy()
-                cliente["movil"] = self._normalizar_movil(cliente.get("movil", ""))
-            else:
-                if not messagebox.askyesno("Cliente no encontrado", f"No hay cliente {codigo}. Registrar manualmente?"):
-                    return
-                nombre = self._pedir_campo("Nombre", "Introduce el nombre:", obligatorio=True, validar_nombre=True)
-                if nombre is None:
-                    return
-                apellidos = self._pedir_campo("Apellidos", "Introduce los apellidos:")
-                if apellidos is None:
-                    return
-                email = self._pedir_campo("Email", "Introduce el email:")
-                if email is None:
-                    return
-                movil = self._pedir_campo("Movil", "Introduce el movil (opcional):", obligatorio=False) or ""
-                movil = self._normalizar_movil(movil)
-                cliente = {
-                    "codigo": codigo,
-                    "nombre": nombre.strip(),
-                    "apellidos": apellidos.strip(),
-                    "email": email.strip(),
-                    "movil": movil.strip(),
-                }
-                self.clientes_ext = [c for c in self.clientes_ext if c.get("codigo") != codigo] + [cliente]
-                self.guardar_clientes_ext()
+            if not messagebox.askyesno("Cliente no encontrado", f"No hay cliente {codigo}. Registrar manualmente?"):
+                return
+            nombre = self._pedir_campo("Nombre", "Introduce el nombre:", obligatorio=True, validar_nombre=True)
+            if nombre is None:
+                return
+            apellidos = self._pedir_campo("Apellidos", "Introduce los apellidos:")
+            if apellidos is None:
+                return
+            email = self._pedir_campo("Email", "Introduce el email:")
+            if email is None:
+                return
+            movil = self._pedir_campo("Movil", "Introduce el movil (opcional):", obligatorio=False) or ""
+            movil = self._normalizar_movil(movil)
+            cliente = {
+                "codigo": codigo,
+                "nombre": nombre.strip(),
+                "apellidos": apellidos.strip(),
+                "email": email.strip(),
+                "movil": movil.strip(),
+            }
+            self.clientes_ext = [c for c in self.clientes_ext if c.get("codigo") != codigo] + [cliente]
+            self.guardar_clientes_ext()
 
         if not cliente:
             return
@@ -3131,22 +3337,19 @@ class ResamaniaApp(tk.Tk):
         if not hasattr(self, "tree_incidencias_socios"):
             return
         tree = self.tree_incidencias_socios
-        tree.delete(*tree.get_children())
+        vista = self._vista_keyed(tree)
+        filas = []
         filtro = (self.incidencias_socios_filtro or "TODAS").upper()
         codigo_filtro = (self.incidencias_socios_filtro_codigo or "").strip()
-        for inc in sorted(
-            self.incidencias_socios,
-            key=lambda i: self._socios_parse_dt(i.get("fecha")) or datetime.min,
-            reverse=True,
-        ):
-            if codigo_filtro and str(inc.get("codigo", "")).strip() != codigo_filtro:
-                continue
-            estado = str(inc.get("estado", "PENDIENTE")).upper()
-            if filtro == "VISTO_PENDIENTE":
-                if estado not in ("VISTO", "PENDIENTE"):
-                    continue
-            elif filtro != "TODAS" and estado != filtro:
-                continue
+        if filtro == "VISTO_PENDIENTE":
+            estados = ("VISTO", "PENDIENTE")
+        elif filtro != "TODAS":
+            estados = (filtro,)
+        else:
+            estados = None
+        coleccion = self._coleccion("incidencias_socios")
+        for inc in coleccion.filtrar(codigo=codigo_filtro, estados=estados):
+            estado = coleccion.estado(inc)
             reporte = "R" if inc.get("reporte_path") else ""
             tag = ""
             if estado == "PENDIENTE":
@@ -3168,37 +3371,18 @@ class ResamaniaApp(tk.Tk):
                 reporte,
                 inc.get("prestado_por", ""),
             ]
-            tree.insert("", "end", iid=inc.get("id"), values=values, tags=(tag,))
+            filas.append((inc.get("id"), values, (tag,)))
+        vista.update(filas)
 
     def buscar_cliente_incidencia_socio(self):
         codigo = self.incidencia_socios_codigo.get().strip()
         if not codigo:
             messagebox.showwarning("Sin numero", "Introduce el numero de cliente.")
             return
-        cliente = None
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            col_nom = colmap.get("NOMBRE")
-            col_ape = colmap.get("APELLIDOS")
-            col_mail = colmap.get("CORREO ELECTRONICO") or colmap.get("EMAIL") or colmap.get("CORREO")
-            col_movil = colmap.get("MOVIL") or colmap.get("TELEFONO MOVIL") or colmap.get("NUMERO DE TELEFONO")
-            if col_codigo:
-                fila = self.resumen_df[self.resumen_df[col_codigo].astype(str).str.strip() == codigo]
-                if not fila.empty:
-                    row = fila.iloc[0]
-                    cliente = {
-                        "codigo": codigo,
-                        "nombre": row.get(col_nom, ""),
-                        "apellidos": row.get(col_ape, ""),
-                        "email": row.get(col_mail, ""),
-                        "movil": self._normalizar_movil(row.get(col_movil, "")),
-                    }
-        if not cliente:
-            ext = [c for c in self.clientes_ext if c.get("codigo") == codigo]
-            if ext:
-                cliente = ext[0].copy()
-                cliente["movil"] = self._normalizar_movil(cliente.get("movil", ""))
+        codigo = self._resolver_cliente(codigo, "Incidencias socios", self.incidencia_socios_codigo)
+        if not codigo:
+            return
+        cliente = self._cliente_por_codigo(codigo)
         if not cliente:
             resp = messagebox.askyesno(
                 "Sin cliente",
@@ -3225,16 +3409,12 @@ class ResamaniaApp(tk.Tk):
                 return None
             codigo = codigo.strip()
 
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            if col_codigo:
-                if any(str(val).strip() == codigo for val in self.resumen_df[col_codigo].fillna("")):
-                    messagebox.showwarning(
-                        "No permitido",
-                        "Este cliente ya existe en RESUMEN CLIENTE y no se puede agregar manualmente."
-                    )
-                    return None
+        if self._directorio().en_resumen(codigo):
+            messagebox.showwarning(
+                "No permitido",
+                "Este cliente ya existe en RESUMEN CLIENTE y no se puede agregar manualmente."
+            )
+            return None
 
         nombre = self._pedir_campo("Nombre", "Introduce el nombre:", obligatorio=True, validar_nombre=True)
         if nombre is None:
@@ -3498,8 +3678,8 @@ class ResamaniaApp(tk.Tk):
 
         top = tk.Frame(frm)
         top.pack(fill="x", pady=4)
-        tk.Label(top, text="Numero de cliente:").pack(side="left")
-        self.incidencia_socios_codigo = tk.Entry(top, width=14)
+        tk.Label(top, text="Cliente (numero, nombre, email o movil):").pack(side="left")
+        self.incidencia_socios_codigo = tk.Entry(top, width=22)
         self.incidencia_socios_codigo.pack(side="left", padx=5)
         tk.Button(top, text="Buscar", command=self.buscar_cliente_incidencia_socio).pack(side="left", padx=5)
         tk.Button(top, text="AGREGAR NUEVO CLIENTE", command=self.agregar_cliente_incidencia_socio, bg="#ff7043", fg="white").pack(
@@ -3716,12 +3896,9 @@ class ResamaniaApp(tk.Tk):
         if not hasattr(self, "tree_paypymes"):
             return
         tree = self.tree_paypymes
-        tree.delete(*tree.get_children())
-        for item in sorted(
-            self.paypymes,
-            key=lambda i: self._socios_parse_dt(i.get("fecha")) or datetime.min,
-            reverse=True,
-        ):
+        vista = self._vista_keyed(tree)
+        filas = []
+        for item in self._coleccion("paypymes").ordenados():
             notif = str(item.get("notificacion", "NO")).upper()
             tag = "paypymes_no"
             if notif == "SI":
@@ -3740,7 +3917,8 @@ class ResamaniaApp(tk.Tk):
                 reporte,
                 item.get("prestado_por", ""),
             ]
-            tree.insert("", "end", iid=item.get("id"), values=values, tags=(tag,))
+            filas.append((item.get("id"), values, (tag,)))
+        vista.update(filas)
         self._paypymes_update_stats()
 
     def _paypymes_update_stats(self):
@@ -3773,30 +3951,10 @@ class ResamaniaApp(tk.Tk):
         if not codigo:
             messagebox.showwarning("Sin numero", "Introduce el numero de cliente.")
             return
-        cliente = None
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            col_nom = colmap.get("NOMBRE")
-            col_ape = colmap.get("APELLIDOS")
-            col_mail = colmap.get("CORREO ELECTRONICO") or colmap.get("EMAIL") or colmap.get("CORREO")
-            col_movil = colmap.get("MOVIL") or colmap.get("TELEFONO MOVIL") or colmap.get("NUMERO DE TELEFONO")
-            if col_codigo:
-                fila = self.resumen_df[self.resumen_df[col_codigo].astype(str).str.strip() == codigo]
-                if not fila.empty:
-                    row = fila.iloc[0]
-                    cliente = {
-                        "codigo": codigo,
-                        "nombre": row.get(col_nom, ""),
-                        "apellidos": row.get(col_ape, ""),
-                        "email": row.get(col_mail, ""),
-                        "movil": self._normalizar_movil(row.get(col_movil, "")),
-                    }
-        if not cliente:
-            ext = [c for c in self.clientes_ext if c.get("codigo") == codigo]
-            if ext:
-                cliente = ext[0].copy()
-                cliente["movil"] = self._normalizar_movil(cliente.get("movil", ""))
+        codigo = self._resolver_cliente(codigo, "Paypymes", self.paypymes_codigo)
+        if not codigo:
+            return
+        cliente = self._cliente_por_codigo(codigo)
         if not cliente:
             resp = messagebox.askyesno(
                 "Sin cliente",
@@ -3820,16 +3978,12 @@ class ResamaniaApp(tk.Tk):
                 return None
             codigo = codigo.strip()
 
-        if self.resumen_df is not None:
-            colmap = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
-            if col_codigo:
-                if any(str(val).strip() == codigo for val in self.resumen_df[col_codigo].fillna("")):
-                    messagebox.showwarning(
-                        "No permitido",
-                        "Este cliente ya existe en RESUMEN CLIENTE y no se puede agregar manualmente."
-                    )
-                    return None
+        if self._directorio().en_resumen(codigo):
+            messagebox.showwarning(
+                "No permitido",
+                "Este cliente ya existe en RESUMEN CLIENTE y no se puede agregar manualmente."
+            )
+            return None
 
         nombre = self._pedir_campo("Nombre", "Introduce el nombre:", obligatorio=True, validar_nombre=True)
         if nombre is None:
@@ -4038,8 +4192,8 @@ class ResamaniaApp(tk.Tk):
 
         top = tk.Frame(frm)
         top.pack(fill="x", pady=4)
-        tk.Label(top, text="Numero de cliente:").pack(side="left")
-        self.paypymes_codigo = tk.Entry(top, width=14)
+        tk.Label(top, text="Cliente (numero, nombre, email o movil):").pack(side="left")
+        self.paypymes_codigo = tk.Entry(top, width=22)
         self.paypymes_codigo.pack(side="left", padx=5)
         tk.Button(top, text="Buscar", command=self.buscar_cliente_paypymes).pack(side="left", padx=5)
         tk.Button(top, text="NUEVO REGISTRO", command=self.nuevo_registro_paypymes, bg="#ffcc80", fg="black").pack(
@@ -4214,10 +4368,11 @@ class ResamaniaApp(tk.Tk):
     def _taquillas_get_overdue_ids(self):
         now = datetime.now()
         overdue = []
+        coleccion = self._coleccion("objetos_taquillas")
         for item in self.objetos_taquillas:
             if item.get("fecha_retirada") or item.get("fecha_eliminadas"):
                 continue
-            fin = self._taquillas_parse_dt(item.get("fecha_fin"))
+            fin = coleccion.fecha(item, "fecha_fin")
             if fin and fin <= now:
                 overdue.append(item.get("id"))
         return overdue
@@ -4417,14 +4572,11 @@ class ResamaniaApp(tk.Tk):
         if not hasattr(self, "tree_objetos_taquillas"):
             return
         tree = self.tree_objetos_taquillas
-        tree.delete(*tree.get_children())
+        vista = self._vista_keyed(tree)
+        filas = []
         overdue_ids = set(self._taquillas_get_overdue_ids())
         blink_on = self.objetos_taquillas_blink_on
-        for item in sorted(
-            self.objetos_taquillas,
-            key=lambda i: self._taquillas_parse_dt(i.get("fecha_extraccion")) or datetime.min,
-            reverse=True,
-        ):
+        for item in self._coleccion("objetos_taquillas").ordenados():
             tag = ""
             if item.get("id") in overdue_ids:
                 tag = "overdue_on" if blink_on else "overdue_off"
@@ -4446,7 +4598,8 @@ class ResamaniaApp(tk.Tk):
                 tags.append("impago")
             if tag:
                 tags.append(tag)
-            tree.insert("", "end", iid=item.get("id"), values=values, tags=tuple(tags))
+            filas.append((item.get("id"), values, tags))
+        vista.update(filas)
 
     def create_objetos_taquillas_tab(self, tab):
         frm = tk.Frame(tab)
@@ -4825,48 +4978,44 @@ class ResamaniaApp(tk.Tk):
         except Exception:
             return None
 
-    def _bajas_get_impagos_set(self):
-        fecha = self.impagos_last_export or self.impagos_db.get_last_export()
-        if fecha:
-            try:
-                with self.impagos_db._connect() as conn:
-                    cur = conn.cursor()
-                    cur.execute(
-                        "SELECT DISTINCT c.numero_cliente "
-                        "FROM impagos_clientes c "
-                        "JOIN impagos_eventos e ON e.cliente_id = c.id "
-                        "WHERE e.fecha_export = ?",
-                        (fecha,),
-                    )
-                    rows = {str(r[0]).strip() for r in cur.fetchall() if r and r[0]}
-                if rows:
-                    return rows
-            except Exception:
-                pass
-        # Fallback: leer IMPAGOS.csv exportado y tomar columna "Numero de cliente"
+    def _impagos_deudores_set(self):
+        """
+        Conjunto de clientes con impago del ultimo export, cacheado en
+        ImpagosDB y compartido por bajas y suspensiones.
+        """
+        try:
+            fecha = self.impagos_last_export or self.impagos_db.get_last_export()
+            if fecha:
+                return self.impagos_db.deudores_actuales(fecha)[0]
+        except Exception:
+            return frozenset()
+        # Sin ningun export sincronizado: leer IMPAGOS exportado y tomar columna "Numero de cliente"
         try:
             df = load_data_file(self.folder_path or "", "IMPAGOS")
             if df is None or df.empty:
-                return set()
+                return frozenset()
             colmap = {self._norm(c): c for c in df.columns}
             col_cliente = colmap.get("NUMERO DE CLIENTE") or colmap.get("NUMERO DE SOCIO")
             if not col_cliente:
-                return set()
-            return {str(v).strip() for v in df[col_cliente].fillna("") if str(v).strip()}
+                return frozenset()
+            return frozenset(v for v in df[col_cliente].fillna("").astype(str).str.strip() if v)
         except Exception:
-            return set()
+            return frozenset()
 
-    def _bajas_actualizar_devolucion(self):
-        impagos_set = self._bajas_get_impagos_set()
-        self.bajas_impagos_set = set(impagos_set)
+    def _marcar_devolucion_recibo(self, items, impagos_set):
+        codigos = {str(item.get("codigo", "")).strip() for item in items}
+        con_impago = codigos & impagos_set
         changed = False
-        for item in self.bajas:
-            codigo = str(item.get("codigo", "")).strip()
-            valor = "SI" if codigo and codigo in impagos_set else "NO"
+        for item in items:
+            valor = "SI" if str(item.get("codigo", "")).strip() in con_impago else "NO"
             if item.get("devolucion_recibo") != valor:
                 item["devolucion_recibo"] = valor
                 changed = True
-        if changed:
+        return changed
+
+    def _bajas_actualizar_devolucion(self):
+        self.bajas_impagos_set = self._impagos_deudores_set()
+        if self._marcar_devolucion_recibo(self.bajas, self.bajas_impagos_set):
             self.guardar_bajas()
 
     def _bajas_actualizar_impagos_manual(self):
@@ -4949,35 +5098,7 @@ class ResamaniaApp(tk.Tk):
             self.refrescar_bajas_tree()
 
     def _bajas_buscar_cliente_info(self, codigo):
-        codigo = str(codigo or "").strip()
-        if not codigo:
-            return {}
-        if self.resumen_df is not None:
-            cols = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = cols.get("NUMERO DE CLIENTE") or cols.get("NUMERO DE SOCIO")
-            col_nombre = cols.get("NOMBRE")
-            col_apellidos = cols.get("APELLIDOS")
-            col_email = cols.get("CORREO ELECTRONICO") or cols.get("EMAIL") or cols.get("CORREO")
-            col_movil = cols.get("MOVIL") or cols.get("TELEFONO") or cols.get("TELEFONO MOVIL")
-            if col_codigo:
-                df = self.resumen_df[self.resumen_df[col_codigo].astype(str).str.strip() == codigo]
-                if not df.empty:
-                    row = df.iloc[0]
-                    return {
-                        "nombre": str(row.get(col_nombre, "")).strip(),
-                        "apellidos": str(row.get(col_apellidos, "")).strip(),
-                        "email": str(row.get(col_email, "")).strip(),
-                        "movil": str(row.get(col_movil, "")).strip(),
-                    }
-        for c in self.clientes_ext:
-            if str(c.get("codigo", "")).strip() == codigo:
-                return {
-                    "nombre": str(c.get("nombre", "")).strip(),
-                    "apellidos": str(c.get("apellidos", "")).strip(),
-                    "email": str(c.get("email", "")).strip(),
-                    "movil": str(c.get("movil", "")).strip(),
-                }
-        return {}
+        return self._cliente_info(codigo)
 
     def _bajas_select_option(self, title, prompt, opciones, width=28):
         win = tk.Toplevel(self)
@@ -5103,6 +5224,9 @@ class ResamaniaApp(tk.Tk):
         if not codigo:
             messagebox.showinfo("Bajas", "Introduce un numero de cliente.")
             return
+        codigo = self._resolver_cliente(codigo, "Bajas", self.bajas_buscar_entry)
+        if not codigo:
+            return
         self._bajas_set_cliente_filter(codigo)
 
     def _bajas_ver_solicitudes_individuales(self, baja_id):
@@ -5217,19 +5341,18 @@ class ResamaniaApp(tk.Tk):
         if not hasattr(self, "tree_bajas"):
             return
         tree = self.tree_bajas
-        tree.delete(*tree.get_children())
+        vista = self._vista_keyed(tree)
+        filas = []
         view = (self.bajas_view or "TODOS").upper()
         cliente_filter = (self.bajas_cliente_filter or "").strip().upper()
-        for item in sorted(self.bajas, key=lambda i: self._bajas_parse_dt(i.get("fecha_registro")) or datetime.min, reverse=True):
-            codigo = str(item.get("codigo", "")).strip()
-            if cliente_filter and codigo.upper() != cliente_filter:
-                continue
-            estado = str(item.get("estado", "PENDIENTE")).upper()
-            if view == "IMPAGO":
-                if str(item.get("devolucion_recibo", "")).strip().upper() != "SI":
-                    continue
-            elif view != "TODOS" and estado != view:
-                continue
+        coleccion = self._coleccion("bajas")
+        if view == "IMPAGO":
+            impagos = self._bajas_por_devolucion(coleccion).get("SI", ())
+            items = coleccion.filtrar(codigo=cliente_filter, base=impagos)
+        else:
+            items = coleccion.filtrar(codigo=cliente_filter, estados=None if view == "TODOS" else (view,))
+        for item in items:
+            estado = coleccion.estado(item)
             tag = ""
             if estado == "PENDIENTE":
                 tag = "pendiente"
@@ -5259,39 +5382,39 @@ class ResamaniaApp(tk.Tk):
                 item.get("incidencia", ""),
                 item.get("solucion", ""),
             ]
-            tree.insert("", "end", iid=item.get("id"), values=values, tags=(tag,) if tag else ())
+            filas.append((item.get("id"), values, (tag,) if tag else ()))
+        vista.update(filas)
+
+    def _bajas_por_devolucion(self, coleccion):
+        return coleccion.agrupar("devolucion_recibo", lambda i: norm_clave(i.get("devolucion_recibo", "")))
+
+    def _metricas_motivo(self, item):
+        motivo = norm_clave(item.get("motivo", ""))
+        return "OTRO" if motivo.startswith("OTRO") else motivo
+
+    def _metricas_conteos(self, grupos):
+        return {clave: len(items) for clave, items in grupos.items() if clave}
 
     def _bajas_metricas(self):
         total = len(self.bajas)
         if total == 0:
             messagebox.showinfo("Metricas", "No hay registros.")
             return
+        coleccion = self._coleccion("bajas")
         counts_estado = {"PENDIENTE": 0, "TRAMITADA": 0, "RECUPERADA": 0, "RECHAZADA": 0}
-        counts_tipo = {}
-        counts_motivo = {}
-        devolucion_si = 0
-        devolucion_no = 0
-        pago_tras_aviso = 0
-        for item in self.bajas:
-            estado = str(item.get("estado", "PENDIENTE")).upper()
-            counts_estado[estado] = counts_estado.get(estado, 0) + 1
-            tipo = str(item.get("tipo_baja", "")).strip().upper()
-            if tipo:
-                counts_tipo[tipo] = counts_tipo.get(tipo, 0) + 1
-            motivo = str(item.get("motivo", "")).strip().upper()
-            if motivo.startswith("OTRO"):
-                motivo = "OTRO"
-            if motivo:
-                counts_motivo[motivo] = counts_motivo.get(motivo, 0) + 1
-            if str(item.get("devolucion_recibo", "")).strip().upper() == "SI":
-                devolucion_si += 1
-            else:
-                devolucion_no += 1
-            if (
-                str(item.get("impago_enviado", "")).strip().upper() == "SI"
-                and str(item.get("devolucion_recibo", "")).strip().upper() != "SI"
-            ):
-                pago_tras_aviso += 1
+        counts_estado.update(coleccion.conteo_estados())
+        counts_tipo = self._metricas_conteos(coleccion.agrupar("tipo_baja", lambda i: norm_clave(i.get("tipo_baja", ""))))
+        counts_motivo = self._metricas_conteos(coleccion.agrupar("motivo", self._metricas_motivo))
+        devolucion = self._bajas_por_devolucion(coleccion)
+        devolucion_si = len(devolucion.get("SI", ()))
+        devolucion_no = total - devolucion_si
+        pago_tras_aviso = sum(
+            1
+            for clave, items in devolucion.items()
+            if clave != "SI"
+            for item in items
+            if norm_clave(item.get("impago_enviado", "")) == "SI"
+        )
 
         win = tk.Toplevel(self)
         win.title("Metricas bajas")
@@ -5552,32 +5675,27 @@ class ResamaniaApp(tk.Tk):
     def refrescar_prestamos_tree(self):
         if not hasattr(self, "tree_prestamos"):
             return
-        self.tree_prestamos.delete(*self.tree_prestamos.get_children())
+        vista = self._vista_keyed(self.tree_prestamos)
+        filas = []
         self.tree_prestamos["displaycolumns"] = ["codigo", "nombre", "apellidos", "email", "movil", "material", "fecha", "devuelto", "notificaciones", "prestado_por"]
-        # Ordenar de más reciente a más antiguo por fecha
-        ordenados = sorted(
-            self.prestamos,
-            key=lambda p: self._parse_fecha_prestamo(p.get("fecha")) or datetime.min,
-            reverse=True
-        )
         codigo_filtro = None
         if self.prestamos_filtro_activo:
             if getattr(self, "prestamo_encontrado", None):
                 codigo_filtro = self.prestamo_encontrado.get("codigo")
             else:
                 codigo_filtro = self.prestamo_codigo.get().strip()
-        for p in ordenados:
-            if codigo_filtro and p.get("codigo") != codigo_filtro:
-                continue
+        # Ordenar de más reciente a más antiguo por fecha
+        for p in self._coleccion("prestamos").filtrar(codigo=codigo_filtro):
             iid = p.get("id") or uuid.uuid4().hex
             p["id"] = iid
             tag = "verde" if p.get("devuelto") else "naranja"
-            self.tree_prestamos.insert("", "end", values=[
+            filas.append((iid, [
                 p.get("codigo", ""), p.get("nombre", ""), p.get("apellidos", ""),
                 p.get("email", ""), p.get("movil", ""), p.get("material", ""),
                 p.get("fecha", ""), "SI" if p.get("devuelto") else "NO",
                 p.get("notificaciones", 0), p.get("prestado_por", "")
-            ], tags=(tag,), iid=iid)
+            ], (tag,)))
+        vista.update(filas)
 
     def toggle_prestamos_vista(self):
         self.prestamos_filtro_activo = not self.prestamos_filtro_activo
@@ -5704,29 +5822,10 @@ class ResamaniaApp(tk.Tk):
             self.refresh_impagos_view()
             return
         try:
-            resumen_map = None
-            if self.resumen_df is not None:
-                cols = {self._norm(c): c for c in self.resumen_df.columns}
-                col_codigo = cols.get("NUMERO DE CLIENTE") or cols.get("NUMERO DE SOCIO")
-                col_nombre = cols.get("NOMBRE")
-                col_apellidos = cols.get("APELLIDOS")
-                col_email = cols.get("CORREO ELECTRONICO") or cols.get("EMAIL") or cols.get("CORREO")
-                col_movil = cols.get("MOVIL") or cols.get("TELEFONO") or cols.get("TELEFONO MOVIL")
-                if col_codigo:
-                    resumen_map = {}
-                    for _, row in self.resumen_df.iterrows():
-                        codigo = str(row.get(col_codigo, "")).strip()
-                        if not codigo:
-                            continue
-                        resumen_map[codigo] = {
-                            "nombre": str(row.get(col_nombre, "")).strip(),
-                            "apellidos": str(row.get(col_apellidos, "")).strip(),
-                            "email": str(row.get(col_email, "")).strip(),
-                            "movil": str(row.get(col_movil, "")).strip(),
-                        }
-            fecha, count = self.impagos_db.sync_from_df(df, resumen_map=resumen_map)
+            fecha, count = self.impagos_db.sync_from_df(df, resumen_df=self.resumen_df)
             self.impagos_last_export = fecha
-            self.impagos_status.config(text=f"Export: {fecha} | Registros: {count}")
+            if hasattr(self, "impagos_status"):
+                self.impagos_status.config(text=f"Export: {fecha} | Registros: {count}")
             self.refresh_impagos_view()
             if hasattr(self, "bajas"):
                 self._bajas_actualizar_devolucion()
@@ -5761,6 +5860,7 @@ class ResamaniaApp(tk.Tk):
                 "codigo", "nombre", "apellidos", "email", "movil",
                 "incidentes", "email_enviado", "historial_email", "fecha_export"
             )
+        filas = []
         for r in rows:
             values = list(r)
             # Normaliza checks para email/reincidente
@@ -5770,6 +5870,8 @@ class ResamaniaApp(tk.Tk):
                 values[9] = "SI" if values[9] else "NO"
                 values[8] = values[8] or ""
             self.tree_impagos.insert("", "end", values=values, iid=str(r[0]))
+            filas.append((r[0], values))
+        registrar_filas(self.tree_impagos, filas)
         self._update_impagos_blinks()
 
     def _get_impagos_selected(self):
@@ -5822,11 +5924,9 @@ class ResamaniaApp(tk.Tk):
         data = self._get_impagos_selected()
         if not data:
             return
-        cliente_id = self.impagos_db.get_cliente_id(data["codigo"])
-        if not cliente_id:
+        if not self.impagos_db.add_gestion_bulk([data["codigo"]], accion, plantilla, ""):
             messagebox.showerror("Impagos", "Cliente no encontrado en la base.")
             return
-        self.impagos_db.add_gestion(cliente_id, accion, plantilla, "")
         messagebox.showinfo("Registrado", f"Accion registrada: {accion}.")
         self.refresh_impagos_view()
 
@@ -5891,11 +5991,7 @@ class ResamaniaApp(tk.Tk):
             return
 
         # Registrar gestión para todos los clientes de la lista
-        for r in rows:
-            codigo = str(r[0]).strip()
-            cliente_id = self.impagos_db.get_cliente_id(codigo)
-            if cliente_id:
-                self.impagos_db.add_gestion(cliente_id, "email", plantilla, "")
+        self.impagos_db.add_gestion_bulk([r[0] for r in rows], "email", plantilla, "")
         self.refresh_impagos_view()
 
     def enviar_email_resueltos(self):
@@ -5954,11 +6050,7 @@ class ResamaniaApp(tk.Tk):
             return
         if not emails:
             return
-        for r in rows:
-            codigo = str(r[0]).strip()
-            cliente_id = self.impagos_db.get_cliente_id(codigo)
-            if cliente_id:
-                self.impagos_db.add_gestion(cliente_id, "resuelto_email", "resuelto", "")
+        self.impagos_db.add_gestion_bulk([r[0] for r in rows], "resuelto_email", "resuelto", "")
         self.refresh_impagos_view()
 
     def _impagos_email_html(self, plantilla):
@@ -6034,7 +6126,7 @@ class ResamaniaApp(tk.Tk):
             return
         if not self._require_manager_access("Impagos"):
             return
-        tab = self.tabs.get("Impagos")
+        tab = self._construir_pestana("Impagos")
         if tab:
             self.notebook.add(tab, text="Impagos", image=self.tab_icons.get("Impagos"), compound="left")
             self.notebook.select(tab)
@@ -6064,6 +6156,7 @@ class ResamaniaApp(tk.Tk):
                         self.notebook.select(fallback)
                     return
         self._last_allowed_tab = current
+        self._construir_pestana(self.notebook.tab(current, "text"))
 
         tab = self.tabs.get("Impagos")
         if not tab:
@@ -6168,18 +6261,8 @@ class ResamaniaApp(tk.Tk):
             elif c in ("reporte",):
                 width = 80
             tree.column(c, anchor="center", width=width, stretch=True)
-        def sort_column(col, reverse):
-            datos = [(tree.set(k, col), k) for k in tree.get_children("")]
-            try:
-                datos.sort(key=lambda t: float(t[0].replace(",", ".")), reverse=reverse)
-            except ValueError:
-                datos.sort(key=lambda t: t[0], reverse=reverse)
-            for index, (_, k) in enumerate(datos):
-                tree.move(k, "", index)
-            tree.heading(col, command=lambda: sort_column(col, not reverse))
-
         for c in cols:
-            tree.heading(c, command=lambda col=c: sort_column(col, False))
+            tree.heading(c, command=lambda col=c: self.sort_column(tree, col, False))
 
         base_widths = {c: tree.column(c, "width") for c in cols}
         tree.grid(row=0, column=0, sticky="nsew")
@@ -6409,45 +6492,20 @@ class ResamaniaApp(tk.Tk):
                 continue
             return dt, normalized
 
-    def _suspensiones_get_impagos_set(self):
-        fecha = self.impagos_last_export or self.impagos_db.get_last_export()
-        if not fecha:
-            return set()
-        try:
-            with self.impagos_db._connect() as conn:
-                cur = conn.cursor()
-                cur.execute(
-                    "SELECT DISTINCT c.numero_cliente "
-                    "FROM impagos_clientes c "
-                    "JOIN impagos_eventos e ON e.cliente_id = c.id "
-                    "WHERE e.fecha_export = ?",
-                    (fecha,),
-                )
-                return {str(r[0]).strip() for r in cur.fetchall() if r and r[0]}
-        except Exception:
-            return set()
-
     def _suspensiones_actualizar_devolucion(self):
-        impagos_set = self._suspensiones_get_impagos_set()
-        self.suspensiones_impagos_set = set(impagos_set)
-        changed = False
-        for item in self.suspensiones:
-            codigo = str(item.get("codigo", "")).strip()
-            valor = "SI" if codigo and codigo in impagos_set else "NO"
-            if item.get("devolucion_recibo") != valor:
-                item["devolucion_recibo"] = valor
-                changed = True
-        if changed:
+        self.suspensiones_impagos_set = self._impagos_deudores_set()
+        if self._marcar_devolucion_recibo(self.suspensiones, self.suspensiones_impagos_set):
             self.guardar_suspensiones()
 
     def _suspensiones_actualizar_concluidas(self):
         hoy = datetime.now().date()
         changed = False
+        coleccion = self._coleccion("suspensiones")
         for item in self.suspensiones:
             estado = str(item.get("estado", "")).upper()
             if estado == "CONCLUIDA":
                 continue
-            dt_fin = self._suspensiones_parse_dt(item.get("fecha_fin_suspension"))
+            dt_fin = coleccion.fecha(item, "fecha_fin_suspension")
             if not dt_fin:
                 continue
             if dt_fin.date() <= hoy:
@@ -6459,35 +6517,7 @@ class ResamaniaApp(tk.Tk):
             self.guardar_suspensiones()
 
     def _suspensiones_buscar_cliente_info(self, codigo):
-        codigo = str(codigo or "").strip()
-        if not codigo:
-            return {}
-        if self.resumen_df is not None:
-            cols = {self._norm(c): c for c in self.resumen_df.columns}
-            col_codigo = cols.get("NUMERO DE CLIENTE") or cols.get("NUMERO DE SOCIO")
-            col_nombre = cols.get("NOMBRE")
-            col_apellidos = cols.get("APELLIDOS")
-            col_email = cols.get("CORREO ELECTRONICO") or cols.get("EMAIL") or cols.get("CORREO")
-            col_movil = cols.get("MOVIL") or cols.get("TELEFONO") or cols.get("TELEFONO MOVIL")
-            if col_codigo:
-                df = self.resumen_df[self.resumen_df[col_codigo].astype(str).str.strip() == codigo]
-                if not df.empty:
-                    row = df.iloc[0]
-                    return {
-                        "nombre": str(row.get(col_nombre, "")).strip(),
-                        "apellidos": str(row.get(col_apellidos, "")).strip(),
-                        "email": str(row.get(col_email, "")).strip(),
-                        "movil": str(row.get(col_movil, "")).strip(),
-                    }
-        for c in self.clientes_ext:
-            if str(c.get("codigo", "")).strip() == codigo:
-                return {
-                    "nombre": str(c.get("nombre", "")).strip(),
-                    "apellidos": str(c.get("apellidos", "")).strip(),
-                    "email": str(c.get("email", "")).strip(),
-                    "movil": str(c.get("movil", "")).strip(),
-                }
-        return {}
+        return self._cliente_info(codigo)
 
     def _suspensiones_select_option(self, title, prompt, opciones, width=28):
         win = tk.Toplevel(self)
@@ -6622,6 +6652,9 @@ class ResamaniaApp(tk.Tk):
         if not codigo:
             messagebox.showinfo("Suspensiones", "Introduce un numero de cliente.")
             return
+        codigo = self._resolver_cliente(codigo, "Suspensiones", self.suspensiones_buscar_entry)
+        if not codigo:
+            return
         self._suspensiones_set_cliente_filter(codigo)
 
     def _suspensiones_ver_solicitudes_individuales(self, susp_id):
@@ -6836,39 +6869,42 @@ class ResamaniaApp(tk.Tk):
             item["fin_notificado"] = "SI"
         self.guardar_suspensiones()
 
-    def _suspensiones_order_key(self, item, view):
+    def _suspensiones_order_key(self, item, view, ahora=None):
+        coleccion = self._coleccion("suspensiones")
         if view in ("TRAMITADA", "PENDIENTE", "ACTIVAS"):
-            dt = self._suspensiones_parse_dt(item.get("fecha_fin_suspension"))
+            dt = coleccion.fecha(item, "fecha_fin_suspension")
             if dt:
-                return abs((dt - datetime.now()).total_seconds())
+                return abs((dt - (ahora or datetime.now())).total_seconds())
             return float("inf")
-        return self._suspensiones_parse_dt(item.get("fecha_registro")) or datetime.min
+        return coleccion.fecha(item, "fecha_registro") or datetime.min
 
     def refrescar_suspensiones_tree(self):
         if not hasattr(self, "tree_suspensiones"):
             return
         tree = self.tree_suspensiones
-        tree.delete(*tree.get_children())
+        vista = self._vista_keyed(tree)
+        filas = []
         self._suspensiones_actualizar_concluidas()
         view = (self.suspensiones_view or "ACTIVAS").upper()
         if view == "PENDIENTES":
             view = "PENDIENTE"
         cliente_filter = (self.suspensiones_cliente_filter or "").strip().upper()
-        sorted_items = sorted(
-            self.suspensiones,
-            key=lambda i: self._suspensiones_order_key(i, view),
+        if view == "ACTIVAS":
+            estados = ("PENDIENTE", "TRAMITADA")
+        elif view == "TODOS":
+            estados = None
+        else:
+            estados = (view,)
+        coleccion = self._coleccion("suspensiones")
+        ahora = datetime.now()
+        sorted_items = coleccion.filtrar(
+            codigo=cliente_filter,
+            estados=estados,
+            key=lambda i: self._suspensiones_order_key(i, view, ahora),
             reverse=(view not in ("TRAMITADA", "PENDIENTE", "ACTIVAS")),
         )
         for item in sorted_items:
-            codigo = str(item.get("codigo", "")).strip()
-            if cliente_filter and codigo.upper() != cliente_filter:
-                continue
-            estado = str(item.get("estado", "PENDIENTE")).upper()
-            if view == "ACTIVAS":
-                if estado not in ("PENDIENTE", "TRAMITADA"):
-                    continue
-            elif view != "TODOS" and estado != view:
-                continue
+            estado = coleccion.estado(item)
             tag = ""
             if estado == "PENDIENTE":
                 tag = "pendiente"
@@ -6897,7 +6933,8 @@ class ResamaniaApp(tk.Tk):
                 item.get("incidencia", ""),
                 item.get("solucion", ""),
             ]
-            tree.insert("", "end", iid=item.get("id"), values=values, tags=(tag,) if tag else ())
+            filas.append((item.get("id"), values, (tag,) if tag else ()))
+        vista.update(filas)
         self._suspensiones_update_totals()
 
     def _suspensiones_update_totals(self):
@@ -6921,22 +6958,13 @@ class ResamaniaApp(tk.Tk):
         if total == 0:
             messagebox.showinfo("Metricas", "No hay registros.")
             return
+        coleccion = self._coleccion("suspensiones")
         counts_estado = {"PENDIENTE": 0, "TRAMITADA": 0, "RECHAZADA": 0, "CONCLUIDA": 0}
-        counts_motivo = {}
-        devolucion_si = 0
-        devolucion_no = 0
-        for item in self.suspensiones:
-            estado = str(item.get("estado", "PENDIENTE")).upper()
-            counts_estado[estado] = counts_estado.get(estado, 0) + 1
-            motivo = str(item.get("motivo", "")).strip().upper()
-            if motivo.startswith("OTRO"):
-                motivo = "OTRO"
-            if motivo:
-                counts_motivo[motivo] = counts_motivo.get(motivo, 0) + 1
-            if str(item.get("devolucion_recibo", "")).strip().upper() == "SI":
-                devolucion_si += 1
-            else:
-                devolucion_no += 1
+        counts_estado.update(coleccion.conteo_estados())
+        counts_motivo = self._metricas_conteos(coleccion.agrupar("motivo", self._metricas_motivo))
+        devolucion = coleccion.agrupar("devolucion_recibo", lambda i: norm_clave(i.get("devolucion_recibo", "")))
+        devolucion_si = len(devolucion.get("SI", ()))
+        devolucion_no = total - devolucion_si
 
         win = tk.Toplevel(self)
         win.title("Metricas suspensiones")
@@ -7071,6 +7099,11 @@ class ResamaniaApp(tk.Tk):
         self.incidencias_area_title.pack(side="left", padx=6)
         self.incidencias_btn_vista_general = tk.Button(header, text="VISTA GENERAL", command=self.incidencias_vista_general)
         self.incidencias_btn_vista_general.configure(state="disabled")
+        tk.Button(header, text="1:1", width=3, command=lambda: self._incidencias_set_zoom(1.0)).pack(side="right", padx=2)
+        self.incidencias_btn_calor = tk.Button(header, text="MAPA CALOR", command=self.incidencias_toggle_calor)
+        self.incidencias_btn_calor.pack(side="right", padx=6)
+        tk.Button(header, text="-", width=3, command=lambda: self._incidencias_set_zoom(self.incidencias_zoom / 1.25)).pack(side="right", padx=2)
+        tk.Button(header, text="+", width=3, command=lambda: self._incidencias_set_zoom(self.incidencias_zoom * 1.25)).pack(side="right", padx=2)
 
         self.incidencias_canvas = tk.Canvas(canvas_container, bg="white")
         self.incidencias_canvas.grid(row=1, column=0, sticky="nsew")
@@ -7078,7 +7111,11 @@ class ResamaniaApp(tk.Tk):
         canvas_y.grid(row=1, column=1, sticky="ns")
         canvas_x = ttk.Scrollbar(canvas_container, orient="horizontal", command=self.incidencias_canvas.xview)
         canvas_x.grid(row=2, column=0, sticky="ew")
-        self.incidencias_canvas.configure(yscrollcommand=canvas_y.set, xscrollcommand=canvas_x.set)
+        # Cualquier cambio de vista (scroll, paneo, resize) repinta las teselas visibles.
+        self.incidencias_canvas.configure(
+            yscrollcommand=lambda *a: (canvas_y.set(*a), self._incidencias_schedule_tiles()),
+            xscrollcommand=lambda *a: (canvas_x.set(*a), self._incidencias_schedule_tiles()),
+        )
         self.incidencias_canvas.bind("<ButtonPress-1>", self.incidencias_canvas_press)
         self.incidencias_canvas.bind("<B1-Motion>", self.incidencias_canvas_drag)
         self.incidencias_canvas.bind("<ButtonRelease-1>", self.incidencias_canvas_release)
@@ -7087,6 +7124,7 @@ class ResamaniaApp(tk.Tk):
         self.incidencias_canvas.bind("<Button-3>", self.incidencias_canvas_right_click)
         self.incidencias_canvas.bind("<MouseWheel>", self.incidencias_canvas_mousewheel)
         self.incidencias_canvas.bind("<Shift-MouseWheel>", self.incidencias_canvas_mousewheel_x)
+        self.incidencias_canvas.bind("<Control-MouseWheel>", self.incidencias_canvas_zoom)
         self.incidencias_canvas.bind("<Button-4>", lambda _e: self.incidencias_canvas.yview_scroll(-1, "units"))
         self.incidencias_canvas.bind("<Button-5>", lambda _e: self.incidencias_canvas.yview_scroll(1, "units"))
 
@@ -7177,11 +7215,7 @@ class ResamaniaApp(tk.Tk):
                 self.incidencias_btn_vista_general.pack_forget()
             return
         if area_id:
-            nombre = None
-            for area in self.incidencias_db.list_areas(self.incidencias_current_map):
-                if area[0] == area_id:
-                    nombre = area[1]
-                    break
+            nombre = self._incidencias_area_name_by_id(area_id)
             self.incidencias_area_title.configure(text=nombre or "")
             self.incidencias_btn_vista_general.configure(state="normal")
             if not self.incidencias_btn_vista_general.winfo_ismapped():
@@ -7195,6 +7229,8 @@ class ResamaniaApp(tk.Tk):
     def _incidencias_apply_map_filter(self, area_id):
         if not self.incidencias_current_map:
             return
+        if self.incidencias_calor:
+            self.after_idle(self._incidencias_dibujar_calor)
         for aid, item in self.incidencias_area_items.items():
             if area_id:
                 self.incidencias_canvas.itemconfig(item, state="hidden")
@@ -7274,44 +7310,61 @@ class ResamaniaApp(tk.Tk):
             return blob_ref
         try:
             reports_dir = os.path.join(self.data_dir, "incidencias_reportes")
-            os.makedirs(reports_dir, exist_ok=True)
-            destino = os.path.join(reports_dir, f"reporte_{uuid.uuid4().hex}{ext}")
-            shutil.copy2(ruta, destino)
-            return os.path.basename(destino)
+            nombre = self.adjuntos.guardar_archivo(ruta, reports_dir)
+            self._incidencias_reportes_index().add(nombre)
+            return nombre
         except Exception:
             return ruta
 
     def _incidencias_ver_reporte(self, ruta):
+        """Vista previa del reporte (cache compartida por todos los visores) con opcion de abrir el original."""
         if self._is_blob_ref(ruta):
             store = getattr(self, "state_store", None)
             if not store or not store.use_postgres:
                 messagebox.showwarning("Reporte visual", "Reporte en BD, pero no hay conexion.", parent=self)
                 return
-            _ctype, data = store.get_blob(self._blob_id_from_ref(ruta))
-            if not data:
-                messagebox.showwarning("Reporte visual", "No se encontro el reporte en la BD.", parent=self)
-                return
-            try:
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-                tmp.write(data)
-                tmp.close()
-                os.startfile(tmp.name)
-            except Exception as exc:
-                messagebox.showerror("Reporte visual", f"No se pudo abrir el reporte.\nDetalle: {exc}", parent=self)
+        try:
+            ruta_local = self.adjuntos.ruta_local(ruta)
+        except Exception as exc:
+            messagebox.showerror("Reporte visual", f"No se pudo abrir el reporte.\nDetalle: {exc}", parent=self)
             return
-        ruta_resuelta = self._incidencias_resolve_reporte_path(ruta)
-        if not ruta_resuelta:
-            reports_dir = os.path.join(self.data_dir, "incidencias_reportes")
-            messagebox.showwarning(
-                "Reporte visual",
-                f"No se encontro el archivo del reporte.\n\nRuta guardada:\n{ruta}\n\nCarpeta:\n{reports_dir}",
-                parent=self,
-            )
+        if not ruta_local:
+            if self._is_blob_ref(ruta):
+                messagebox.showwarning("Reporte visual", "No se encontro el reporte en la BD.", parent=self)
+            else:
+                reports_dir = os.path.join(self.data_dir, "incidencias_reportes")
+                messagebox.showwarning(
+                    "Reporte visual",
+                    f"No se encontro el archivo del reporte.\n\nRuta guardada:\n{ruta}\n\nCarpeta:\n{reports_dir}",
+                    parent=self,
+                )
             return
+        max_w = int(self.winfo_screenwidth() * 0.8)
+        max_h = int(self.winfo_screenheight() * 0.8) - 60
         try:
-            os.startfile(ruta_resuelta)
+            img = self.adjuntos.vista_previa(ruta, max_w, max_h)
         except Exception as exc:
             messagebox.showerror("Reporte visual", f"No se pudo abrir el reporte.\nDetalle: {exc}", parent=self)
+            return
+
+        def abrir_original():
+            try:
+                os.startfile(ruta_local)
+            except Exception as exc:
+                messagebox.showerror("Reporte visual", f"No se pudo abrir el reporte.\nDetalle: {exc}", parent=win)
+
+        win = tk.Toplevel(self)
+        win.title("Reporte visual")
+        photo = ImageTk.PhotoImage(img)
+        lbl = tk.Label(win, image=photo)
+        lbl.image = photo
+        lbl.pack(padx=6, pady=6)
+        botones = tk.Frame(win)
+        botones.pack(pady=(0, 6))
+        tk.Button(botones, text="Abrir original", command=abrir_original).pack(side="left", padx=4)
+        tk.Button(botones, text="Cerrar", command=win.destroy).pack(side="left", padx=4)
+        win.bind("<Escape>", lambda _e: win.destroy())
+        win.focus_set()
 
     def _incidencias_guardar_reporte(self, ruta):
         if self._is_blob_ref(ruta):
@@ -7319,8 +7372,8 @@ class ResamaniaApp(tk.Tk):
             if not store or not store.use_postgres:
                 messagebox.showwarning("Reporte visual", "Reporte en BD, pero no hay conexion.", parent=self)
                 return
-            _ctype, data = store.get_blob(self._blob_id_from_ref(ruta))
-            if not data:
+            ruta_local = self.adjuntos.ruta_local(ruta)
+            if not ruta_local:
                 messagebox.showwarning("Reporte visual", "No se encontro el reporte en la BD.", parent=self)
                 return
             destino = filedialog.asksaveasfilename(
@@ -7332,8 +7385,7 @@ class ResamaniaApp(tk.Tk):
             if not destino:
                 return
             try:
-                with open(destino, "wb") as f:
-                    f.write(data)
+                shutil.copy2(ruta_local, destino)
                 messagebox.showinfo("Reporte visual", f"Reporte guardado en: {destino}", parent=self)
             except Exception as exc:
                 messagebox.showerror("Reporte visual", f"No se pudo guardar el reporte.\nDetalle: {exc}", parent=self)
@@ -7369,6 +7421,7 @@ class ResamaniaApp(tk.Tk):
         if not self.incidencias_db:
             self.incidencias_mapas = []
             return
+        self.incidencias_prefetch.clear()
         self.incidencias_mapas = self.incidencias_db.list_maps()
         self.incidencias_map_index = 0
         if self.incidencias_mapas:
@@ -7376,6 +7429,7 @@ class ResamaniaApp(tk.Tk):
         else:
             self.incidencias_canvas.delete("all")
             self.incidencias_current_map = None
+            self.incidencias_model = None
         self.incidencias_actualizar_botones_mapa()
 
     def incidencias_actualizar_botones_mapa(self):
@@ -7407,7 +7461,8 @@ class ResamaniaApp(tk.Tk):
             blob_ref = ""
             store = getattr(self, "state_store", None)
             if store and store.use_postgres:
-                blob_ref = self._store_image_blob(ruta, allow_png=True)
+                # Los mapas se guardan a resolucion completa (se trocean en teselas).
+                blob_ref = self._store_image_blob(ruta, allow_png=True, max_lado=None, miniatura=False)
             if blob_ref:
                 img = Image.open(ruta)
                 self.incidencias_db.add_map(nombre, blob_ref, img.width, img.height)
@@ -7432,9 +7487,7 @@ class ResamaniaApp(tk.Tk):
             return
         try:
             if self._is_blob_ref(ruta):
-                store = getattr(self, "state_store", None)
-                if store and store.use_postgres:
-                    store.delete_blob(self._blob_id_from_ref(ruta))
+                self.adjuntos.borrar_blob(ruta)
             else:
                 ruta_resuelta = self._incidencias_resolve_map_path(ruta)
                 if ruta_resuelta and os.path.exists(ruta_resuelta):
@@ -7445,6 +7498,7 @@ class ResamaniaApp(tk.Tk):
         self.incidencias_cargar_listado_mapas()
         if not self.incidencias_mapas:
             self.incidencias_current_map = None
+            self.incidencias_model = None
             self.incidencias_canvas.delete("all")
             for w in self.incidencias_panel.winfo_children():
                 w.destroy()
@@ -7471,63 +7525,274 @@ class ResamaniaApp(tk.Tk):
         self.incidencias_area_items = {}
         self.incidencias_machine_items = {}
         self.incidencias_machine_area = {}
-        if self._is_blob_ref(ruta):
-            store = getattr(self, "state_store", None)
-            if not store or not store.use_postgres:
-                self._bring_to_front()
-                messagebox.showwarning("Mapas", "Mapa en BD, pero no hay conexion.", parent=self)
-                return
-            _ctype, data = store.get_blob(self._blob_id_from_ref(ruta))
-            if not data:
-                self._bring_to_front()
-                messagebox.showwarning("Mapas", "No se encontro el mapa en la BD.", parent=self)
-                return
-            try:
-                img = Image.open(io.BytesIO(data))
-            except Exception as e:
-                self._bring_to_front()
-                messagebox.showerror("Mapas", f"No se pudo abrir el mapa en BD.\n\nDetalle: {e}", parent=self)
-                return
+        self.incidencias_tiles = None
+        self.incidencias_tile_items = {}
+        precargado = self.incidencias_prefetch.get(mapa_row)
+        if precargado:
+            # La piramide precargada sigue valiendo; el modelo puede estar
+            # desfasado (escrituras del otro equipo) y se revalida siempre.
+            pyramid, model = precargado
+            if model.db is self.incidencias_db:
+                model.refresh()
+            else:
+                model = MapaModel(self.incidencias_db, mapa_id)
+                self.incidencias_prefetch.put(mapa_row, (pyramid, model))
         else:
-            ruta_resuelta = self._incidencias_resolve_map_path(ruta, nombre)
-            if not ruta_resuelta:
-                self._bring_to_front()
-                messagebox.showwarning(
-                    "Mapas",
-                    f"No se encontro el archivo del mapa.\n\nRuta guardada:\n{ruta}\n\nNombre:\n{nombre}",
-                    parent=self,
-                )
-                return
-            if ruta_resuelta != ruta:
-                self.incidencias_db.update_map_path(mapa_id, ruta_resuelta)
-            try:
-                img = Image.open(ruta_resuelta)
-            except Exception as e:
-                self._bring_to_front()
-                messagebox.showerror(
-                    "Mapas",
-                    f"No se pudo abrir el mapa:\n{ruta_resuelta}\n\nDetalle: {e}",
-                    parent=self,
-                )
+            pyramid = self._incidencias_load_pyramid(mapa_id, nombre, ruta)
+            if pyramid is None:
                 return
-        self.incidencias_img = ImageTk.PhotoImage(img)
-        self.incidencias_canvas.create_image(0, 0, anchor="nw", image=self.incidencias_img)
-        self.incidencias_canvas.config(scrollregion=(0, 0, img.width, img.height))
+            model = MapaModel(self.incidencias_db, mapa_id)
+            self.incidencias_prefetch.put(mapa_row, (pyramid, model))
+        self.incidencias_tiles = pyramid
+        zoom = self.incidencias_zoom
+        self.incidencias_canvas.config(scrollregion=(0, 0, pyramid.width * zoom, pyramid.height * zoom))
+        self._incidencias_render_tiles()
         self.incidencias_current_map = mapa_id
+        self.incidencias_model = model
+        self._incidencias_dibujar_formas()
+        self._incidencias_precargar_vecinos()
+
+    def _incidencias_dibujar_formas(self):
+        """Redibuja areas y maquinas del mapa actual sin recargar la imagen."""
+        model = self._incidencias_current_model()
+        self.incidencias_canvas.delete("area")
+        self.incidencias_canvas.delete("machine")
+        self.incidencias_area_items = {}
+        self.incidencias_machine_items = {}
+        self.incidencias_machine_area = {}
+        self.incidencias_hover_hit = None
         self.incidencias_color_used = set()
-        for area in self.incidencias_db.list_areas(mapa_id):
+        if not model:
+            return
+        z = self.incidencias_zoom
+        for area in model.list_areas():
             area_id, nombre, x1, y1, x2, y2, color = area
             self.incidencias_color_used.add(color)
-            item = self.incidencias_canvas.create_rectangle(x1, y1, x2, y2, outline=color, width=2, tags=("area", str(area_id)))
+            item = self.incidencias_canvas.create_rectangle(
+                x1 * z, y1 * z, x2 * z, y2 * z, outline=color, width=2, tags=("area", str(area_id))
+            )
             self.incidencias_area_items[area_id] = item
-        for m in self.incidencias_db.list_machines(mapa_id):
+        for m in model.list_machines():
             mid, area_id, nombre, serie, numero, x1, y1, x2, y2, color, _ = m
             self.incidencias_color_used.add(color)
-            item = self.incidencias_canvas.create_rectangle(x1, y1, x2, y2, outline=color, width=2, tags=("machine", str(mid)))
+            item = self.incidencias_canvas.create_rectangle(
+                x1 * z, y1 * z, x2 * z, y2 * z, outline=color, width=2, tags=("machine", str(mid))
+            )
             self.incidencias_machine_items[mid] = item
             self.incidencias_machine_area[mid] = area_id
         self._incidencias_apply_map_filter(self.incidencias_info_filter_area)
 
+    def incidencias_toggle_calor(self):
+        self.incidencias_calor = not self.incidencias_calor
+        if self.incidencias_btn_calor is not None:
+            self.incidencias_btn_calor.configure(relief="sunken" if self.incidencias_calor else "raised")
+        self._incidencias_dibujar_calor()
+
+    @staticmethod
+    def _incidencias_color_calor(ratio):
+        """Amarillo (pocas) -> rojo (muchas) incidencias abiertas."""
+        ratio = max(0.0, min(1.0, ratio))
+        return f"#ff{int(220 * (1 - ratio)):02x}00"
+
+    def _incidencias_dibujar_calor(self):
+        """
+        Capa de calor: colorea areas y maquinas segun sus incidencias abiertas
+        (PENDIENTE/VISTO), a partir de los conteos agrupados del modelo.
+        """
+        canvas = self.incidencias_canvas
+        canvas.delete("calor")
+        model = self._incidencias_current_model()
+        if not self.incidencias_calor or not model:
+            return
+        por_area, por_maquina = model.conteos(estados=("PENDIENTE", "VISTO"))
+        z = self.incidencias_zoom
+        filtro_area = self.incidencias_info_filter_area
+        maximo = max(list(por_area.values()) + list(por_maquina.values()) + [1])
+        capas = []
+        if not filtro_area:
+            for area_id, total in por_area.items():
+                row = model.area(area_id)
+                if row:
+                    capas.append((row[2:6], total))
+        for mid, total in por_maquina.items():
+            row = model.machine(mid)
+            if row and (not filtro_area or row[1] == filtro_area):
+                capas.append((row[5:9], total))
+        for (x1, y1, x2, y2), total in capas:
+            color = self._incidencias_color_calor(total / maximo)
+            canvas.create_rectangle(
+                x1 * z, y1 * z, x2 * z, y2 * z, fill=color, outline="", stipple="gray50", tags=("calor",)
+            )
+            canvas.create_text(
+                (x1 + x2) / 2 * z, (y1 + y2) / 2 * z, text=str(total), fill="#000000",
+                font=("Arial", 10, "bold"), tags=("calor",)
+            )
+        # Encima de las teselas y debajo de los contornos de areas/maquinas.
+        if canvas.find_withtag("tile"):
+            canvas.tag_raise("calor", "tile")
+
+    def _incidencias_pyramid_source(self, mapa_id, nombre, ruta, reparar_ruta=True):
+        """
+        Devuelve (clave, loader, origen) para la piramide del mapa, o
+        (None, aviso, None) si no se puede abrir. No muestra dialogos.
+        """
+        cache_dir = get_local_cache_dir("map_tiles")
+        if self._is_blob_ref(ruta):
+            store = getattr(self, "state_store", None)
+            blob_id = self._blob_id_from_ref(ruta)
+            key = cache_key("blob", blob_id)
+            if not TilePyramid.exists(cache_dir, key) and (not store or not store.use_postgres):
+                return None, "Mapa en BD, pero no hay conexion.", None
+
+            def loader():
+                _ctype, data = store.get_blob(blob_id)
+                if not data:
+                    raise FileNotFoundError("No se encontro el mapa en la BD.")
+                return Image.open(io.BytesIO(data))
+
+            return key, loader, "BD"
+        ruta_resuelta = self._incidencias_resolve_map_path(ruta, nombre)
+        if not ruta_resuelta:
+            return None, f"No se encontro el archivo del mapa.\n\nRuta guardada:\n{ruta}\n\nNombre:\n{nombre}", None
+        if reparar_ruta and ruta_resuelta != ruta:
+            self.incidencias_db.update_map_path(mapa_id, ruta_resuelta)
+        try:
+            st = os.stat(ruta_resuelta)
+            key = cache_key("file", ruta_resuelta, st.st_size, int(st.st_mtime))
+        except OSError:
+            key = cache_key("file", ruta_resuelta)
+
+        def loader():
+            return Image.open(ruta_resuelta)
+
+        return key, loader, ruta_resuelta
+
+    def _incidencias_load_pyramid(self, mapa_id, nombre, ruta):
+        """
+        Devuelve la piramide de teselas del mapa. La imagen original solo se
+        descarga/decodifica la primera vez; despues se usan las teselas en cache.
+        """
+        key, loader, origen = self._incidencias_pyramid_source(mapa_id, nombre, ruta)
+        if key is None:
+            self._bring_to_front()
+            messagebox.showwarning("Mapas", loader, parent=self)
+            return None
+        try:
+            return TilePyramid.load_or_build(get_local_cache_dir("map_tiles"), key, loader)
+        except Exception as e:
+            self._bring_to_front()
+            messagebox.showerror("Mapas", f"No se pudo abrir el mapa:\n{origen}\n\nDetalle: {e}", parent=self)
+            return None
+
+    def _incidencias_precargar_vecinos(self):
+        mapas = self.incidencias_mapas
+        if len(mapas) <= 1:
+            return
+        idx = self.incidencias_map_index
+        vecinos = [mapas[(idx + 1) % len(mapas)], mapas[(idx - 1) % len(mapas)]]
+        self.incidencias_prefetch.prefetch(vecinos)
+
+    def _incidencias_precargar_mapa(self, mapa_row):
+        """
+        Se ejecuta en el hilo de precarga: genera/abre la piramide, decodifica
+        las teselas de la vista inicial y carga areas, maquinas e incidencias.
+        La ruta no se corrige en BD desde aqui; se hara al mostrarlo.
+        """
+        mapa_id, nombre, ruta = mapa_row[:3]
+        key, loader, _origen = self._incidencias_pyramid_source(mapa_id, nombre, ruta, reparar_ruta=False)
+        if key is None:
+            return None
+        pyramid = TilePyramid.load_or_build(get_local_cache_dir("map_tiles"), key, loader)
+        level = pyramid.level_for_zoom(self.incidencias_zoom)
+        level_w, _level_h = pyramid.level_size(level)
+        ratio = self.incidencias_zoom * pyramid.width / level_w
+        vista_w, vista_h = self.incidencias_canvas_size
+        for tx, ty in pyramid.visible_tiles(level, 0, 0, vista_w / ratio, vista_h / ratio):
+            pyramid.get_tile(level, tx, ty)
+        return pyramid, MapaModel(self.incidencias_db, mapa_id)
+
+    def _incidencias_schedule_tiles(self):
+        if self.incidencias_tile_job is None and self.incidencias_tiles is not None:
+            self.incidencias_tile_job = self.after_idle(self._incidencias_render_tiles)
+
+    def _incidencias_render_tiles(self):
+        """Pinta solo las teselas visibles (mas una de margen) del nivel adecuado al zoom."""
+        self.incidencias_tile_job = None
+        pyramid = self.incidencias_tiles
+        if pyramid is None:
+            return
+        canvas = self.incidencias_canvas
+        zoom = self.incidencias_zoom
+        level = pyramid.level_for_zoom(zoom)
+        level_w, level_h = pyramid.level_size(level)
+        ratio_x = zoom * pyramid.width / level_w
+        ratio_y = zoom * pyramid.height / level_h
+        size = pyramid.tile_size
+        vx1 = canvas.canvasx(0)
+        vy1 = canvas.canvasy(0)
+        self.incidencias_canvas_size = (max(canvas.winfo_width(), 1), max(canvas.winfo_height(), 1))
+        vx2 = vx1 + self.incidencias_canvas_size[0]
+        vy2 = vy1 + self.incidencias_canvas_size[1]
+        wanted = {
+            (level, tx, ty)
+            for tx, ty in pyramid.visible_tiles(
+                level,
+                vx1 / ratio_x - size,
+                vy1 / ratio_y - size,
+                vx2 / ratio_x + size,
+                vy2 / ratio_y + size,
+            )
+        }
+        for key in list(self.incidencias_tile_items):
+            if key not in wanted:
+                canvas.delete(self.incidencias_tile_items.pop(key)[0])
+        nuevas = False
+        for key in sorted(wanted - set(self.incidencias_tile_items)):
+            _level, tx, ty = key
+            tile = pyramid.get_tile(*key)
+            if tile is None:
+                continue
+            x0 = int(round(tx * size * ratio_x))
+            y0 = int(round(ty * size * ratio_y))
+            w = max(1, int(round((tx * size + tile.width) * ratio_x)) - x0)
+            h = max(1, int(round((ty * size + tile.height) * ratio_y)) - y0)
+            if (w, h) != tile.size:
+                tile = tile.resize((w, h), Image.BILINEAR)
+            photo = ImageTk.PhotoImage(tile)
+            item = canvas.create_image(x0, y0, anchor="nw", image=photo, tags=("tile",))
+            self.incidencias_tile_items[key] = (item, photo)
+            nuevas = True
+        if nuevas:
+            canvas.tag_lower("tile")
+
+    def _incidencias_set_zoom(self, zoom, anchor=None):
+        pyramid = self.incidencias_tiles
+        if pyramid is None:
+            return
+        zoom = max(0.1, min(4.0, zoom))
+        if abs(zoom - self.incidencias_zoom) < 1e-6:
+            return
+        canvas = self.incidencias_canvas
+        if anchor is None:
+            anchor = (canvas.winfo_width() / 2, canvas.winfo_height() / 2)
+        # Punto del mapa bajo el cursor, para mantenerlo fijo tras el zoom
+        map_x = canvas.canvasx(anchor[0]) / self.incidencias_zoom
+        map_y = canvas.canvasy(anchor[1]) / self.incidencias_zoom
+        self.incidencias_zoom = zoom
+        total_w = pyramid.width * zoom
+        total_h = pyramid.height * zoom
+        canvas.delete("tile")
+        self.incidencias_tile_items = {}
+        canvas.config(scrollregion=(0, 0, total_w, total_h))
+        self._incidencias_dibujar_formas()
+        canvas.xview_moveto(max(0.0, (map_x * zoom - anchor[0]) / total_w))
+        canvas.yview_moveto(max(0.0, (map_y * zoom - anchor[1]) / total_h))
+        self._incidencias_render_tiles()
+
+    def incidencias_canvas_zoom(self, event):
+        factor = 1.25 if event.delta > 0 else 1 / 1.25
+        self._incidencias_set_zoom(self.incidencias_zoom * factor, anchor=(event.x, event.y))
+
     def _incidencias_resolve_map_path(self, ruta, nombre=None):
         if not ruta:
             return ""
@@ -7557,11 +7822,31 @@ class ResamaniaApp(tk.Tk):
                     return candidate
         return ""
 
+    def _incidencias_reportes_index(self):
+        reports_dir = os.path.normpath(os.path.join(self.data_dir, "incidencias_reportes"))
+        index = self.incidencias_reportes_idx
+        if index is None or index.reports_dir != reports_dir:
+            index = ReportesIndex(reports_dir)
+            self.incidencias_reportes_idx = index
+        return index
+
     def _incidencias_resolve_reporte_path(self, ruta):
         if not ruta:
             return ""
         if self._is_blob_ref(ruta):
             return ""
+        # Primero el indice de la carpeta (sin tocar disco); si no esta, se
+        # reindexa una vez y despues se prueban las rutas antiguas.
+        index = self._incidencias_reportes_index()
+        resolved = index.resolve(ruta)
+        if not resolved:
+            index.refresh()
+            resolved = index.resolve(ruta)
+            if resolved:
+                # Puede haber miniaturas marcadas como no encontradas.
+                self.adjuntos.olvidar_faltas()
+        if resolved:
+            return resolved
         ruta_norm = os.path.normpath(ruta)
         reports_dir = os.path.join(self.data_dir, "incidencias_reportes")
         if os.path.isabs(ruta_norm) and os.path.exists(ruta_norm):
@@ -7576,6 +7861,12 @@ class ResamaniaApp(tk.Tk):
             return candidate
         return ""
 
+    def _incidencias_resolve_reporte_indexado(self, ruta):
+        """Como _incidencias_resolve_reporte_path pero solo con el indice en memoria (hover)."""
+        if not ruta or self._is_blob_ref(ruta):
+            return ""
+        return self._incidencias_reportes_index().resolve(ruta)
+
     def _incidencias_store_reporte_path(self, ruta_resuelta):
         if not ruta_resuelta:
             return ""
@@ -7628,6 +7919,7 @@ class ResamaniaApp(tk.Tk):
         else:
             self.incidencias_info_filter_area = area_id
 
+        self._incidencias_revalidar_modelo()
         self._incidencias_set_area_header(self.incidencias_info_filter_area)
         self._incidencias_apply_map_filter(self.incidencias_info_filter_area)
 
@@ -7650,7 +7942,7 @@ class ResamaniaApp(tk.Tk):
         vscroll.grid(row=0, column=1, sticky="ns")
         tree.configure(yscrollcommand=vscroll.set)
 
-        for m in self.incidencias_db.list_machines(self.incidencias_current_map):
+        for m in self._incidencias_list_machines():
             mid, area_id_db, nombre, serie, numero, *_rest, area_nombre = m
             if self.incidencias_info_filter_area and area_id_db != self.incidencias_info_filter_area:
                 continue
@@ -7708,30 +8000,17 @@ class ResamaniaApp(tk.Tk):
             mid = int(row)
             if not self._incidencias_pin_ok():
                 return
-            machine = None
-            for m in self.incidencias_db.list_machines(self.incidencias_current_map):
-                if int(m[0]) == mid:
-                    machine = m
-                    break
+            machine = self._incidencias_get_machine_by_id(mid)
             if not machine:
                 return
-            _, _area_id, nombre, serie, numero, x1, y1, x2, y2, _color, _area_nombre = machine
+            _, _area_id, nombre, serie, numero, *_rest = machine
             self._bring_to_front()
             nombre_n = self._incidencias_prompt_text("Maquina", "Nombre de la maquina:", nombre)
             if nombre_n is None:
                 return
             serie_n = self._incidencias_prompt_text("Maquina", "Numero de serie:", serie)
             numero_n = self._incidencias_prompt_text("Maquina", "Numero asignado:", numero)
-            self.incidencias_db.update_machine(
-                mid,
-                nombre_n or "",
-                serie_n or "",
-                numero_n or "",
-                int(x1),
-                int(y1),
-                int(x2),
-                int(y2),
-            )
+            self._incidencias_guardar_maquina(machine, nombre_n, serie_n, numero_n)
             self.incidencias_mostrar_mapa(self.incidencias_mapas[self.incidencias_map_index])
             self.incidencias_info_maquinas(self.incidencias_info_filter_area)
 
@@ -7867,7 +8146,7 @@ class ResamaniaApp(tk.Tk):
         if not self._security_pin_ok():
             return
         self.cargar_staff()
-        tab = self.tabs.get("Staff")
+        tab = self._construir_pestana("Staff")
         if tab:
             self.notebook.add(tab, text="Staff", image=self.tab_icons.get("Staff"), compound="left")
             self.notebook.select(tab)
@@ -7916,6 +8195,7 @@ class ResamaniaApp(tk.Tk):
     def incidencias_gestion_incidencias(self):
         self.incidencias_panel_mode = "incidencias"
         self.incidencias_info_filter_area = None
+        self._incidencias_revalidar_modelo()
         self._incidencias_set_area_header(None)
         self._incidencias_apply_map_filter(None)
         for w in self.incidencias_panel.winfo_children():
@@ -7951,7 +8231,8 @@ class ResamaniaApp(tk.Tk):
         tree.tag_configure("reparado", background="#d4edda")
         self.incidencias_area_to_inc = {}
         filtro_estado = (self.incidencias_filtro_estado or "TODAS").upper()
-        for inc in self.incidencias_db.list_incidencias(self.incidencias_current_map):
+        model = self._incidencias_current_model()
+        for inc in (model.list_incidencias() if model else []):
             (
                 inc_id,
                 fecha,
@@ -7969,13 +8250,6 @@ class ResamaniaApp(tk.Tk):
                 serie,
                 numero,
             ) = inc
-            if reporte_path:
-                resolved = self._incidencias_resolve_reporte_path(reporte_path)
-                if resolved:
-                    stored = self._incidencias_store_reporte_path(resolved)
-                    if stored and stored != reporte_path:
-                        self.incidencias_db.update_incidencia_reporte(inc_id, stored)
-                    reporte_path = stored
             if filtro_estado == "VISTO_PENDIENTE":
                 if estado not in ("VISTO", "PENDIENTE"):
                     continue
@@ -8023,9 +8297,10 @@ class ResamaniaApp(tk.Tk):
 
         tooltip = {"win": None, "label": None, "text": ""}
 
-        def show_tooltip(texto, x, y):
-            if not texto:
+        def show_tooltip(texto, x, y, imagen=None):
+            if not texto and imagen is None:
                 return
+            clave = texto if imagen is None else ("img", id(imagen))
             if tooltip["win"] is None:
                 tip = tk.Toplevel(self)
                 tip.wm_overrideredirect(True)
@@ -8033,10 +8308,16 @@ class ResamaniaApp(tk.Tk):
                 label.pack(ipadx=4, ipady=2)
                 tooltip["win"] = tip
                 tooltip["label"] = label
-                tooltip["text"] = texto
-            elif tooltip["text"] != texto and tooltip["label"] is not None:
-                tooltip["label"].config(text=texto)
-                tooltip["text"] = texto
+                tooltip["text"] = None
+            if tooltip["text"] != clave and tooltip["label"] is not None:
+                if imagen is not None:
+                    photo = ImageTk.PhotoImage(imagen)
+                    tooltip["label"].config(image=photo, text="")
+                    tooltip["label"].image = photo
+                else:
+                    tooltip["label"].config(image="", text=texto)
+                    tooltip["label"].image = None
+                tooltip["text"] = clave
             tooltip["win"].wm_geometry(f"+{x}+{y}")
 
         def hide_tooltip():
@@ -8115,6 +8396,13 @@ class ResamaniaApp(tk.Tk):
                     show_tooltip(str(desc), event.x_root + 12, event.y_root + 12)
                 else:
                     hide_tooltip()
+            elif col_index == cols.index("reporte") and data.get("reporte"):
+                # Miniatura del reporte (sin descargar la imagen principal).
+                mini = self.adjuntos.miniatura(data.get("reporte"))
+                if mini is not None:
+                    show_tooltip("", event.x_root + 12, event.y_root + 12, imagen=mini)
+                else:
+                    hide_tooltip()
             else:
                 hide_tooltip()
 
@@ -8187,22 +8475,42 @@ class ResamaniaApp(tk.Tk):
             self.incidencias_canvas.itemconfig(self.incidencias_area_items[area_id], width=4)
 
     def incidencias_canvas_hover(self, event):
-        cx = self.incidencias_canvas.canvasx(event.x)
-        cy = self.incidencias_canvas.canvasy(event.y)
-        item = self.incidencias_canvas.find_closest(cx, cy)
-        if not item:
-            self.incidencias_canvas_leave(event)
+        # Se procesa como mucho un movimiento por frame (~60 fps).
+        self.incidencias_hover_event = (event.x, event.y)
+        if self.incidencias_hover_job is None:
+            self.incidencias_hover_job = self.after(16, self._incidencias_procesar_hover)
+
+    def _incidencias_hit(self, cx, cy, kind=None):
+        model = self._incidencias_current_model()
+        if not model:
+            return None
+        z = self.incidencias_zoom
+        return model.hit_test(cx / z, cy / z, kind=kind, area_filter=self.incidencias_info_filter_area)
+
+    def _incidencias_procesar_hover(self):
+        self.incidencias_hover_job = None
+        if not self.incidencias_hover_event:
+            return
+        x, y = self.incidencias_hover_event
+        hit = self._incidencias_hit(self.incidencias_canvas.canvasx(x), self.incidencias_canvas.canvasy(y))
+        if hit == self.incidencias_hover_hit:
             return
-        item_id = item[0]
-        tags = self.incidencias_canvas.gettags(item_id)
-        if "machine" in tags:
-            mid = int(tags[1])
+        self.incidencias_hover_hit = hit
+        if not hit:
+            self._incidencias_resaltar_maquina(None)
+            self._incidencias_resaltar_area(None)
+            return
+        kind, oid = hit
+        if kind == "machine":
+            mid = oid
+            self._incidencias_resaltar_area(None)
             self._incidencias_resaltar_maquina(mid)
             if self.incidencias_panel_mode == "machines" and hasattr(self, "incidencias_machines_tree"):
                 self.incidencias_machines_tree.selection_set(str(mid))
                 self.incidencias_machines_tree.see(str(mid))
-        elif "area" in tags:
-            aid = int(tags[1])
+        else:
+            aid = oid
+            self._incidencias_resaltar_maquina(None)
             self._incidencias_resaltar_area(aid)
             if self.incidencias_panel_mode == "incidencias" and hasattr(self, "incidencias_incidencias_tree"):
                 # Selecciona la incidencia mas reciente del area
@@ -8213,6 +8521,14 @@ class ResamaniaApp(tk.Tk):
                     self.incidencias_incidencias_tree.see(inc_id)
 
     def incidencias_canvas_leave(self, event):
+        if self.incidencias_hover_job is not None:
+            try:
+                self.after_cancel(self.incidencias_hover_job)
+            except Exception:
+                pass
+        self.incidencias_hover_job = None
+        self.incidencias_hover_event = None
+        self.incidencias_hover_hit = None
         self._incidencias_resaltar_maquina(None)
         self._incidencias_resaltar_area(None)
         if self.incidencias_panel_mode == "machines" and hasattr(self, "incidencias_machines_tree"):
@@ -8220,29 +8536,31 @@ class ResamaniaApp(tk.Tk):
         if self.incidencias_panel_mode == "incidencias" and hasattr(self, "incidencias_incidencias_tree"):
             self.incidencias_incidencias_tree.selection_remove(self.incidencias_incidencias_tree.selection())
 
+    def _incidencias_current_model(self):
+        """MapaModel del mapa mostrado (areas/maquinas/incidencias en memoria)."""
+        if not self.incidencias_current_map or not self.incidencias_db:
+            return None
+        model = self.incidencias_model
+        if model is None or model.mapa_id != self.incidencias_current_map or model.db is not self.incidencias_db:
+            model = MapaModel(self.incidencias_db, self.incidencias_current_map)
+            self.incidencias_model = model
+        return model
+
+    def _incidencias_list_machines(self):
+        model = self._incidencias_current_model()
+        return model.list_machines() if model else []
+
     def _incidencias_area_name_by_id(self, area_id):
-        for a in self.incidencias_db.list_areas(self.incidencias_current_map):
-            aid, anombre, *_rest = a
-            if aid == area_id:
-                return anombre
-        return None
+        model = self._incidencias_current_model()
+        return model.area_name(area_id) if model else None
 
     def _incidencias_find_machine_id_by_name(self, nombre):
-        for mid, item in self.incidencias_machine_items.items():
-            # Busca en DB para evitar depender del canvas
-            pass
-        for m in self.incidencias_db.list_machines(self.incidencias_current_map):
-            mid, _area_id, mnombre, _serie, _numero, *_rest = m
-            if mnombre == nombre:
-                return mid
-        return None
+        model = self._incidencias_current_model()
+        return model.machine_id_by_name(nombre) if model else None
 
     def _incidencias_find_area_id_by_name(self, nombre):
-        for a in self.incidencias_db.list_areas(self.incidencias_current_map):
-            aid, anombre, *_rest = a
-            if anombre == nombre:
-                return aid
-        return None
+        model = self._incidencias_current_model()
+        return model.area_id_by_name(nombre) if model else None
     def _incidencias_editar_incidencia(self, inc_id):
         if not self._require_write("incidencias_club"):
             return
@@ -8255,6 +8573,7 @@ class ResamaniaApp(tk.Tk):
         reporte_actual = None
         if hasattr(self, "incidencias_inc_map"):
             reporte_actual = self.incidencias_inc_map.get(inc_id, {}).get("reporte")
+        reporte_nuevo = None
         if messagebox.askyesno("Incidencia", "Desea cambiar reporte visual?", parent=self):
             reporte_nuevo = self._incidencias_pedir_reporte_visual()
             if reporte_nuevo:
@@ -8263,8 +8582,10 @@ class ResamaniaApp(tk.Tk):
                         os.remove(reporte_actual)
                     except Exception:
                         pass
+        with self.incidencias_db.transaction():
+            if reporte_nuevo:
                 self.incidencias_db.update_incidencia_reporte(inc_id, reporte_nuevo)
-        self.incidencias_db.update_incidencia(inc_id, elemento or "", descripcion or "", estado)
+            self.incidencias_db.update_incidencia(inc_id, elemento or "", descripcion or "", estado)
         self.incidencias_gestion_incidencias()
 
     def _incidencias_cambiar_reporte(self, inc_id):
@@ -8366,12 +8687,55 @@ class ResamaniaApp(tk.Tk):
             tree.move(k, "", index)
         tree._sort_reverse[col] = not reverse
 
+    def _incidencias_revalidar_modelo(self):
+        """
+        Recarga el modelo del mapa actual desde la BD compartida (lo que haya
+        escrito el otro equipo) y redibuja las formas si cambio el layout.
+        """
+        model = self._incidencias_current_model()
+        if model and "layout" in model.refresh():
+            self._incidencias_dibujar_formas()
+
     def _incidencias_get_machine_by_id(self, mid):
-        machines = self.incidencias_db.list_machines(self.incidencias_current_map)
-        for m in machines:
-            if int(m[0]) == int(mid):
-                return m
-        return None
+        model = self._incidencias_current_model()
+        return model.machine(mid) if model else None
+
+    def _incidencias_guardar_maquina(self, machine, nombre, serie, numero, rect=None):
+        """Guarda una maquina editada (dialogo o arrastre) con IncidenciasDB.apply_layout."""
+        mid, area_id, _nombre, _serie, _numero, x1, y1, x2, y2, color = machine[:10]
+        x1, y1, x2, y2 = rect or (x1, y1, x2, y2)
+        fila = (mid, area_id, nombre or "", serie or "", numero or "", int(x1), int(y1), int(x2), int(y2), color)
+        self.incidencias_db.apply_layout(self.incidencias_current_map, machines=[fila])
+
+    def _incidencias_guardar_area(self, area_id, nombre, rect):
+        """
+        Guarda un area redibujada y recoloca sus maquinas en el nuevo
+        rectangulo, todo en una sola transaccion (apply_layout).
+        """
+        model = self._incidencias_current_model()
+        area = model.area(area_id) if model else None
+        if not area:
+            return
+        ox1, oy1, ox2, oy2 = area[2:6]
+        nx1, ny1, nx2, ny2 = rect
+        sx = (nx2 - nx1) / (ox2 - ox1) if ox2 != ox1 else 1.0
+        sy = (ny2 - ny1) / (oy2 - oy1) if oy2 != oy1 else 1.0
+
+        def recolocar(x, y):
+            return int(round(nx1 + (x - ox1) * sx)), int(round(ny1 + (y - oy1) * sy))
+
+        maquinas = []
+        for m in model.list_machines():
+            if m[1] != area_id:
+                continue
+            mx1, my1 = recolocar(m[5], m[6])
+            mx2, my2 = recolocar(m[7], m[8])
+            maquinas.append((*m[0:5], mx1, my1, mx2, my2, m[9]))
+        self.incidencias_db.apply_layout(
+            self.incidencias_current_map,
+            areas=[(area_id, nombre, nx1, ny1, nx2, ny2, area[6])],
+            machines=maquinas,
+        )
 
     def _incidencias_crear_incidencia_maquina(self, mid):
         machine = self._incidencias_get_machine_by_id(mid)
@@ -8404,23 +8768,14 @@ class ResamaniaApp(tk.Tk):
         machine = self._incidencias_get_machine_by_id(mid)
         if not machine:
             return
-        _, _area_id, nombre, serie, numero, x1, y1, x2, y2, _color, _area_nombre = machine
+        _, _area_id, nombre, serie, numero, *_rest = machine
         self._bring_to_front()
         nombre_n = self._incidencias_prompt_text("Maquina", "Nombre de la maquina:", nombre)
         if nombre_n is None:
             return
         serie_n = self._incidencias_prompt_text("Maquina", "Numero de serie:", serie)
         numero_n = self._incidencias_prompt_text("Maquina", "Numero asignado:", numero)
-        self.incidencias_db.update_machine(
-            mid,
-            nombre_n or "",
-            serie_n or "",
-            numero_n or "",
-            int(x1),
-            int(y1),
-            int(x2),
-            int(y2),
-        )
+        self._incidencias_guardar_maquina(machine, nombre_n, serie_n, numero_n)
         self.incidencias_mostrar_mapa(self.incidencias_mapas[self.incidencias_map_index])
         self.incidencias_info_maquinas(self.incidencias_info_filter_area)
 
@@ -8435,17 +8790,10 @@ class ResamaniaApp(tk.Tk):
     def incidencias_canvas_right_click(self, event):
         cx = self.incidencias_canvas.canvasx(event.x)
         cy = self.incidencias_canvas.canvasy(event.y)
-        items = self.incidencias_canvas.find_overlapping(cx, cy, cx, cy)
-        target = None
-        for item_id in items:
-            tags = self.incidencias_canvas.gettags(item_id)
-            if "machine" in tags:
-                target = item_id
-                break
-        if target is None:
+        hit = self._incidencias_hit(cx, cy, kind="machine")
+        if hit is None:
             return
-        tags = self.incidencias_canvas.gettags(target)
-        mid = int(tags[1])
+        mid = hit[1]
         self.incidencias_selected_machine = mid
         if self.incidencias_panel_mode == "machines" and self.incidencias_machines_tree is not None:
             self.incidencias_machines_tree.selection_set(str(mid))
@@ -8504,11 +8852,10 @@ class ResamaniaApp(tk.Tk):
 
         mode = self.incidencias_mode[0]
         if mode in ("pick_area_edit", "pick_area_machine", "pick_machine_edit", "inc_maquina", "inc_area"):
-            item = self.incidencias_canvas.find_closest(cx, cy)
-            if not item:
-                return
-            item_id = item[0]
-            tags = self.incidencias_canvas.gettags(item_id)
+            kind = "machine" if mode in ("pick_machine_edit", "inc_maquina") else "area"
+            hit = self._incidencias_hit(cx, cy, kind=kind)
+            # Mismo formato que los tags del canvas: (tipo, id)
+            tags = (hit[0], str(hit[1])) if hit else ()
 
             if mode == "pick_area_edit":
                 if "area" not in tags:
@@ -8561,12 +8908,8 @@ class ResamaniaApp(tk.Tk):
                     messagebox.showwarning("Incidencia", "Selecciona una maquina en el mapa.", parent=self)
                     return
                 mid = int(tags[1])
-                machines = self.incidencias_db.list_machines(self.incidencias_current_map)
-                area_id = None
-                for m in machines:
-                    if m[0] == mid:
-                        area_id = m[1]
-                        break
+                model = self._incidencias_current_model()
+                area_id = model.machine_area_id(mid) if model else None
                 self._bring_to_front()
                 elemento = self._incidencias_prompt_text("Incidencia", "Material/elemento:")
                 descripcion = self._incidencias_prompt_text("Incidencia", "Describe la incidencia:")
@@ -8647,7 +8990,8 @@ class ResamaniaApp(tk.Tk):
             return
         if not self.incidencias_draw_rect:
             return
-        x1, y1, x2, y2 = self.incidencias_canvas.coords(self.incidencias_draw_rect)
+        z = self.incidencias_zoom
+        x1, y1, x2, y2 = (v / z for v in self.incidencias_canvas.coords(self.incidencias_draw_rect))
         self.incidencias_canvas.delete(self.incidencias_draw_rect)
         self.incidencias_draw_rect = None
         self._bring_to_front()
@@ -8658,11 +9002,11 @@ class ResamaniaApp(tk.Tk):
             nombre = self.incidencias_mode[1]
             color = self._incidencias_color()
             self.incidencias_db.add_area(self.incidencias_current_map, nombre, int(x1), int(y1), int(x2), int(y2), color)
-            self.incidencias_mostrar_mapa(self.incidencias_mapas[self.incidencias_map_index])
+            self._incidencias_dibujar_formas()
         elif self.incidencias_mode[0] == "area_edit":
             nombre, area_id = self.incidencias_mode[1], self.incidencias_mode[2]
-            self.incidencias_db.update_area(area_id, nombre, int(x1), int(y1), int(x2), int(y2))
-            self.incidencias_mostrar_mapa(self.incidencias_mapas[self.incidencias_map_index])
+            self._incidencias_guardar_area(area_id, nombre, (int(x1), int(y1), int(x2), int(y2)))
+            self._incidencias_dibujar_formas()
         elif self.incidencias_mode[0] == "machine":
             area_id = self.incidencias_mode[1]
             self._bring_to_front()
@@ -8671,41 +9015,109 @@ class ResamaniaApp(tk.Tk):
             numero = self._incidencias_prompt_text("Maquina", "Numero asignado:")
             color = self._incidencias_color()
             self.incidencias_db.add_machine(area_id, nombre or "", serie or "", numero or "", int(x1), int(y1), int(x2), int(y2), color)
-            self.incidencias_mostrar_mapa(self.incidencias_mapas[self.incidencias_map_index])
+            self._incidencias_dibujar_formas()
         elif self.incidencias_mode[0] == "machine_edit":
             mid, nombre, serie, numero = self.incidencias_mode[1], self.incidencias_mode[2], self.incidencias_mode[3], self.incidencias_mode[4]
-            self.incidencias_db.update_machine(mid, nombre or "", serie or "", numero or "", int(x1), int(y1), int(x2), int(y2))
-            self.incidencias_mostrar_mapa(self.incidencias_mapas[self.incidencias_map_index])
+            machine = self._incidencias_get_machine_by_id(mid)
+            if machine:
+                self._incidencias_guardar_maquina(machine, nombre, serie, numero, (int(x1), int(y1), int(x2), int(y2)))
+            self._incidencias_dibujar_formas()
         self.incidencias_vista_general()
         self.incidencias_mode = None
 
     def exportar_excel(self):
         if not self._require_manager_access("Exportar a Excel"):
             return
+        pestana_activa = self.notebook.select()
+        nombre_pestana = self.notebook.tab(pestana_activa, "text")
+        if nombre_pestana not in self.tabs:
+            messagebox.showwarning("Sin datos", f"La pestana {nombre_pestana} no tiene tabla para exportar.", parent=self)
+            return
+        try:
+            df_exportar = self._tabla_df(nombre_pestana)
+        except Exception as e:
+            messagebox.showerror("Error al exportar", str(e), parent=self)
+            return
+        if df_exportar.empty:
+            messagebox.showwarning("Sin datos", f"No hay datos para exportar en la pestana {nombre_pestana}.", parent=self)
+            return
+        archivo = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("CSV (separado por ;)", "*.csv")],
+            initialfile=f"{nombre_pestana.replace(' ', '_')}.xlsx"
+        )
+        if archivo:
+            self._exportar_hojas([(nombre_pestana, df_exportar)], archivo)
+
+    def exportar_todo(self):
+        """Exporta todas las pestanas con datos a un unico libro (una hoja por pestana)."""
+        if not self._require_manager_access("Exportar a Excel"):
+            return
+        hojas = []
         try:
-            pestana_activa = self.notebook.select()
-            nombre_pestana = self.notebook.tab(pestana_activa, "text")
-            tree = self.tabs[nombre_pestana].tree
+            for nombre in self.tabs:
+                df = self._tabla_df(nombre)
+                if not df.empty:
+                    hojas.append((nombre, df))
+        except Exception as e:
+            messagebox.showerror("Error al exportar", str(e), parent=self)
+            return
+        if not hojas:
+            messagebox.showwarning("Sin datos", "No hay datos cargados en ninguna pestana.", parent=self)
+            return
+        archivo = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx"), ("CSV (un archivo por pestana)", "*.csv")],
+            initialfile=f"resamania_{datetime.now():%Y%m%d}.xlsx"
+        )
+        if archivo:
+            self._exportar_hojas(hojas, archivo)
+
+    def _exportar_hojas(self, hojas, archivo, detalle=""):
+        """
+        Escribe [(nombre, DataFrame)] con utils.exportar en segundo plano,
+        mostrando una ventana con el progreso por filas. `detalle` se anade
+        al mensaje final.
+        """
+        avance = {"hechas": 0, "total": sum(len(df) for _n, df in hojas)}
 
-            if not tree.get_children():
-                messagebox.showwarning("Sin datos", f"No hay datos para exportar en la pestana {nombre_pestana}.", parent=self)
+        def progreso(hechas, total):
+            avance["hechas"], avance["total"] = hechas, total
+
+        win = tk.Toplevel(self)
+        win.title("Exportando")
+        win.transient(self)
+        win.resizable(False, False)
+        # No se puede cerrar a mano: la cierra el propio export al terminar o fallar.
+        win.protocol("WM_DELETE_WINDOW", lambda: None)
+        etiqueta = tk.Label(win, text=f"Exportando {avance['total']} filas...")
+        etiqueta.pack(padx=16, pady=(12, 4))
+        barra = ttk.Progressbar(win, length=320, mode="determinate", maximum=max(1, avance["total"]))
+        barra.pack(padx=16, pady=(0, 12))
+
+        def actualizar():
+            if not win.winfo_exists():
                 return
+            barra["value"] = avance["hechas"]
+            etiqueta.config(text=f"Exportando {avance['hechas']} / {avance['total']} filas...")
 
-            columnas = tree["columns"]
-            datos = [tree.item(i)["values"] for i in tree.get_children()]
-            df_exportar = pd.DataFrame(datos, columns=columnas)
+        def terminado(escritos):
+            if win.winfo_exists():
+                win.destroy()
+            texto = "Datos exportados correctamente a:\n" + "\n".join(escritos)
+            messagebox.showinfo("Exito", f"{detalle}\n{texto}" if detalle else texto, parent=self)
 
-            archivo = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx")],
-                initialfile=f"{nombre_pestana.replace(' ', '_')}.xlsx"
-            )
+        def fallo(error):
+            if win.winfo_exists():
+                win.destroy()
+            messagebox.showerror("Error al exportar", str(error), parent=self)
 
-            if archivo:
-                df_exportar.to_excel(archivo, index=False)
-                messagebox.showinfo("Exito", f"Datos exportados correctamente a:\n{archivo}")
-        except Exception as e:
-            messagebox.showerror("Error al exportar", str(e))
+        self._en_segundo_plano(
+            lambda: exportar_hojas(hojas, archivo, progreso),
+            terminado,
+            fallo,
+            al_progreso=actualizar,
+        )
 
     def enviar_asuntos_propios(self):
         """
@@ -8995,38 +9407,101 @@ Cuerpo copiado al portapapeles. Envia un correo a {destinatario} con asunto:
             messagebox.showwarning("Sin número", "No se ingresó un número de cliente.")
             return
 
-        def normalize(text):
-            t = unicodedata.normalize("NFD", str(text or "")).upper().strip()
-            return "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
-
-        df = self.raw_accesos
-        colmap = {normalize(col): col for col in df.columns}
-        col_cliente = colmap.get("NUMERO DE CLIENTE") or colmap.get("NÚMERO DE CLIENTE") or colmap.get("NカMERO DE CLIENTE")
+        def indice_listo(indice):
+            if indice.col_cliente is None:
+                messagebox.showerror("Columna faltante", "No se encontró la columna 'Número de cliente' en ACCESOS.")
+                return
+            df_filtrado = indice.accesos(numero)
+            if df_filtrado.empty:
+                messagebox.showinfo("Sin resultados", f"No hay accesos para el número de cliente: {numero}")
+                return
+            self.mostrar_en_tabla("Accesos Cliente", df_filtrado)
+            # Ofrecer guardado inmediato con el mismo export (en segundo plano) que el resto de tablas.
+            total = len(df_filtrado)
+            archivo = filedialog.asksaveasfilename(
+                defaultextension=".xlsx",
+                filetypes=[("Excel files", "*.xlsx"), ("CSV (separado por ;)", "*.csv")],
+                initialfile=f"accesos_{numero}.xlsx"
+            )
+            if not archivo:
+                messagebox.showinfo("Accesos filtrados", f"Se encontraron {total} accesos para el cliente {numero}.")
+                return
+            self._exportar_hojas(
+                [(f"Accesos {numero}", df_filtrado)],
+                archivo,
+                detalle=f"Se encontraron {total} accesos para el cliente {numero}.",
+            )
 
-        if not col_cliente:
-            messagebox.showerror("Columna faltante", "No se encontró la columna 'Número de cliente' en ACCESOS.")
+        indice = self.accesos_indice
+        if indice is not None and indice.df is self.raw_accesos:
+            indice_listo(indice)
             return
+        # El indice aun se esta construyendo: se espera en un hilo, no en el de Tk.
+        self._en_segundo_plano(
+            self._indice_accesos,
+            indice_listo,
+            lambda e: messagebox.showerror("Error", f"No se pudieron preparar los accesos:\n{e}"),
+        )
 
-        df_filtrado = df[df[col_cliente].astype(str).str.strip() == numero].copy()
+    def _preparar_indice_accesos(self):
+        """Construye en un hilo el indice por cliente de ACCESOS recien cargado."""
+        accesos = self.raw_accesos
+        self.accesos_indice = None
 
-        if df_filtrado.empty:
-            messagebox.showinfo("Sin resultados", f"No hay accesos para el número de cliente: {numero}")
-        else:
-            self.mostrar_en_tabla("Accesos Cliente", df_filtrado)
-            # Ofrecer guardado inmediato
+        def construir():
+            indice = IndiceAccesos(accesos)
+            if self.raw_accesos is accesos:
+                self.accesos_indice = indice
+
+        hilo = threading.Thread(target=construir, name="accesos-indice", daemon=True)
+        self._accesos_indice_hilo = hilo
+        hilo.start()
+
+    def _indice_accesos(self):
+        """
+        Indice por cliente de ACCESOS (IndiceAccesos) que usa extraer_accesos.
+        Espera al hilo de construccion si aun no ha terminado, asi que se
+        llama desde un hilo (_en_segundo_plano), no desde el de Tk.
+        """
+        hilo = self._accesos_indice_hilo
+        if hilo is not None and hilo.is_alive():
+            hilo.join()
+        if self.accesos_indice is None or self.accesos_indice.df is not self.raw_accesos:
+            self.accesos_indice = IndiceAccesos(self.raw_accesos)
+        return self.accesos_indice
+
+    def _en_segundo_plano(self, trabajo, al_terminar=None, al_fallar=None, al_progreso=None):
+        """
+        Ejecuta `trabajo()` en un hilo y despues llama, ya en el hilo de Tk,
+        a al_terminar(resultado) o al_fallar(error). `al_progreso()` se llama
+        en el hilo de Tk en cada comprobacion mientras el hilo sigue vivo.
+        Lo que corre en el hilo no debe tocar widgets.
+        """
+        estado = {}
+
+        def correr():
             try:
-                archivo = filedialog.asksaveasfilename(
-                    defaultextension=".xlsx",
-                    filetypes=[("Excel files", "*.xlsx")],
-                    initialfile=f"accesos_{numero}.xlsx"
-                )
-                if archivo:
-                    df_filtrado.to_excel(archivo, index=False)
-                    messagebox.showinfo("Accesos filtrados", f"Se encontraron {len(df_filtrado)} accesos para el cliente {numero}.\nGuardado en:\n{archivo}")
-                else:
-                    messagebox.showinfo("Accesos filtrados", f"Se encontraron {len(df_filtrado)} accesos para el cliente {numero}.")
+                estado["resultado"] = trabajo()
             except Exception as e:
-                messagebox.showerror("Error al guardar", f"Se filtraron {len(df_filtrado)} accesos pero falló el guardado:\n{e}")
+                estado["error"] = e
+
+        hilo = threading.Thread(target=correr, daemon=True)
+        hilo.start()
+
+        def comprobar():
+            if hilo.is_alive():
+                if al_progreso:
+                    al_progreso()
+                self.after(100, comprobar)
+                return
+            if "error" in estado:
+                if al_fallar:
+                    al_fallar(estado["error"])
+            elif al_terminar:
+                al_terminar(estado.get("resultado"))
+
+        self.after(100, comprobar)
+        return hilo
 
     def enviar_avanza_fit(self):
         """
@@ -9089,19 +9564,28 @@ Cuerpo copiado al portapapeles. Envia un correo a {destinatario} con asunto:
             )
 
 
-if __name__ == "__main__":
+def ejecutar(arranque=(), inicio=None):
+    """Crea la ventana principal y entra en el bucle de Tk; los errores fatales van a app.log."""
     try:
-        app = ResamaniaApp()
+        app = ResamaniaApp(arranque, inicio)
         app.mainloop()
     except Exception:
-        try:
-            log_path = os.path.join(get_app_dir(), "app.log")
-            with open(log_path, "a", encoding="utf-8") as f:
-                f.write("\n=== FATAL ERROR ===\n")
-                f.write(datetime.now().isoformat())
-                f.write("\n")
-                f.write(traceback.format_exc())
-                f.write("\n")
-        except Exception:
-            pass
+        _log_error_fatal()
         raise
+
+
+def _log_error_fatal():
+    try:
+        log_path = os.path.join(get_app_dir(), "app.log")
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write("\n=== FATAL ERROR ===\n")
+            f.write(datetime.now().isoformat())
+            f.write("\n")
+            f.write(traceback.format_exc())
+            f.write("\n")
+    except Exception:
+        pass
+
+
+if __name__ == "__main__":
+    ejecutar()
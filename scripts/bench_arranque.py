@@ -0,0 +1,117 @@
+"""
+Benchmark de arranque: mide con `python -X importtime` cuanto cuesta
+importar main.py y cada modulo pesado (pandas, numpy, PIL, psycopg,
+win32com) en un proceso limpio, y que queda en el camino critico antes de
+la ventana de carga (arranque.py solo importa tkinter antes de mostrarla).
+
+Uso, desde la carpeta del proyecto:
+    python scripts/bench_arranque.py [--repeticiones 5] [--top 12]
+
+Con --log el resumen se anade a startup.log (junto a timings.log) para
+comparar equipos. Los tiempos de la aplicacion real (ventana, widgets,
+primer pintado, datos) los escribe la propia app en startup.log.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Lo que arranque.py importa antes de mostrar la ventana de carga.
+CAMINO_CRITICO = "import tkinter, threading, traceback"
+MODULOS = ("main", "pandas", "numpy", "PIL.Image", "psycopg", "win32com.client")
+
+
+def importtime(codigo):
+    """
+    [(nivel, modulo, microsegundos acumulados)] de `python -X importtime -c
+    codigo` en un proceso nuevo, o None si el codigo falla (p.ej. modulo
+    no instalado).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=RAIZ,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return None
+    filas = []
+    for linea in proc.stderr.splitlines():
+        if not linea.startswith("import time:"):
+            continue
+        partes = linea[len("import time:"):].split("|")
+        if len(partes) != 3:
+            continue
+        try:
+            acumulado = int(partes[1])
+        except ValueError:
+            continue  # cabecera
+        nombre = partes[2].rstrip()
+        nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        filas.append((nivel, nombre.strip(), acumulado))
+    return filas
+
+
+def medir(codigo, repeticiones, base=0.0):
+    """
+    Mediana en ms de los imports de `codigo`, descontando `base` (lo que el
+    interprete importa al arrancar, medido con `pass`).
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        filas = importtime(codigo)
+        if filas is None:
+            return None
+        tiempos.append(sum(us for nivel, _nombre, us in filas if nivel == 0) / 1000)
+    return max(0.0, statistics.median(tiempos) - base)
+
+
+def desglose_main(repeticiones):
+    """{import directo de main: mediana ms}: que modulos pesan en `import main`."""
+    medidas = {}
+    for _ in range(repeticiones):
+        filas = importtime("import main") or []
+        for nivel, nombre, us in filas:
+            if nivel == 1:
+                medidas.setdefault(nombre, []).append(us / 1000)
+    return {nombre: statistics.median(v) for nombre, v in medidas.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--log", action="store_true", help="anade el resumen a startup.log")
+    args = parser.parse_args()
+    n = max(1, args.repeticiones)
+
+    resumen = []
+    base = medir("pass", n)
+    critico = medir(CAMINO_CRITICO, n, base)
+    print(f"Camino critico hasta la ventana de carga ({CAMINO_CRITICO}): {critico:.1f} ms")
+    resumen.append(("ventana_carga_imports", critico))
+    print("\nImport aislado (mediana de %d procesos):" % n)
+    for modulo in MODULOS:
+        ms = medir(f"import {modulo}", n, base)
+        texto = "no instalado" if ms is None else f"{ms:8.1f} ms"
+        print(f"  {modulo:<18} {texto}")
+        if ms is not None:
+            resumen.append((modulo, ms))
+
+    print(f"\nImports directos mas lentos de main.py (top {args.top}):")
+    desglose = desglose_main(n)
+    for nombre, ms in sorted(desglose.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"  {nombre:<40} {ms:8.1f} ms")
+
+    if args.log:
+        detalle = " | ".join(f"{nombre} {ms / 1000:.3f}s" for nombre, ms in resumen)
+        with open(os.path.join(RAIZ, "startup.log"), "a", encoding="utf-8") as f:
+            f.write(f"{datetime.now().isoformat()} | bench | {detalle}\n")
+
+
+if __name__ == "__main__":
+    main()
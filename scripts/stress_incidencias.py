@@ -0,0 +1,172 @@
+"""
+Prueba de concurrencia de IncidenciasDB: N procesos escriben a la vez en
+el mismo incidencias.db (SQLite en WAL, BEGIN IMMEDIATE) y al final se
+comprueba que no se pierde ni se duplica ninguna fila, que ningun proceso
+ve "database is locked" / "Base de datos ocupada" y que cada proceso
+cuenta en `versions` exactamente las escrituras que ha hecho.
+
+Uso, desde la carpeta del proyecto:
+    python scripts/stress_incidencias.py [--procesos 4] [--escrituras 200]
+        [--lote 1] [--areas-cada 10] [--lock-file] [--db ruta.db]
+
+Sin --db se usa una base temporal que se borra al terminar. Con --lote N
+cada transaccion agrupa N escrituras (IncidenciasDB.transaction()).
+Devuelve codigo 1 si alguna comprobacion falla.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from logic.incidencias import IncidenciasDB  # noqa: E402
+
+
+def _es_bloqueo(error):
+    texto = str(error).lower()
+    return "locked" in texto or "ocupada" in texto or "busy" in texto
+
+
+def escritor(tarea):
+    """
+    Proceso escritor: `escrituras` incidencias (y un area cada `areas_cada`)
+    en lotes de `lote` por transaccion. Devuelve un resumen en dict.
+    """
+    n, db_path, mapa_id, area_id, maquina_id, args, inicio = tarea
+    db = IncidenciasDB(db_path, reports_dir=os.path.dirname(db_path), lock_file=args["lock_file"])
+    escritas = areas = 0
+    bloqueos, errores = [], []
+    time.sleep(max(0.0, inicio - time.time()))  # todos empiezan a la vez
+    t0 = time.perf_counter()
+    i = 0
+    while i < args["escrituras"]:
+        lote = range(i, min(i + args["lote"], args["escrituras"]))
+        hechas = nuevas_areas = 0
+        try:
+            with db.transaction():
+                for j in lote:
+                    db.add_incident(mapa_id, area_id, maquina_id, "stress", f"p{n}-{j}", creador_nombre=f"p{n}")
+                    hechas += 1
+                    if args["areas_cada"] and j % args["areas_cada"] == 0:
+                        db.add_area(mapa_id, f"p{n}-{j}", 0, 0, 1, 1, "#000000")
+                        nuevas_areas += 1
+            escritas += hechas
+            areas += nuevas_areas
+        except Exception as e:
+            (bloqueos if _es_bloqueo(e) else errores).append(f"p{n} lote {i}: {e}")
+        i = lote.stop
+    segundos = time.perf_counter() - t0
+    versions = dict(db.versions)
+    db.close()
+    return {
+        "proceso": n,
+        "escritas": escritas,
+        "areas": areas,
+        "bloqueos": bloqueos,
+        "errores": errores,
+        "versions": versions,
+        "segundos": segundos,
+    }
+
+
+def preparar(db_path):
+    """Crea mapa, area y maquina de referencia. Devuelve (mapa_id, area_id, maquina_id)."""
+    db = IncidenciasDB(db_path, reports_dir=os.path.dirname(db_path))
+    db.add_map("stress", "", 100, 100)
+    mapa_id = db.list_maps()[-1][0]
+    db.add_area(mapa_id, "base", 0, 0, 100, 100, "#000000")
+    area_id = db.list_areas(mapa_id)[-1][0]
+    db.add_machine(area_id, "base", "", "", 10, 10, 20, 20, "#000000")
+    maquina_id = db.list_machines(mapa_id)[-1][0]
+    db.close()
+    return mapa_id, area_id, maquina_id
+
+
+def comprobar(db_path, mapa_id, resultados, args):
+    """Lista de fallos (vacia si todo cuadra)."""
+    fallos = []
+    for r in resultados:
+        fallos.extend(r["bloqueos"])
+        fallos.extend(r["errores"])
+        esperado = {"layout": r["areas"], "incidencias": r["escritas"]}
+        if r["versions"] != esperado:
+            fallos.append(f"p{r['proceso']}: versions {r['versions']} != {esperado}")
+
+    db = IncidenciasDB(db_path, reports_dir=os.path.dirname(db_path))
+    # list_incidencias: (id, fecha, estado, elemento, descripcion, ...)
+    descripciones = [f[4] for f in db.list_incidencias(mapa_id) if f[3] == "stress"]
+    areas = [a for a in db.list_areas(mapa_id) if a[1] != "base"]
+    db.close()
+
+    total = args.procesos * args.escrituras
+    if len(descripciones) != total:
+        fallos.append(f"incidencias en BD: {len(descripciones)} != {total}")
+    if len(set(descripciones)) != len(descripciones):
+        fallos.append("hay incidencias duplicadas")
+    esperadas = {f"p{n}-{j}" for n in range(args.procesos) for j in range(args.escrituras)}
+    perdidas = esperadas - set(descripciones)
+    if perdidas:
+        fallos.append(f"{len(perdidas)} incidencias perdidas (p.ej. {sorted(perdidas)[:3]})")
+    areas_esperadas = sum(r["areas"] for r in resultados)
+    if len(areas) != areas_esperadas:
+        fallos.append(f"areas en BD: {len(areas)} != {areas_esperadas}")
+    return fallos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--escrituras", type=int, default=200, help="incidencias por proceso")
+    parser.add_argument("--lote", type=int, default=1, help="escrituras por transaccion")
+    parser.add_argument("--areas-cada", type=int, default=10, help="anade un area cada N escrituras (0 = nunca)")
+    parser.add_argument("--lock-file", action="store_true", help="usa el lock por archivo (fallback)")
+    parser.add_argument("--db", help="ruta de la BD (por defecto, una temporal)")
+    args = parser.parse_args()
+    args.procesos = max(1, args.procesos)
+    args.lote = max(1, args.lote)
+
+    temporal = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    else:
+        temporal = tempfile.mkdtemp(prefix="stress_incidencias_")
+        db_path = os.path.join(temporal, "incidencias.db")
+    try:
+        mapa_id, area_id, maquina_id = preparar(db_path)
+        opciones = {"escrituras": args.escrituras, "lote": args.lote, "areas_cada": args.areas_cada, "lock_file": args.lock_file}
+        inicio = time.time() + 1.0
+        tareas = [(n, db_path, mapa_id, area_id, maquina_id, opciones, inicio) for n in range(args.procesos)]
+        with multiprocessing.Pool(args.procesos) as pool:
+            resultados = pool.map(escritor, tareas)
+
+        duracion = max(r["segundos"] for r in resultados)
+        total = sum(r["escritas"] for r in resultados)
+        print(f"{args.procesos} procesos x {args.escrituras} escrituras (lote {args.lote}) en {db_path}")
+        for r in resultados:
+            ritmo = r["escritas"] / r["segundos"] if r["segundos"] else 0.0
+            print(
+                f"  p{r['proceso']}: {r['escritas']} incidencias, {r['areas']} areas, "
+                f"{r['segundos']:.2f} s ({ritmo:.0f}/s), bloqueos {len(r['bloqueos'])}, errores {len(r['errores'])}"
+            )
+        print(f"Total: {total} incidencias en {duracion:.2f} s ({total / duracion if duracion else 0:.0f}/s)")
+
+        fallos = comprobar(db_path, mapa_id, resultados, args)
+        if fallos:
+            print("\nFALLOS:")
+            for fallo in fallos[:20]:
+                print(f"  {fallo}")
+            sys.exit(1)
+        print("OK: sin filas perdidas ni duplicadas, sin bloqueos y versions coherentes")
+    finally:
+        if temporal:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
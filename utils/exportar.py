@@ -0,0 +1,98 @@
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# Filas entre avisos de progreso.
+PASO_PROGRESO = 2000
+_INVALIDOS_HOJA = re.compile(r"[\[\]:*?/\\]")
+
+
+def nombre_hoja(nombre, usados=()):
+    """Nombre valido y unico para una hoja de Excel (max. 31 caracteres)."""
+    base = _INVALIDOS_HOJA.sub("_", str(nombre or "Hoja")).strip("'") or "Hoja"
+    base = base[:31]
+    candidato = base
+    n = 2
+    while candidato in usados:
+        sufijo = f"_{n}"
+        candidato = base[:31 - len(sufijo)] + sufijo
+        n += 1
+    return candidato
+
+
+def _celda(valor):
+    """Valor de pandas/numpy -> tipo que entiende openpyxl (None para vacios)."""
+    if valor is None:
+        return None
+    if isinstance(valor, float):
+        return None if math.isnan(valor) else valor
+    if isinstance(valor, pd.Timestamp):
+        return None if pd.isna(valor) else valor.to_pydatetime()
+    if valor is pd.NaT:
+        return None
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+        if isinstance(valor, float) and math.isnan(valor):
+            return None
+        return valor
+    return valor
+
+
+def exportar(hojas, archivo, progreso=None):
+    """
+    Escribe [(nombre, DataFrame)] en `archivo`.
+
+    - .xlsx: una hoja por DataFrame con openpyxl en modo write_only (memoria
+      constante: las filas se vuelcan al disco segun se escriben).
+    - .csv: ruta rapida con to_csv (';' y UTF-8 con BOM para Excel). Con
+      varias hojas se escribe un CSV por hoja: <archivo>_<hoja>.csv.
+
+    `progreso(hechas, total)` se llama cada PASO_PROGRESO filas (desde el
+    hilo que exporta). Devuelve la lista de archivos escritos.
+    """
+    total = sum(len(df) for _nombre, df in hojas)
+    hechas = 0
+    if progreso:
+        progreso(0, total)
+
+    if archivo.lower().endswith(".csv"):
+        escritos = []
+        base, ext = os.path.splitext(archivo)
+        usados = set()
+        for nombre, df in hojas:
+            ruta = archivo
+            if len(hojas) > 1:
+                hoja = nombre_hoja(nombre, usados)
+                usados.add(hoja)
+                ruta = f"{base}_{hoja.replace(' ', '_')}{ext}"
+            df.to_csv(ruta, index=False, sep=";", encoding="utf-8-sig")
+            escritos.append(ruta)
+            hechas += len(df)
+            if progreso:
+                progreso(hechas, total)
+        return escritos
+
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    usados = set()
+    for nombre, df in hojas:
+        hoja = nombre_hoja(nombre, usados)
+        usados.add(hoja)
+        ws = wb.create_sheet(title=hoja)
+        ws.append([str(c) for c in df.columns])
+        for fila in df.itertuples(index=False, name=None):
+            ws.append([_celda(v) for v in fila])
+            hechas += 1
+            if progreso and hechas % PASO_PROGRESO == 0:
+                progreso(hechas, total)
+    if not usados:
+        wb.create_sheet(title="Hoja")
+    wb.save(archivo)
+    if progreso:
+        progreso(total, total)
+    return [archivo]
@@ -0,0 +1,50 @@
+from utils.sorting import registrar_filas
+
+
+class KeyedTreeView:
+    """
+    Vista de una lista de registros con `id` sobre un Treeview normal.
+
+    update() recibe las filas deseadas (iid, valores, tags) en orden y solo
+    toca lo que cambio respecto al ultimo pintado: borra las que sobran,
+    inserta las nuevas, actualiza las modificadas y reordena con una sola
+    llamada. Conserva la seleccion y la posicion del scroll.
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._filas = {}
+
+    def update(self, filas):
+        tree = self.tree
+        seleccion = tree.selection()
+        arriba = tree.yview()[0]
+        existentes = set(tree.get_children(""))
+
+        nuevas = {}
+        orden = []
+        for iid, values, tags in filas:
+            iid = str(iid)
+            if iid in nuevas:
+                continue
+            nuevas[iid] = (tuple(values), tuple(tags))
+            orden.append(iid)
+
+        sobrantes = [iid for iid in existentes if iid not in nuevas]
+        if sobrantes:
+            tree.delete(*sobrantes)
+        for iid in orden:
+            values, tags = nuevas[iid]
+            if iid not in existentes:
+                tree.insert("", "end", iid=iid, values=values, tags=tags)
+            elif self._filas.get(iid) != (values, tags):
+                tree.item(iid, values=values, tags=tags)
+        if list(tree.get_children("")) != orden:
+            tree.set_children("", *orden)
+        self._filas = nuevas
+        registrar_filas(tree, [(iid, nuevas[iid][0]) for iid in orden])
+
+        conservada = [iid for iid in seleccion if iid in nuevas]
+        if len(conservada) != len(seleccion):
+            tree.selection_set(conservada)
+        tree.yview_moveto(arriba)
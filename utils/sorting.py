@@ -0,0 +1,116 @@
+import re
+import unicodedata
+from datetime import datetime
+
+import numpy as np
+
+
+_FECHA_RE = re.compile(
+    r"^(\d{1,2})/(\d{1,2})/(\d{4})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$"
+)
+_FECHA_ISO_RE = re.compile(
+    r"^(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?"
+)
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor != valor:
+        return ""
+    texto = str(valor).strip()
+    return "" if texto.lower() in ("nan", "nat", "none") else texto
+
+
+def _numero(texto):
+    try:
+        return float(texto.replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _fecha(texto):
+    m = _FECHA_RE.match(texto)
+    if m:
+        d, mes, y, hh, mm, ss = m.groups()
+    else:
+        m = _FECHA_ISO_RE.match(texto)
+        if not m:
+            return None
+        y, mes, d, hh, mm, ss = m.groups()
+    try:
+        return datetime(int(y), int(mes), int(d), int(hh or 0), int(mm or 0), int(ss or 0))
+    except ValueError:
+        return None
+
+
+def sin_acentos(texto):
+    t = unicodedata.normalize("NFD", texto).casefold()
+    return "".join(ch for ch in t if unicodedata.category(ch) != "Mn")
+
+
+def claves_orden(valores):
+    """
+    Claves de orden de una columna segun su tipo: si todos los valores no
+    vacios son numeros se ordena numericamente, si son fechas (dd/mm/yyyy
+    [hh:mm[:ss]] o ISO) cronologicamente y si no como texto sin acentos ni
+    mayusculas. Los vacios van siempre al final.
+    """
+    textos = [_texto(v) for v in valores]
+    llenos = [t for t in textos if t]
+    convertir = sin_acentos
+    for candidato in (_numero, _fecha):
+        if llenos and all(candidato(t) is not None for t in llenos):
+            convertir = candidato
+            break
+    return [(1, 0) if not t else (0, convertir(t)) for t in textos]
+
+
+def permutacion(valores):
+    """
+    (posiciones de `valores` en orden ascendente (estable), cuantas de ellas
+    tienen valor): los vacios quedan siempre al final de la permutacion.
+    """
+    claves = claves_orden(valores)
+    perm = np.array(sorted(range(len(claves)), key=claves.__getitem__), dtype=np.intp)
+    return perm, sum(1 for clave in claves if clave[0] == 0)
+
+
+class OrdenCache:
+    """
+    Permutaciones ascendentes ya calculadas por columna. El orden
+    descendente invierte solo la parte con valor de la misma permutacion
+    (los vacios siguen al final), asi que cambiar de sentido no vuelve a
+    ordenar. Hay que llamar a clear() al cambiar los datos.
+    """
+
+    def __init__(self):
+        self._perms = {}
+
+    def get(self, col, valores):
+        """
+        (permutacion, llenos) de la columna; `valores` es una funcion que
+        devuelve la columna (solo se llama si no esta en cache).
+        """
+        perm = self._perms.get(col)
+        if perm is None:
+            perm = self._perms[col] = permutacion(valores())
+        return perm
+
+    def orden(self, col, valores, reverse=False):
+        perm, llenos = self.get(col, valores)
+        if not reverse:
+            return perm
+        return np.concatenate((perm[:llenos][::-1], perm[llenos:]))
+
+    def clear(self):
+        self._perms.clear()
+
+
+def registrar_filas(tree, filas):
+    """
+    Guarda en un Treeview normal las filas de datos (iid, valores) con las
+    que se lleno, para que sort_column ordene sin leer las celdas.
+    """
+    tree.filas = [(str(iid), values) for iid, values in filas]
+    tree.ordenes = OrdenCache()
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+from utils.sorting import OrdenCache
+
+
+class VirtualTable:
+    """
+    Treeview virtual: el DataFrame es el almacen de datos y en el Treeview
+    solo existen las filas visibles (mas un pequeno margen). El scroll, la
+    rueda y las flechas mueven la ventana; el coste de pintar es
+    O(filas visibles) sea cual sea el tamano del DataFrame.
+
+    Los iid de las filas son la posicion de la fila en el DataFrame, de modo
+    que `tree.selection()` + `tree.item(iid, "values")` siguen funcionando.
+    """
+
+    BUFFER = 2
+    ROW_HEIGHT = 20
+
+    def __init__(self, tree, scrollbar):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.df = pd.DataFrame()
+        self._values = np.empty((0, 0), dtype=object)
+        self._tags = np.empty(0, dtype=object)
+        self.order = np.arange(0)
+        self.ordenes = OrdenCache()
+        self.offset = 0
+        self._sel_idx = None
+        self._row_height = None
+        self._header = None
+        self._pintando = False
+        scrollbar.configure(command=self._on_scrollbar)
+        tree.configure(yscrollcommand=self._on_tree_yview)
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(seq, self._on_wheel)
+        tree.bind("<Configure>", lambda _e: self._render(), add="+")
+        tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        for seq, delta in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-page"), ("<Next>", "page")):
+            tree.bind(seq, lambda _e, d=delta: self._mover_seleccion(d))
+        tree.bind("<Home>", lambda _e: self._seleccionar(0))
+        tree.bind("<End>", lambda _e: self._seleccionar(len(self.order) - 1))
+
+    # ------------------------------------------------------------- datos
+    def __len__(self):
+        return len(self.order)
+
+    def set_data(self, df, tags=None):
+        """Nuevo DataFrame; `tags` es un array (una etiqueta por fila) ya calculado."""
+        self.df = df
+        self._values = df.to_numpy(dtype=object)
+        if tags is None:
+            tags = np.full(len(df), "", dtype=object)
+        self._tags = np.asarray(tags, dtype=object)
+        self.order = np.arange(len(df))
+        self.ordenes.clear()
+        self.offset = 0
+        self._sel_idx = None
+        self._render()
+
+    def set_order(self, order):
+        """Permutacion de posiciones del DataFrame (p.ej. al ordenar por columna)."""
+        seleccion = self.order[self._sel_idx] if self._sel_idx is not None else None
+        self.order = np.asarray(order)
+        self._sel_idx = None
+        if seleccion is not None:
+            encontrados = np.flatnonzero(self.order == seleccion)
+            if len(encontrados):
+                self._sel_idx = int(encontrados[0])
+        self.offset = 0
+        self._render()
+
+    def ordenar(self, col, reverse=False):
+        """Ordena la vista por `col` (permutacion en cache por columna)."""
+        self.set_order(self.ordenes.orden(col, lambda: self._values[:, self.df.columns.get_loc(col)], reverse))
+
+    def view_df(self):
+        """DataFrame en el orden mostrado."""
+        return self.df.iloc[self.order]
+
+    def view_values(self):
+        """Filas (listas) en el orden mostrado."""
+        return self._values[self.order].tolist()
+
+    # ------------------------------------------------------------- pintar
+    def _visible_rows(self):
+        height = self.tree.winfo_height()
+        row_h = self._row_height or self.ROW_HEIGHT
+        header = self._header if self._header is not None else row_h
+        if height <= 1:
+            return int(self.tree.cget("height") or 10)
+        return max(1, (height - header) // row_h)
+
+    def _medir(self, iid):
+        bbox = self.tree.bbox(iid)
+        if bbox:
+            self._header = bbox[1]
+            self._row_height = bbox[3]
+
+    def _render(self):
+        if self._pintando:
+            return
+        self._pintando = True
+        try:
+            self._pintar()
+        finally:
+            self._pintando = False
+
+    def _pintar(self):
+        tree = self.tree
+        total = len(self.order)
+        visibles = self._visible_rows()
+        self.offset = max(0, min(self.offset, total - visibles))
+        tree.delete(*tree.get_children())
+        for pos in self.order[self.offset:self.offset + visibles + self.BUFFER]:
+            tree.insert("", "end", iid=str(pos), values=self._values[pos].tolist(), tags=(self._tags[pos],))
+        tree.yview_moveto(0)
+        hijos = tree.get_children()
+        if hijos and self._row_height is None:
+            tree.update_idletasks()
+            self._medir(hijos[0])
+        if self._sel_idx is not None and self.offset <= self._sel_idx < self.offset + len(hijos):
+            iid = str(self.order[self._sel_idx])
+            tree.selection_set(iid)
+            tree.focus(iid)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + visibles) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, offset):
+        offset = int(offset)
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    # ------------------------------------------------------------- eventos
+    def _on_tree_yview(self, *_args):
+        # El Treeview solo contiene la ventana; su scroll propio no se usa.
+        pass
+
+    def _on_scrollbar(self, *args):
+        total = len(self.order)
+        if not total:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * total)
+        elif args[0] == "scroll":
+            paso = int(args[1])
+            if args[2] == "pages":
+                paso *= self._visible_rows()
+            self.scroll_to(self.offset + paso)
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_to(self.offset - 3)
+        else:
+            self.scroll_to(self.offset + 3)
+        return "break"
+
+    def _on_select(self, _event=None):
+        sel = self.tree.selection()
+        if sel:
+            self._sel_idx = self.offset + self.tree.index(sel[0])
+
+    def _seleccionar(self, idx):
+        total = len(self.order)
+        if not total:
+            return "break"
+        idx = max(0, min(total - 1, idx))
+        visibles = self._visible_rows()
+        if idx < self.offset:
+            self.offset = idx
+        elif idx >= self.offset + visibles:
+            self.offset = idx - visibles + 1
+        self._sel_idx = idx
+        self._render()
+        return "break"
+
+    def _mover_seleccion(self, delta):
+        if delta == "page":
+            delta = self._visible_rows()
+        elif delta == "-page":
+            delta = -self._visible_rows()
+        actual = self._sel_idx if self._sel_idx is not None else self.offset - 1
+        return self._seleccionar(actual + delta)